@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Kontrola przyjmowania żądań (admission control) dla kosztownych stron.
+
+Każdy blueprint (lub pojedynczy endpoint) wpisany w ADMISSION.LIMITS ma własny limit
+jednocześnie obsługiwanych żądań i budżet czasu oczekiwania w kolejce. Limit jest wspólny dla
+wszystkich workerów - synchroniczny worker gunicorna obsługuje jedno żądanie naraz, więc
+limit w procesie nigdy by nie zadziałał. Zajęte miejsca (pid procesu na miejsce) trzymane są
+w pliku mapowanym do pamięci (ADMISSION.SLOTS_PATH), zmienianym pod blokadą pliku (fcntl);
+miejsca zajęte przez proces, który zakończył się bez ich zwolnienia, są odzyskiwane.
+Czas w kolejce to czas od przyjęcia żądania przez serwer proxy (nagłówek ADMISSION.HEADER,
+np. X-Request-Start ustawiany przez nginx) plus czas oczekiwania na wolne miejsce w limicie.
+Gdy budżet zostanie przekroczony, żądanie odrzucane jest od razu tanią odpowiedzią 503
+z Retry-After - zanim dotknie bazy danych - dzięki czemu przy dużym ruchu (np. Wszystkich
+Świętych) kosztowne strony nie zajmują wszystkich workerów, a tanie strony działają dalej.
+Liczniki przyjętych i odrzuconych żądań (bieżącego procesu) dostępne są pod /admission/stats.
+"""
+# importy modułów py
+import fcntl
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from flask import request, g, Response, Blueprint, jsonify, abort
+
+# importy nasze
+from config import ADMISSION
+
+pages_admission = Blueprint('pages_admission', __name__)
+
+
+def process_alive(pid):
+    """Czy proces o danym pid nadal działa."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedSlots:
+    """Miejsca w limitach wszystkich klas - pid zajmującego procesu albo 0, w pliku mmap."""
+
+    def __init__(self, path, count):
+        self.path = path
+        self.count = count
+        self.file = None
+        self.pids = None
+        self.pid = None
+        # flock wyklucza procesy, wątki jednego procesu dzielą deskryptor - osobna blokada
+        self.thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        """Widok numpy na miejsca pod blokadą pliku - plik otwierany osobno w każdym procesie."""
+        with self.thread_lock:
+            if self.pid != os.getpid():
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                self.file = os.fdopen(fd, 'r+b')
+                if os.fstat(fd).st_size < self.count * 8:
+                    os.ftruncate(fd, self.count * 8)
+                self.pids = np.frombuffer(mmap.mmap(fd, self.count * 8), dtype=np.int64,
+                                          count=self.count)
+                self.pid = os.getpid()
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+            try:
+                yield self.pids
+            finally:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+
+    def acquire(self, start, stop):
+        """Zajęcie wolnego miejsca z zakresu [start, stop) - True, gdy się udało."""
+        with self._locked() as pids:
+            for i in range(start, stop):
+                if pids[i] == 0 or not process_alive(int(pids[i])):
+                    pids[i] = os.getpid()
+                    return True
+        return False
+
+    def release(self, start, stop):
+        """Zwolnienie jednego miejsca zajętego przez bieżący proces."""
+        with self._locked() as pids:
+            owned = np.flatnonzero(pids[start:stop] == os.getpid())
+            if len(owned):
+                pids[start + owned[0]] = 0
+
+    def in_use(self, start, stop):
+        """Liczba zajętych miejsc z zakresu - wszystkie działające procesy."""
+        with self._locked() as pids:
+            return sum(1 for pid in pids[start:stop] if pid and process_alive(int(pid)))
+
+
+class AdmissionClass:
+    """Limit współbieżności jednej klasy endpointów wraz z licznikami bieżącego procesu."""
+
+    def __init__(self, name, concurrency, queue_budget, slots, start):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_budget = queue_budget
+        self.slots = slots
+        self.start = start
+        self.stop = start + concurrency
+        self.lock = threading.Lock()
+        self.stats = {'admitted': 0, 'shed': 0, 'in_flight': 0,
+                      'queue_time_total': 0.0, 'queue_time_max': 0.0}
+
+    def acquire(self, timeout):
+        """Oczekiwanie na wolne miejsce najwyżej timeout sekund."""
+        deadline = time.monotonic() + timeout
+        while not self.slots.acquire(self.start, self.stop):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(ADMISSION.POLL_INTERVAL, remaining))
+        return True
+
+    def admit(self, upstream_wait):
+        """Próba zajęcia miejsca w limicie - True, gdy zmieściła się w budżecie kolejki."""
+        started = time.monotonic()
+        remaining = self.queue_budget - upstream_wait
+        admitted = remaining > 0 and self.acquire(remaining)
+        queue_time = upstream_wait + time.monotonic() - started
+        with self.lock:
+            if admitted:
+                self.stats['admitted'] += 1
+                self.stats['in_flight'] += 1
+                self.stats['queue_time_total'] += queue_time
+                self.stats['queue_time_max'] = max(self.stats['queue_time_max'], queue_time)
+            else:
+                self.stats['shed'] += 1
+        return admitted
+
+    def release(self):
+        try:
+            self.slots.release(self.start, self.stop)
+        finally:
+            with self.lock:
+                self.stats['in_flight'] -= 1
+
+
+def admission_classes(limits):
+    """Klasy z kolejnymi zakresami miejsc we wspólnym pliku (kolejność nazw - stała)."""
+    slots = SharedSlots(ADMISSION.SLOTS_PATH,
+                        sum(concurrency for concurrency, _ in limits.values()))
+    classes = {}
+    start = 0
+    for name in sorted(limits):
+        concurrency, queue_budget = limits[name]
+        classes[name] = AdmissionClass(name, concurrency, queue_budget, slots, start)
+        start += concurrency
+    return classes
+
+
+classes = admission_classes(ADMISSION.LIMITS)
+
+
+def upstream_wait():
+    """Czas od przyjęcia żądania przez proxy (sekundy), 0 gdy brak nagłówka."""
+    header = request.headers.get(ADMISSION.HEADER, '')
+    try:
+        started = float(header[2:] if header.startswith('t=') else header)
+    except ValueError:
+        return 0.0
+    # nginx podaje sekundy z ułamkiem, inne serwery - milisekundy lub mikrosekundy
+    while started > 1e11:
+        started /= 1000
+    return max(0.0, time.time() - started)
+
+
+def service_unavailable():
+    """Tania odpowiedź 503, bez renderowania szablonów."""
+    return Response('Serwer jest przeciążony, spróbuj ponownie za chwilę.', 503,
+                    {'Retry-After': str(ADMISSION.RETRY_AFTER),
+                     'Content-Type': 'text/plain; charset=utf-8'})
+
+
+def admit_request():
+    """Hook before_request - przyjęcie żądania albo szybkie odrzucenie."""
+    admission = classes.get(request.endpoint) or classes.get(request.blueprint)
+    if admission is None:
+        return None
+    if not admission.admit(upstream_wait()):
+        return service_unavailable()
+    g.admission = admission
+    return None
+
+
+def release_request(error):
+    """Hook teardown_request - zwolnienie miejsca w limicie."""
+    admission = g.pop('admission', None)
+    if admission is not None:
+        admission.release()
+
+
+@pages_admission.route('/admission/stats')
+def admission_stats():
+    """Liczniki bieżącego procesu dla systemu monitoringu (tylko z ADMISSION.STATS_ALLOWED)."""
+    if request.remote_addr not in ADMISSION.STATS_ALLOWED:
+        abort(404)
+    stats = {}
+    for name, admission in classes.items():
+        with admission.lock:
+            stats[name] = dict(admission.stats, concurrency=admission.concurrency,
+                               queue_budget=admission.queue_budget)
+        stats[name]['in_flight_all'] = admission.slots.in_use(admission.start, admission.stop)
+    return jsonify(pid=os.getpid(), classes=stats)
+
+
+def init_admission(app):
+    """Rejestracja kontroli przyjmowania żądań."""
+    app.before_request(admit_request)
+    app.teardown_request(release_request)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Codzienne powiadomienia o rocznicach śmierci dla obserwujących groby (Family).
+
+Uruchamiane raz dziennie (np. cron): python3 anniversary_job.py
+Jedno zapytanie po indeksie Grave.death_mmdd czyta pary (użytkownik, grób) dzisiejszych rocznic,
+posortowane po użytkowniku, do tablic numpy - każdy użytkownik dostaje jeden e-mail zbiorczy.
+Pary dzielone są na porcje po JOBS.ANNIVERSARY_BATCH użytkowników; dla porcji pobierane są
+po kluczu głównym adresy i dane grobów, wiadomości wysyłane są przez jedno połączenie SMTP,
+a po każdej porcji zapisywany jest punkt wznowienia (JobRun), więc ponowne uruchomienie tego
+samego dnia nie wysyła niczego dwa razy. Przekroczenie JOBS.ANNIVERSARY_TIME_BUDGET przerywa
+przebieg - kolejne uruchomienie, także następnego dnia, najpierw dokończy wysyłkę z dni
+niedokończonych (nie starszych niż JOBS.ANNIVERSARY_MAX_DELAY dni).
+"""
+# importy modułów py
+import calendar
+import datetime
+import time
+import numpy as np
+
+# importy nasze
+from config import JOBS
+from data_jobs import start_job, checkpoint, finish_job, unfinished_jobs
+from db_models import db, User, Grave, Family
+from mail_sending import file_msg, msg_batch
+
+JOB_NAME = 'anniversary_digest'
+
+
+def backfill_death_mmdd(batch_size=JOBS.ANNIVERSARY_BATCH):
+    """Uzupełnienie death_mmdd dla starszych grobów (migrate_grave_death_mmdd.py)."""
+    while True:
+        rows = db.session.query(Grave.id, Grave.day_of_death)\
+            .filter(Grave.day_of_death.isnot(None), Grave.death_mmdd.is_(None))\
+            .limit(batch_size).all()
+        if not rows:
+            return
+        db.session.bulk_update_mappings(Grave, [{'id': grave_id,
+                                                 'death_mmdd': day.month * 100 + day.day}
+                                                for grave_id, day in rows])
+        db.session.commit()
+
+
+def anniversary_days(day):
+    """Wartości death_mmdd obchodzone danego dnia (29 lutego w latach nieprzestępnych - 28)."""
+    days = [day.month * 100 + day.day]
+    if day.month == 2 and day.day == 28 and not calendar.isleap(day.year):
+        days.append(229)
+    return days
+
+
+def follower_pairs(day, after_user_id):
+    """(id użytkowników, id grobów) rocznic dnia - jedno zapytanie, posortowane po użytkowniku."""
+    query = db.session.query(Family.user_id, Family.grave_id)\
+        .join(Grave, Grave.id == Family.grave_id)\
+        .join(User, User.id == Family.user_id)\
+        .filter(Grave.death_mmdd.in_(anniversary_days(day)),
+                User.active_user.is_(True),
+                User.id > after_user_id)\
+        .order_by(Family.user_id, Family.grave_id)
+    pairs = np.array(query.all(), dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def follower_chunks(day, after_user_id, batch_size=JOBS.ANNIVERSARY_BATCH):
+    """Kolejne porcje batch_size użytkowników: [(id, e-mail, [(imię, nazwisko, data), ...])]."""
+    user_ids, grave_ids = follower_pairs(day, after_user_id)
+    # początki wierszy kolejnych użytkowników w posortowanych tablicach
+    users, starts = np.unique(user_ids, return_index=True)
+    starts = np.append(starts, len(user_ids))
+    for first in range(0, len(users), batch_size):
+        chunk_users = users[first:first + batch_size]
+        chunk_starts = starts[first:first + len(chunk_users) + 1]
+        chunk_graves = grave_ids[chunk_starts[0]:chunk_starts[-1]]
+        emails = dict(db.session.query(User.id, User.email)
+                      .filter(User.id.in_(chunk_users.tolist())))
+        graves = {row[0]: row[1:] for row in
+                  db.session.query(Grave.id, Grave.name, Grave.last_name, Grave.day_of_death)
+                  .filter(Grave.id.in_(np.unique(chunk_graves).tolist()))}
+        # użytkownicy i groby usunięci w trakcie wysyłki - bez adresu lub bez rocznic
+        yield [(user_id, emails.get(user_id),
+                [graves[grave_id] for grave_id in grave_ids[start:end].tolist()
+                 if grave_id in graves])
+               for user_id, start, end in zip(chunk_users.tolist(), chunk_starts[:-1].tolist(),
+                                              chunk_starts[1:].tolist())]
+
+
+def digest(email, graves, day):
+    """Jeden e-mail z listą wszystkich rocznic danego użytkownika."""
+    lines = ['- {} {} ({}. rocznica)'.format(name, last_name, day.year - day_of_death.year)
+             for name, last_name, day_of_death in graves]
+    return file_msg('Rocznice na cmentarzu', email, 'anniversary_digest', '\n'.join(lines))
+
+
+def send_day(job, deadline):
+    """Wysyłka rocznic dnia przebiegu od punktu wznowienia; zwraca (wysłane, czy_dokończono)."""
+    sent = 0
+    for chunk in follower_chunks(job.day, job.cursor):
+        batch = [digest(email, graves, job.day) for _, email, graves in chunk
+                 if email and graves]
+        msg_batch(batch)
+        checkpoint(job, chunk[-1][0], len(batch))
+        sent += len(batch)
+        if time.monotonic() > deadline:
+            return sent, False
+    finish_job(job)
+    return sent, True
+
+
+def run(day=None):
+    """Przebieg zadania - najpierw niedokończone dni, potem dzisiejszy; zwraca liczbę wiadomości."""
+    day = day or datetime.date.today()
+    deadline = time.monotonic() + JOBS.ANNIVERSARY_TIME_BUDGET
+    backfill_death_mmdd()
+    jobs = []
+    for job in unfinished_jobs(JOB_NAME, day):
+        if (day - job.day).days > JOBS.ANNIVERSARY_MAX_DELAY:
+            print('pominięto niedokończoną wysyłkę z {} - zbyt stara'.format(job.day))
+            finish_job(job)
+        else:
+            jobs.append(job)
+    job = start_job(JOB_NAME, day)
+    if job is not None:
+        jobs.append(job)
+    sent = 0
+    for job in jobs:
+        job_sent, finished = send_day(job, deadline)
+        sent += job_sent
+        if not finished:
+            print('przekroczono budżet czasu - wysyłka zostanie dokończona przy kolejnym '
+                  'uruchomieniu')
+            break
+    return sent
+
+
+if __name__ == '__main__':
+    from main import app
+    app.app_context().push()
+    print('wysłano {} powiadomień o rocznicach'.format(run()))
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Asynchroniczny serwer (asyncio + aiohttp) dla endpointów ograniczonych czekaniem na I/O.
+
+Flask 0.12 nie obsługuje widoków async, dlatego strony HTML zostają w main.py bez zmian,
+a endpointy JSON i wysyłka poczty obsługiwane są przez osobny proces:
+    python3 async_server.py   - nasłuchuje na ASYNC.HOST:ASYNC.PORT
+Serwer proxy kieruje do niego /ajax_email, /ajax/autocomplete i /mail/send, np. w nginx:
+    location ~ ^/(ajax_email|ajax/) { proxy_pass http://127.0.0.1:8081; }
+Jeden proces obsługuje setki jednocześnie czekających połączeń - oczekiwanie na bazę
+(aiosqlite / asyncpg, zależnie od DB.PATH) i serwer SMTP (aiosmtplib) nie blokuje wątku.
+Gdy ASYNC.MAIL_URL jest ustawiony, mail_sending.common_msg przekazuje wiadomość do kolejki
+tego serwera zamiast czekać na SMTP w workerze Flaska. Niewysłane wiadomości ponawiane są
+ASYNC.MAIL_RETRIES razy, a potem - oraz przy zatrzymaniu serwera - zapisywane w katalogu
+ASYNC.MAIL_FAILED_PATH i wczytywane z powrotem do kolejki przy następnym starcie.
+Limity żądań korzystają z magazynu rate_limit.store w puli wątków (nie blokują pętli zdarzeń);
+wspólne z workerami Flaska są tylko przy RATE_LIMIT.STORE = 'sqlite'.
+Wymaga pakietów z requirements_async.txt. Porównanie z workerem synchronicznym: bench_async.py
+"""
+# importy modułów py
+import asyncio
+import email
+import email.policy
+import os
+import re
+import time
+import uuid
+from email.message import EmailMessage
+import aiohttp.web
+import aiosmtplib
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+
+# importy nasze
+from config import DB, APP, EMAIL, ASYNC, CEMETERY, NAMES, RATE_LIMIT
+from name_index import PrefixIndex, FIELDS
+from rate_limit import store as rate_limit_store, too_many_requests
+
+
+class AsyncDatabase:
+    """Minimalny dostęp do bazy: SQLite przez aiosqlite, PostgreSQL przez pulę asyncpg.
+
+    Zapytania zapisywane są z parametrami "?" - dla asyncpg zamieniane na $1, $2, ...
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.sqlite = url.startswith('sqlite')
+        self.connection = None
+
+    async def connect(self):
+        if self.sqlite:
+            import aiosqlite
+            self.connection = await aiosqlite.connect(self.url.split(':///', 1)[1])
+        else:
+            import asyncpg
+            # postgresql+psycopg2://... -> postgresql://...
+            self.connection = await asyncpg.create_pool(re.sub(r'\+\w+', '', self.url, count=1),
+                                                        max_size=ASYNC.DB_POOL_SIZE)
+
+    async def fetch_all(self, sql, *params):
+        if self.sqlite:
+            async with self.connection.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+        counter = iter(range(1, len(params) + 1))
+        sql = re.sub(r'\?', lambda match: '${}'.format(next(counter)), sql)
+        return await self.connection.fetch(sql, *params)
+
+    async def fetch_one(self, sql, *params):
+        rows = await self.fetch_all(sql, *params)
+        return rows[0] if rows else None
+
+    async def close(self):
+        await self.connection.close()
+
+
+def flask_session(request):
+    """Odczyt podpisanego ciasteczka sesji Flaska (wybrany cmentarz)."""
+    serializer = SecureCookieSessionInterface().get_signing_serializer(session_app)
+    cookie = request.cookies.get(session_app.config['SESSION_COOKIE_NAME'], '')
+    try:
+        return serializer.loads(cookie)
+    except Exception:
+        return {}
+
+
+def client_address(request):
+    """Adres klienta - jak ProxyFix w main.py, z X-Forwarded-For od APP.PROXY_COUNT proxy."""
+    forwarded = [address.strip() for address in
+                 request.headers.get('X-Forwarded-For', '').split(',') if address.strip()]
+    if APP.PROXY_COUNT and len(forwarded) >= APP.PROXY_COUNT:
+        return forwarded[-APP.PROXY_COUNT]
+    return request.remote
+
+
+async def rate_limited(request, endpoint, account):
+    """Te same limity co w before_request Flaska (rate_limit.check_rate_limit)."""
+    limit = RATE_LIMIT.LIMITS.get(endpoint)
+    if limit is None:
+        return None
+    capacity, per_minute = limit
+    keys = ['{}|ip|{}'.format(endpoint, client_address(request))]
+    if account:
+        keys.append('{}|account|{}'.format(endpoint, account.strip().lower()))
+    loop = asyncio.get_event_loop()
+    for key in keys:
+        # magazyn SQLite czeka na blokadę pliku - poza pętlą zdarzeń
+        allowed, retry_after = await loop.run_in_executor(None, rate_limit_store.take, key,
+                                                          capacity, per_minute / 60)
+        if not allowed:
+            flask_response = too_many_requests(retry_after)
+            return aiohttp.web.Response(status=429, text=flask_response.get_data(as_text=True),
+                                        headers={'Retry-After':
+                                                 flask_response.headers['Retry-After']})
+    return None
+
+
+async def ajax_email(request):
+    """Odpowiednik pages_ajax.ajax_email - 'reserved' albo 'none'."""
+    address = (await request.post()).get('email')
+    limited = await rate_limited(request, 'pages_ajax.ajax_email', address)
+    if limited is not None:
+        return limited
+    row = await request.app['db'].fetch_one('SELECT 1 FROM "user" WHERE email = ?', address)
+    return aiohttp.web.Response(text='reserved' if row else 'none')
+
+
+async def ajax_autocomplete(request):
+    """Odpowiednik pages_ajax.ajax_autocomplete - podpowiedzi z indeksu w pamięci."""
+    field = request.query.get('field', 'last_name')
+    if field not in FIELDS:
+        return aiohttp.web.json_response([])
+    try:
+        cemetery_id = int(request.query['cemetery'])
+    except (KeyError, ValueError):
+        cemetery_id = flask_session(request).get('cemetery_id', CEMETERY.DEFAULT_ID)
+    index = request.app['names'].get((cemetery_id, field))
+    matches = index.lookup(request.query.get('q', ''), NAMES.LIMIT) if index else []
+    return aiohttp.web.json_response([{'value': value, 'count': count}
+                                      for value, count in matches])
+
+
+async def mail_send(request):
+    """Przyjęcie wiadomości do kolejki (tylko z ASYNC.MAIL_ALLOWED) - odpowiedź 202 od razu."""
+    if request.remote not in ASYNC.MAIL_ALLOWED:
+        raise aiohttp.web.HTTPNotFound()
+    data = await request.json()
+    with open('{}{}'.format(EMAIL.FILES_PATH, os.path.basename(data['filename'])), 'r') as file:
+        body = file.read().format(*data.get('args', []))
+    message = EmailMessage()
+    message['Subject'] = data['title']
+    message['From'] = EMAIL.DEFAULT_SENDER
+    message['To'] = data['send_to']
+    message.set_content(body)
+    await request.app['outbox'].put(message)
+    return aiohttp.web.Response(status=202, text='queued')
+
+
+def save_failed(messages):
+    """Zapis niewysłanych wiadomości do ASYNC.MAIL_FAILED_PATH (jeden plik .eml na wiadomość)."""
+    os.makedirs(ASYNC.MAIL_FAILED_PATH, exist_ok=True)
+    for position, message in enumerate(messages):
+        # nazwy rosnące w kolejności wysyłki - load_failed czyta je posortowane
+        name = '{:013d}-{:05d}-{}.eml'.format(int(time.time() * 1000), position,
+                                              uuid.uuid4().hex[:8])
+        with open(os.path.join(ASYNC.MAIL_FAILED_PATH, name), 'wb') as file:
+            file.write(message.as_bytes())
+
+
+def load_failed():
+    """Wiadomości zapisane przez save_failed - pliki są usuwane po wczytaniu."""
+    if not os.path.isdir(ASYNC.MAIL_FAILED_PATH):
+        return []
+    messages = []
+    for name in sorted(os.listdir(ASYNC.MAIL_FAILED_PATH)):
+        path = os.path.join(ASYNC.MAIL_FAILED_PATH, name)
+        with open(path, 'rb') as file:
+            messages.append(email.message_from_bytes(file.read(), policy=email.policy.default))
+        os.remove(path)
+    return messages
+
+
+async def send_batch(batch):
+    """Wysłanie partii jednym połączeniem SMTP; zwraca wiadomości niewysłane."""
+    sent = 0
+    try:
+        smtp = aiosmtplib.SMTP(hostname=EMAIL.SERVER, port=EMAIL.PORT, use_tls=EMAIL.SSL)
+        await smtp.connect()
+        await smtp.login(EMAIL.USERNAME, EMAIL.PASSWORD)
+        for message in batch:
+            await smtp.send_message(message)
+            sent += 1
+        await smtp.quit()
+    except (aiosmtplib.SMTPException, OSError) as error:
+        print('błąd wysyłania poczty: {}'.format(error))
+    return batch[sent:]
+
+
+async def send_outbox(app):
+    """Wysyłanie kolejki poczty - do ASYNC.MAIL_BATCH wiadomości na jedno połączenie SMTP.
+
+    Niewysłana reszta partii ponawiana jest po ASYNC.MAIL_RETRY_DELAY * numer próby sekund,
+    a po ASYNC.MAIL_RETRIES próbach zapisywana na dysk. Przy zatrzymaniu serwera na dysk
+    trafia także bieżąca partia i cała kolejka.
+    """
+    outbox = app['outbox']
+    loop = asyncio.get_event_loop()
+    batch = []
+    try:
+        while True:
+            batch = [await outbox.get()]
+            while not outbox.empty() and len(batch) < ASYNC.MAIL_BATCH:
+                batch.append(outbox.get_nowait())
+            for attempt in range(1, ASYNC.MAIL_RETRIES + 1):
+                batch = await send_batch(batch)
+                if not batch or attempt == ASYNC.MAIL_RETRIES:
+                    break
+                await asyncio.sleep(ASYNC.MAIL_RETRY_DELAY * attempt)
+            if batch:
+                await loop.run_in_executor(None, save_failed, batch)
+                print('zapisano {} niewysłanych wiadomości w {}'.format(
+                    len(batch), ASYNC.MAIL_FAILED_PATH))
+                batch = []
+    except asyncio.CancelledError:
+        while not outbox.empty():
+            batch.append(outbox.get_nowait())
+        save_failed(batch)
+        raise
+
+
+async def load_names(database):
+    """Indeksy podpowiedzi (name_index.PrefixIndex) dla każdego cmentarza i pola."""
+    indexes = {}
+    for field in FIELDS:
+        rows = await database.fetch_all(
+            'SELECT cemetery_id, {0}, COUNT(id) FROM grave GROUP BY cemetery_id, {0}'
+            .format(field))
+        for cemetery_id, value, count in rows:
+            indexes.setdefault((cemetery_id, field), PrefixIndex()).add(value, count)
+    for index in indexes.values():
+        index.precompute()
+    return indexes
+
+
+async def rebuild_names(app):
+    """Indeks podpowiedzi przebudowywany co NAMES.REBUILD_INTERVAL.
+
+    Błąd przebudowy (np. zablokowana baza, zerwane połączenie) nie kończy zadania - zostaje
+    poprzedni indeks, a kolejna próba następuje po NAMES.REBUILD_INTERVAL.
+    """
+    while True:
+        started = time.monotonic()
+        try:
+            app['names'] = await load_names(app['db'])
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            print('błąd przebudowy indeksu podpowiedzi: {!r}'.format(error))
+        await asyncio.sleep(max(0, NAMES.REBUILD_INTERVAL - (time.monotonic() - started)))
+
+
+async def start_background(app):
+    app['db'] = AsyncDatabase(DB.PATH)
+    await app['db'].connect()
+    app['names'] = {}
+    app['outbox'] = asyncio.Queue()
+    for message in load_failed():
+        app['outbox'].put_nowait(message)
+    if RATE_LIMIT.STORE != 'sqlite':
+        print('RATE_LIMIT.STORE = {!r} - limity serwera async są niezależne od workerów '
+              'Flaska'.format(RATE_LIMIT.STORE))
+    app['tasks'] = [asyncio.ensure_future(rebuild_names(app)),
+                    asyncio.ensure_future(send_outbox(app))]
+
+
+async def stop_background(app):
+    for task in app['tasks']:
+        task.cancel()
+    # send_outbox zapisuje przy anulowaniu niewysłaną pocztę
+    await asyncio.gather(*app['tasks'], return_exceptions=True)
+    await app['db'].close()
+
+
+def create_app():
+    """Aplikacja aiohttp z endpointami I/O."""
+    app = aiohttp.web.Application()
+    app.router.add_post('/ajax_email', ajax_email)
+    app.router.add_get('/ajax/autocomplete', ajax_autocomplete)
+    app.router.add_post('/mail/send', mail_send)
+    app.on_startup.append(start_background)
+    app.on_cleanup.append(stop_background)
+    return app
+
+
+# aplikacja Flaska wyłącznie do odczytu podpisanych ciasteczek sesji
+session_app = Flask(__name__)
+session_app.secret_key = APP.APP_KEY
+
+
+if __name__ == '__main__':
+    aiohttp.web.run_app(create_app(), host=ASYNC.HOST, port=ASYNC.PORT)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Dziennik zmian zapisywany w tle (write-behind).
+
+Widoki wywołują jedynie audit(...), które wkłada wpis do ograniczonej kolejki w pamięci procesu.
+Wątek w tle zbiera wpisy w partie (AUDIT.BATCH_SIZE lub co AUDIT.FLUSH_INTERVAL sekund) i zapisuje
+je jednym INSERT-em do tabeli AuditLog albo dopisuje do pliku JSONL (AUDIT.SINK).
+Gdy kolejka jest pełna, audit() czeka maksymalnie AUDIT.PUT_TIMEOUT sekund (backpressure),
+a po tym czasie wpis jest odrzucany i liczony w statystykach.
+Przy zamykaniu procesu flush() zatrzymuje wątek - ten zapisuje zebraną partię i resztę kolejki.
+"""
+# importy modułów py
+import atexit
+import datetime
+import fcntl
+import json
+import os
+import queue
+import threading
+from flask import has_request_context
+from flask_login import current_user
+
+# importy nasze
+from config import AUDIT
+from db_models import db, AuditLog
+
+# znacznik w kolejce - wątek zapisuje bieżącą partię i kończy pracę
+STOP = object()
+
+
+class AuditWriter:
+    """Kolejka wpisów i wątek zapisujący je partiami."""
+
+    def __init__(self):
+        self.app = None
+        self.queue = queue.Queue(maxsize=AUDIT.QUEUE_SIZE)
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0}
+
+    def init_app(self, app):
+        """Zapamiętanie aplikacji - wątek uruchamiany jest leniwie w każdym procesie workera."""
+        self.app = app
+        atexit.register(self.flush)
+
+    def _ensure_thread(self):
+        """Start wątku w bieżącym procesie (wątki nie przeżywają fork-a workerów)."""
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue = queue.Queue(maxsize=AUDIT.QUEUE_SIZE)
+                self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+
+    def _count(self, key, count=1):
+        """Statystyki zmieniane są z wątków żądań i z wątku zapisującego."""
+        with self.stats_lock:
+            self.stats[key] += count
+
+    def put(self, entry):
+        """Dodanie wpisu do kolejki z ograniczonym czasem oczekiwania."""
+        self._ensure_thread()
+        try:
+            self.queue.put(entry, timeout=AUDIT.PUT_TIMEOUT)
+            self._count('queued')
+        except queue.Full:
+            self._count('dropped')
+
+    def _run(self):
+        """Pętla wątku - zbieranie partii i zapis, do otrzymania znacznika STOP."""
+        while True:
+            entry = self.queue.get()
+            batch = [] if entry is STOP else [entry]
+            deadline = datetime.datetime.now() + datetime.timedelta(seconds=AUDIT.FLUSH_INTERVAL)
+            while entry is not STOP and len(batch) < AUDIT.BATCH_SIZE:
+                timeout = (deadline - datetime.datetime.now()).total_seconds()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if entry is not STOP:
+                    batch.append(entry)
+            if batch:
+                self._write(batch)
+            if entry is STOP:
+                self.queue.task_done()
+                return
+
+    def flush(self):
+        """Zapis wszystkiego, co czeka na zapis (przy zamykaniu procesu).
+
+        Wątek zapisujący dostaje znacznik STOP na końcu kolejki - zapisuje partię, którą
+        właśnie zbiera, oraz wszystko przed znacznikiem. Gdy wątek nie działa w tym procesie
+        albo nie zdąży w AUDIT.SHUTDOWN_TIMEOUT sekund, pozostałe wpisy zapisywane są tutaj.
+        """
+        if self.pid == os.getpid() and self.thread.is_alive():
+            try:
+                self.queue.put(STOP, timeout=AUDIT.SHUTDOWN_TIMEOUT)
+            except queue.Full:
+                pass
+            self.thread.join(AUDIT.SHUTDOWN_TIMEOUT)
+        batch = []
+        while True:
+            try:
+                entry = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is STOP:
+                self.queue.task_done()
+            else:
+                batch.append(entry)
+        if batch:
+            self._write(batch)
+
+    @staticmethod
+    def _append(data):
+        """Dopisanie partii do pliku JSONL wspólnego dla workerów.
+
+        Cała partia zapisywana jest pod blokadą pliku na deskryptorze O_APPEND - linie z różnych
+        procesów nie przeplatają się ani nie są przerywane w połowie.
+        """
+        fd = os.open(AUDIT.JSONL_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+
+    def _write(self, batch):
+        """Zapis partii do bazy lub pliku JSONL."""
+        try:
+            if AUDIT.SINK == 'jsonl':
+                self._append(''.join(
+                    json.dumps(dict(entry, created_at=entry['created_at'].isoformat())) + '\n'
+                    for entry in batch).encode('utf-8'))
+            else:
+                with self.app.app_context():
+                    db.session.execute(AuditLog.__table__.insert(), batch)
+                    db.session.commit()
+            self._count('written', len(batch))
+        except Exception as error:
+            self._count('dropped', len(batch))
+            print('błąd zapisu dziennika zmian: {}'.format(error))
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+
+writer = AuditWriter()
+
+
+def audit(action, entity, entity_id, details=None):
+    """Rejestracja zmiany - nie blokuje żądania zapisem do bazy."""
+    # poza żądaniem (zadania z crona) nie ma zalogowanego użytkownika
+    user_id = current_user.id if has_request_context() and current_user.is_authenticated \
+        else None
+    writer.put({'user_id': user_id,
+                'action': action,
+                'entity': entity,
+                'entity_id': int(entity_id),
+                'created_at': datetime.datetime.now(),
+                'details': details})
+
+
+def audit_entries(entity=None, entity_id=None, since=None, until=None, limit=100):
+    """Wyszukiwanie wpisów dziennika po encji i przedziale czasu (najnowsze pierwsze)."""
+    query = AuditLog.query
+    if entity is not None:
+        query = query.filter(AuditLog.entity == entity)
+    if entity_id is not None:
+        query = query.filter(AuditLog.entity_id == entity_id)
+    if since is not None:
+        query = query.filter(AuditLog.created_at >= since)
+    if until is not None:
+        query = query.filter(AuditLog.created_at < until)
+    return query.order_by(AuditLog.created_at.desc()).limit(limit).all()
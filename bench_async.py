@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Test obciążenia: /ajax_email w workerze synchronicznym (Flask) i w async_server.py.
+
+Użycie: python3 bench_async.py [opóźnienie_ms] [liczba_żądań_na_połączenie]
+        (domyślnie 20 ms i 20 żądań)
+Oba serwery działają w jednym procesie z jednym wątkiem obsługi i korzystają z tej samej
+bazy testowej SQLite. Opóźnienie dodawane do każdego żądania odpowiada czasowi oczekiwania
+na zdalną bazę lub serwer SMTP. Dla rosnącej liczby jednoczesnych połączeń wypisywana jest
+przepustowość oraz mediana i 99. percentyl czasu odpowiedzi.
+"""
+# importy modułów py
+import asyncio
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+import aiohttp
+import aiohttp.web
+
+CONCURRENCY = (1, 10, 50, 200)
+SYNC_PORT, ASYNC_PORT = 8091, 8092
+
+
+def fill_db(db_path):
+    """Baza testowa z 10 000 użytkowników."""
+    from flask import Flask
+    from db_models import db, User
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///{}'.format(db_path)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(User.__table__.insert(),
+                           [{'email': 'user{}@example.com'.format(i), 'password': 'x'}
+                            for i in range(10000)])
+        db.session.commit()
+
+
+def run_sync(db_path, delay):
+    """Worker synchroniczny - jeden wątek, blueprint pages_ajax bez zmian."""
+    from flask import Flask
+    from werkzeug.serving import run_simple
+    from db_models import db
+    from views_ajax import pages_ajax
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///{}'.format(db_path)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    app.register_blueprint(pages_ajax)
+    app.before_request(lambda: time.sleep(delay))
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    run_simple('127.0.0.1', SYNC_PORT, app, threaded=False)
+
+
+def run_async(delay):
+    """Serwer async - jeden proces, jedna pętla zdarzeń."""
+    import config
+    config.RATE_LIMIT.LIMITS = {}
+    import async_server
+
+    @aiohttp.web.middleware
+    async def latency(request, handler):
+        await asyncio.sleep(delay)
+        return await handler(request)
+
+    app = async_server.create_app()
+    app.middlewares.append(latency)
+    aiohttp.web.run_app(app, host='127.0.0.1', port=ASYNC_PORT, print=None)
+
+
+async def load(url, connections, requests_per_connection):
+    """connections połączeń, każde wysyła kolejno requests_per_connection żądań."""
+    timings = []
+    errors = 0
+
+    async def client(session, number):
+        nonlocal errors
+        for i in range(requests_per_connection):
+            start = time.perf_counter()
+            try:
+                async with session.post(url, data={'email': 'user{}@example.com'.format(
+                        (number * requests_per_connection + i) % 20000)}) as response:
+                    await response.text()
+                    if response.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            timings.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=connections)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(session, n) for n in range(connections)])
+        elapsed = time.perf_counter() - start
+    timings.sort()
+    return (len(timings) / elapsed, statistics.median(timings),
+            timings[int(len(timings) * 0.99) - 1], errors)
+
+
+def wait_for(port):
+    """Oczekiwanie na uruchomienie serwera."""
+    import socket
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+
+
+if __name__ == '__main__':
+    delay = (float(sys.argv[1]) if len(sys.argv) > 1 else 20) / 1000
+    per_connection = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DB_PATH'] = 'sqlite:///{}'.format(db_path)
+    fill_db(db_path)
+    servers = {'sync (Flask, 1 wątek)': (multiprocessing.Process(target=run_sync,
+                                                                  args=(db_path, delay)),
+                                         SYNC_PORT),
+               'async (aiohttp)': (multiprocessing.Process(target=run_async, args=(delay,)),
+                                   ASYNC_PORT)}
+    for name, (process, port) in servers.items():
+        process.start()
+        wait_for(port)
+        print('{} - opóźnienie I/O {:.0f} ms'.format(name, delay * 1000))
+        for connections in CONCURRENCY:
+            throughput, median, p99, errors = asyncio.get_event_loop().run_until_complete(
+                load('http://127.0.0.1:{}/ajax_email'.format(port), connections,
+                     per_connection))
+            print('    {:4} połączeń: {:8.1f} żądań/s  mediana {:8.1f} ms  p99 {:8.1f} ms  '
+                  'błędy {}'.format(connections, throughput, median * 1000, p99 * 1000, errors))
+        process.terminate()
+        process.join()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Pomiar czasu pierwszego żądania w świeżym procesie - bez i z cache bajtkodu / rozgrzewaniem.
+
+Użycie: python3 bench_first_request.py [liczba_powtórzeń]  (domyślnie 5)
+Każdy pomiar to nowy proces, który importuje main (tak jak nowy worker) i mierzy pierwsze
+żądanie do każdej strony z TEMPLATES.WARM_UP. Wymaga skonfigurowanej bazy danych.
+"""
+# importy modułów py
+import multiprocessing
+import statistics
+import sys
+import time
+
+VARIANTS = {
+    'bez cache': {'BYTECODE_CACHE_PATH': None, 'WARM_UP_ON_START': False},
+    'cache bajtkodu': {'WARM_UP_ON_START': False},
+    'cache + rozgrzewanie': {},
+}
+
+
+def first_requests(overrides, queue):
+    """Import aplikacji z podmienioną konfiguracją i pomiar pierwszych żądań."""
+    import config
+    for key, value in overrides.items():
+        setattr(config.TEMPLATES, key, value)
+    start = time.perf_counter()
+    from main import app
+    if config.TEMPLATES.WARM_UP_ON_START:
+        # to samo co hook post_fork w gunicorn_config.py
+        from template_cache import warm_up
+        warm_up(app)
+    startup = time.perf_counter() - start
+    client = app.test_client()
+    timings = {}
+    for url in config.TEMPLATES.WARM_UP:
+        start = time.perf_counter()
+        client.get(url)
+        timings[url] = time.perf_counter() - start
+    queue.put((startup, timings))
+
+
+if __name__ == '__main__':
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, overrides in VARIANTS.items():
+        results = multiprocessing.Queue()
+        runs = []
+        for _ in range(repeats):
+            process = multiprocessing.Process(target=first_requests, args=(overrides, results))
+            process.start()
+            runs.append(results.get())
+            process.join()
+        print('{} (start procesu: {:.1f} ms)'.format(
+            name, statistics.median([run[0] for run in runs]) * 1000))
+        for url in runs[0][1]:
+            print('    {:15} pierwsze żądanie: {:7.1f} ms (mediana z {})'.format(
+                url, statistics.median([run[1][url] for run in runs]) * 1000, repeats))
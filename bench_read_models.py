@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Porównanie pamięci i czasu: pełne obiekty ORM kontra lekkie rekordy z data_read_models.
+
+Użycie: python3 bench_read_models.py [liczba_wierszy]  (domyślnie 1 000 000)
+Każdy wariant uruchamiany jest w osobnym procesie, więc szczytowe RSS (ru_maxrss) nie miesza się
+między pomiarami. Baza testowa SQLite tworzona jest w katalogu tymczasowym.
+"""
+# importy modułów py
+import datetime
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from flask import Flask
+
+# importy nasze
+from db_models import db, User, Cemetery, Grave, Parcel
+from data_read_models import all_graves, all_parcels, parcel_columns
+
+
+def create_app(db_path):
+    """Minimalna aplikacja z bazą testową."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///{}'.format(db_path)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def fill_db(db_path, rows):
+    """Wypełnienie bazy testowej - rows parceli i rows grobów."""
+    with create_app(db_path).app_context():
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [{'id': 1, 'email': 'bench@example.com',
+                                                      'password': 'x'}])
+        side = int(rows ** 0.5) + 1
+        db.session.execute(Cemetery.__table__.insert(), [{'id': 1, 'name': 'bench', 'size': side}])
+        day = datetime.date(1950, 1, 1)
+        for start in range(0, rows, 50000):
+            chunk = range(start + 1, min(start + 50000, rows) + 1)
+            db.session.execute(Parcel.__table__.insert(),
+                               [{'id': i, 'cemetery_id': 1, 'parcel_type_id': 1,
+                                 'position_x': i // side + 1, 'position_y': i % side + 1}
+                                for i in chunk])
+            db.session.execute(Grave.__table__.insert(),
+                               [{'id': i, 'cemetery_id': 1, 'user_id': 1, 'parcel_id': i,
+                                 'name': 'Jan', 'last_name': 'Kowalski', 'day_of_birth': day,
+                                 'day_of_death': day} for i in chunk])
+        db.session.commit()
+
+
+def orm_variant():
+    """Stan przed zmianą - pełne encje ORM."""
+    return len(Grave.query.all()) + len(Parcel.query.all())
+
+
+def rows_variant():
+    """Stan po zmianie - rekordy namedtuple."""
+    return len(all_graves()) + len(all_parcels())
+
+
+def columns_variant():
+    """Mapa w wersji kolumnowej (numpy)."""
+    return len(all_graves()) + len(parcel_columns()['id'])
+
+
+VARIANTS = {'orm': orm_variant, 'rows': rows_variant, 'columns': columns_variant}
+
+
+def run_variant(db_path, name, queue):
+    """Pomiar jednego wariantu w świeżym procesie."""
+    with create_app(db_path).app_context():
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        count = VARIANTS[name]()
+        elapsed = time.perf_counter() - start
+        rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((name, count, elapsed, (rss_peak - rss_before) / 1024))
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'bench.db')
+        fill_db(path, rows)
+        results = multiprocessing.Queue()
+        for variant in VARIANTS:
+            process = multiprocessing.Process(target=run_variant, args=(path, variant, results))
+            process.start()
+            process.join()
+            name, count, elapsed, rss = results.get()
+            print('{:8} wierszy: {:8}  czas: {:7.2f} s  przyrost szczytowego RSS: {:8.1f} MB'
+                  .format(name, count, elapsed, rss))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Obsługa wielu cmentarzy - wybór cmentarza, w którego partycji działa bieżące żądanie."""
+# importy modułów py
+from flask import request, session
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# importy nasze
+from config import CEMETERY
+from db_models import Cemetery
+from user_summary import SharedStamps
+
+# lista cmentarzy zmienia się bardzo rzadko - wczytywana raz na proces i ponownie po zmianie
+# tabeli Cemetery w dowolnym procesie (licznik we współdzielonym pliku)
+generation = SharedStamps(CEMETERY.GENERATION_PATH, 1)
+_cemeteries = {'generation': None, 'choices': []}
+
+
+def cemetery_choices():
+    """Lista (id, nazwa) wszystkich cmentarzy."""
+    current = generation.get(0)
+    if _cemeteries['generation'] != current:
+        _cemeteries['choices'] = [(c.id, c.name) for c in Cemetery.query.order_by(Cemetery.id)]
+        _cemeteries['generation'] = current
+    return _cemeteries['choices']
+
+
+def current_cemetery_id():
+    """Id cmentarza dla bieżącego żądania - parametr ?cemetery=, potem sesja, potem domyślny."""
+    cemetery_id = request.args.get('cemetery', type=int)
+    if cemetery_id is not None and cemetery_id in dict(cemetery_choices()):
+        session['cemetery_id'] = cemetery_id
+        return cemetery_id
+    return session.get('cemetery_id', CEMETERY.DEFAULT_ID)
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_cemetery_changes(session, flush_context):
+    """Zapamiętanie zmiany listy cmentarzy do czasu zatwierdzenia transakcji."""
+    for objects in (session.new, session.dirty, session.deleted):
+        if any(isinstance(obj, Cemetery) for obj in objects):
+            session.info['cemeteries_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def bump_cemeteries(session):
+    """Unieważnienie listy cmentarzy we wszystkich procesach po zatwierdzeniu zmiany."""
+    if session.info.pop('cemeteries_changed', False):
+        generation.bump([0])
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_cemetery_changes(session):
+    """Wycofana transakcja - lista cmentarzy bez zmian."""
+    session.info.pop('cemeteries_changed', None)
@@ -25,6 +25,8 @@ class APP:
     PORT = CONFIG_APP.PORT
     DEBUG = CONFIG_APP.DEBUG
     APP_KEY = CONFIG_APP.APP_KEY
+    PROXY_COUNT = CONFIG_APP.PROXY_COUNT
+    CONFIRM_MAX_AGE = CONFIG_APP.CONFIRM_MAX_AGE
 
 
 class EMAIL:
@@ -37,3 +39,178 @@ class EMAIL:
     PASSWORD = CONFIG_EMAIL.PASSWORD
     DEFAULT_SENDER = CONFIG_EMAIL.DEFAULT_SENDER
     FILES_PATH = CONFIG_EMAIL.FILES_PATH
+
+
+class ASYNC:
+    """Konfiguracja serwera asynchronicznego (async_server.py)."""
+
+    HOST = CONFIG_ASYNC.HOST
+    PORT = CONFIG_ASYNC.PORT
+    DB_POOL_SIZE = CONFIG_ASYNC.DB_POOL_SIZE
+    MAIL_URL = CONFIG_ASYNC.MAIL_URL
+    MAIL_ALLOWED = CONFIG_ASYNC.MAIL_ALLOWED
+    MAIL_BATCH = CONFIG_ASYNC.MAIL_BATCH
+    MAIL_RETRIES = CONFIG_ASYNC.MAIL_RETRIES
+    MAIL_RETRY_DELAY = CONFIG_ASYNC.MAIL_RETRY_DELAY
+    MAIL_FAILED_PATH = CONFIG_ASYNC.MAIL_FAILED_PATH
+
+
+class CEMETERY:
+    """Konfiguracja obsługi wielu cmentarzy."""
+
+    DEFAULT_ID = CONFIG_CEMETERY.DEFAULT_ID
+    GENERATION_PATH = CONFIG_CEMETERY.GENERATION_PATH
+
+
+class OBITUARIES:
+    """Konfiguracja nekrologów i ich archiwum."""
+
+    ACTIVE_HOURS = CONFIG_OBITUARIES.ACTIVE_HOURS
+    ARCHIVE_AFTER_DAYS = CONFIG_OBITUARIES.ARCHIVE_AFTER_DAYS
+    ARCHIVE_BATCH = CONFIG_OBITUARIES.ARCHIVE_BATCH
+    ARCHIVE_PER_PAGE = CONFIG_OBITUARIES.ARCHIVE_PER_PAGE
+
+
+class NAMES:
+    """Konfiguracja podpowiedzi imion i nazwisk w wyszukiwarce grobów."""
+
+    LIMIT = CONFIG_NAMES.LIMIT
+    REBUILD_INTERVAL = CONFIG_NAMES.REBUILD_INTERVAL
+    TOP_PREFIX_LENGTH = CONFIG_NAMES.TOP_PREFIX_LENGTH
+
+
+class ASSETS:
+    """Konfiguracja plików statycznych."""
+
+    STATIC_PATH = CONFIG_ASSETS.STATIC_PATH
+    BUILD_PATH = CONFIG_ASSETS.BUILD_PATH
+    DIRS = CONFIG_ASSETS.DIRS
+    MAX_AGE = CONFIG_ASSETS.MAX_AGE
+
+
+class OCCUPANCY:
+    """Konfiguracja współdzielonej mapy zajętości parceli."""
+
+    PATH = CONFIG_OCCUPANCY.PATH
+
+
+class USER_SUMMARY:
+    """Konfiguracja cache podsumowań panelu użytkownika."""
+
+    STAMPS_PATH = CONFIG_USER_SUMMARY.STAMPS_PATH
+    SLOTS = CONFIG_USER_SUMMARY.SLOTS
+    CACHE_SIZE = CONFIG_USER_SUMMARY.CACHE_SIZE
+
+
+class SEARCH_CACHE:
+    """Konfiguracja cache wyników wyszukiwarki grobów."""
+
+    GENERATION_PATH = CONFIG_SEARCH_CACHE.GENERATION_PATH
+    SIZE = CONFIG_SEARCH_CACHE.SIZE
+
+
+class PRICING:
+    """Konfiguracja wyceny parceli (strefy cenowe)."""
+
+    GENERATION_PATH = CONFIG_PRICING.GENERATION_PATH
+
+
+class AUDIT:
+    """Konfiguracja dziennika zmian."""
+
+    SINK = CONFIG_AUDIT.SINK
+    JSONL_PATH = CONFIG_AUDIT.JSONL_PATH
+    QUEUE_SIZE = CONFIG_AUDIT.QUEUE_SIZE
+    BATCH_SIZE = CONFIG_AUDIT.BATCH_SIZE
+    FLUSH_INTERVAL = CONFIG_AUDIT.FLUSH_INTERVAL
+    PUT_TIMEOUT = CONFIG_AUDIT.PUT_TIMEOUT
+    SHUTDOWN_TIMEOUT = CONFIG_AUDIT.SHUTDOWN_TIMEOUT
+
+
+class RATE_LIMIT:
+    """Konfiguracja limitów żądań."""
+
+    STORE = CONFIG_RATE_LIMIT.STORE
+    SQLITE_PATH = CONFIG_RATE_LIMIT.SQLITE_PATH
+    LIMITS = CONFIG_RATE_LIMIT.LIMITS
+    METHODS = CONFIG_RATE_LIMIT.METHODS
+    ACCOUNT_FIELDS = CONFIG_RATE_LIMIT.ACCOUNT_FIELDS
+    EVICT_INTERVAL = CONFIG_RATE_LIMIT.EVICT_INTERVAL
+    IDLE_TIMEOUT = CONFIG_RATE_LIMIT.IDLE_TIMEOUT
+
+
+class ADMISSION:
+    """Konfiguracja kontroli przyjmowania żądań."""
+
+    LIMITS = CONFIG_ADMISSION.LIMITS
+    HEADER = CONFIG_ADMISSION.HEADER
+    RETRY_AFTER = CONFIG_ADMISSION.RETRY_AFTER
+    STATS_ALLOWED = CONFIG_ADMISSION.STATS_ALLOWED
+    SLOTS_PATH = CONFIG_ADMISSION.SLOTS_PATH
+    POLL_INTERVAL = CONFIG_ADMISSION.POLL_INTERVAL
+
+
+class TEMPLATES:
+    """Konfiguracja szablonów."""
+
+    BYTECODE_CACHE_PATH = CONFIG_TEMPLATES.BYTECODE_CACHE_PATH
+    WARM_UP_ON_START = CONFIG_TEMPLATES.WARM_UP_ON_START
+    WARM_UP = CONFIG_TEMPLATES.WARM_UP
+
+
+class MAP:
+    """Konfiguracja mapy cmentarza renderowanej po stronie serwera."""
+
+    CELL_SIZE = CONFIG_MAP.CELL_SIZE
+    TILE_SIZE = CONFIG_MAP.TILE_SIZE
+    CACHE_BYTES = CONFIG_MAP.CACHE_BYTES
+
+
+class ZOMBIE:
+    """Konfiguracja śledzenia zombie."""
+
+    TICK = CONFIG_ZOMBIE.TICK
+    STREAM_SECONDS = CONFIG_ZOMBIE.STREAM_SECONDS
+    RETRY_SECONDS = CONFIG_ZOMBIE.RETRY_SECONDS
+    WALK_TICKS = CONFIG_ZOMBIE.WALK_TICKS
+
+
+class LEDGER:
+    """Konfiguracja księgi wpłat."""
+
+    MINOR_UNITS = CONFIG_LEDGER.MINOR_UNITS
+    REFERENCE_PREFIX = CONFIG_LEDGER.REFERENCE_PREFIX
+    BATCH = CONFIG_LEDGER.BATCH
+    STATEMENT_COLUMNS = CONFIG_LEDGER.STATEMENT_COLUMNS
+    STATEMENT_DELIMITER = CONFIG_LEDGER.STATEMENT_DELIMITER
+    STATEMENT_DATE_FORMAT = CONFIG_LEDGER.STATEMENT_DATE_FORMAT
+
+
+class PROFILER:
+    """Konfiguracja profilowania żądań na życzenie administratora."""
+
+    ENABLED = CONFIG_PROFILER.ENABLED
+    INTERVAL = CONFIG_PROFILER.INTERVAL
+    TOKEN_MAX_AGE = CONFIG_PROFILER.TOKEN_MAX_AGE
+    PATH = CONFIG_PROFILER.PATH
+    KEEP = CONFIG_PROFILER.KEEP
+
+
+class DATA_QUALITY:
+    """Konfiguracja kontroli jakości danych grobów."""
+
+    CHUNK = CONFIG_DATA_QUALITY.CHUNK
+    REPORT_PATH = CONFIG_DATA_QUALITY.REPORT_PATH
+    FIX_QUEUE_PATH = CONFIG_DATA_QUALITY.FIX_QUEUE_PATH
+    APPLY_BATCH = CONFIG_DATA_QUALITY.APPLY_BATCH
+
+
+class JOBS:
+    """Konfiguracja zadań okresowych."""
+
+    ANNIVERSARY_BATCH = CONFIG_JOBS.ANNIVERSARY_BATCH
+    ANNIVERSARY_TIME_BUDGET = CONFIG_JOBS.ANNIVERSARY_TIME_BUDGET
+    ANNIVERSARY_MAX_DELAY = CONFIG_JOBS.ANNIVERSARY_MAX_DELAY
+    CLEANUP_BATCH = CONFIG_JOBS.CLEANUP_BATCH
+    CLEANUP_PAUSE = CONFIG_JOBS.CLEANUP_PAUSE
+    PURGE_USERS_BATCH = CONFIG_JOBS.PURGE_USERS_BATCH
@@ -18,6 +18,12 @@ class CONFIG_APP:
     PORT = 8080
     DEBUG = False
     APP_KEY = os.environ['APP_KEY']
+    # liczba serwerów proxy (nginx) przed aplikacją - adres klienta z X-Forwarded-For;
+    # domyślnie 0 - gunicorn przyjmuje połączenia bezpośrednio i nagłówek podaje sam klient.
+    # Ustawiać (PROXY_COUNT=1) tylko za serwerem proxy, przez który przechodzi cały ruch
+    PROXY_COUNT = int(os.environ.get('PROXY_COUNT', 0))
+    # ważność linku aktywacyjnego (sekundy) - później niepotwierdzone konto jest usuwane
+    CONFIRM_MAX_AGE = 3600
 
 
 class CONFIG_EMAIL:
@@ -30,3 +36,241 @@ class CONFIG_EMAIL:
     PASSWORD = os.environ['EMAIL_PASSWORD']
     DEFAULT_SENDER = 'graveyard_manager@o2.pl'
     FILES_PATH = 'static/emails/'
+
+
+class CONFIG_ASYNC:
+    """Konfiguracja serwera asynchronicznego (async_server.py)."""
+
+    HOST = '127.0.0.1'
+    PORT = 8081
+    DB_POOL_SIZE = 20
+    # adres kolejki poczty serwera async, np. 'http://127.0.0.1:8081/mail/send'
+    # None - poczta wysyłana bezpośrednio z workera Flaska
+    MAIL_URL = os.environ.get('ASYNC_MAIL_URL')
+    MAIL_ALLOWED = ('127.0.0.1', '::1')
+    # liczba wiadomości na jedno połączenie SMTP
+    MAIL_BATCH = 50
+    # liczba prób wysłania partii i odstęp między nimi (sekundy, rośnie z każdą próbą)
+    MAIL_RETRIES = 3
+    MAIL_RETRY_DELAY = 30
+    # katalog niewysłanych wiadomości - wczytywanych do kolejki przy starcie serwera
+    MAIL_FAILED_PATH = 'mail_failed/'
+
+
+class CONFIG_CEMETERY:
+    """Konfiguracja obsługi wielu cmentarzy."""
+
+    DEFAULT_ID = 1
+    # licznik zmian tabeli cmentarzy wspólny dla procesów - unieważnia listę cmentarzy
+    GENERATION_PATH = os.environ.get('CEMETERY_GENERATION_PATH',
+                                     '/dev/shm/graveyard_cemetery_generation')
+
+
+class CONFIG_OBITUARIES:
+    """Konfiguracja nekrologów i ich archiwum."""
+
+    # godziny po pogrzebie, przez które nekrolog jest jeszcze wyświetlany
+    ACTIVE_HOURS = 4
+    # dni po pogrzebie, po których nekrolog przenoszony jest do archiwum
+    ARCHIVE_AFTER_DAYS = 7
+    ARCHIVE_BATCH = 500
+    ARCHIVE_PER_PAGE = 20
+
+
+class CONFIG_NAMES:
+    """Konfiguracja podpowiedzi imion i nazwisk w wyszukiwarce grobów."""
+
+    # maksymalna liczba podpowiedzi
+    LIMIT = 10
+    # przebudowa indeksu w procesie (sekundy) - zmiany z innych workerów
+    REBUILD_INTERVAL = 300
+    # prefiksy do tej długości z najczęstszymi wartościami policzonymi z góry
+    TOP_PREFIX_LENGTH = 2
+
+
+class CONFIG_ASSETS:
+    """Konfiguracja plików statycznych."""
+
+    STATIC_PATH = 'static/'
+    BUILD_PATH = 'static/build/'
+    DIRS = ['styles', 'scripts', 'pictures']
+    # rok - pliki z hashem w nazwie nigdy się nie zmieniają
+    MAX_AGE = 31536000
+
+
+class CONFIG_OCCUPANCY:
+    """Konfiguracja współdzielonej mapy zajętości parceli."""
+
+    PATH = os.environ.get('OCCUPANCY_PATH', '/dev/shm/graveyard_occupancy')
+
+
+class CONFIG_USER_SUMMARY:
+    """Konfiguracja cache podsumowań panelu użytkownika."""
+
+    STAMPS_PATH = os.environ.get('USER_STAMPS_PATH', '/dev/shm/graveyard_user_stamps')
+    # liczba liczników zmian we wspólnym pliku
+    SLOTS = 65536
+    # liczba podsumowań trzymanych w pamięci procesu
+    CACHE_SIZE = 1000
+
+
+class CONFIG_SEARCH_CACHE:
+    """Konfiguracja cache wyników wyszukiwarki grobów."""
+
+    GENERATION_PATH = os.environ.get('SEARCH_GENERATION_PATH',
+                                     '/dev/shm/graveyard_search_generation')
+    # liczba zapytań trzymanych w pamięci procesu
+    SIZE = 256
+
+
+class CONFIG_PRICING:
+    """Konfiguracja wyceny parceli (strefy cenowe)."""
+
+    # licznik zmian stref wspólny dla procesów - unieważnia mapy cen workerów
+    GENERATION_PATH = os.environ.get('PRICING_GENERATION_PATH',
+                                     '/dev/shm/graveyard_pricing_generation')
+
+
+class CONFIG_AUDIT:
+    """Konfiguracja dziennika zmian."""
+
+    # db // jsonl
+    SINK = 'db'
+    JSONL_PATH = 'audit_log.jsonl'
+    QUEUE_SIZE = 10000
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 2
+    PUT_TIMEOUT = 0.05
+    # czas na zapis zaległych wpisów przy zamykaniu procesu (sekundy)
+    SHUTDOWN_TIMEOUT = 10
+
+
+class CONFIG_RATE_LIMIT:
+    """Konfiguracja limitów żądań."""
+
+    # memory // sqlite - 'sqlite' daje limity wspólne dla workerów gunicorna i async_server.py
+    STORE = 'sqlite'
+    SQLITE_PATH = '/dev/shm/graveyard_rate_limit.db'
+    # endpoint: (pojemność kubełka, żetony odnawiane na minutę)
+    LIMITS = {'pages_log_sys.login': (10, 5),
+              'pages_log_sys.password_recovery': (3, 1),
+              'pages_log_sys.register': (3, 1),
+              'pages_ajax.ajax_email': (30, 60)}
+    METHODS = ['POST']
+    ACCOUNT_FIELDS = ['email', 'email_login']
+    EVICT_INTERVAL = 60
+    IDLE_TIMEOUT = 900
+
+
+class CONFIG_ADMISSION:
+    """Konfiguracja kontroli przyjmowania żądań."""
+
+    # blueprint lub endpoint: (liczba jednocześnie obsługiwanych żądań we wszystkich workerach,
+    #                          budżet czasu oczekiwania w kolejce w sekundach)
+    # endpoint ma pierwszeństwo przed swoim blueprintem
+    LIMITS = {'pages_user': (4, 1.0),
+              'pages_map': (4, 1.0),
+              'pages.graves': (4, 1.0),
+              'pages_admin': (2, 2.0),
+              # strumienie SSE zajmują worker przez ZOMBIE.STREAM_SECONDS
+              'pages_zombie': (2, 0.5),
+              'pages': (16, 3.0)}
+    # nagłówek z czasem przyjęcia żądania przez proxy (nginx: "t=${msec}")
+    HEADER = 'X-Request-Start'
+    # sekundy
+    RETRY_AFTER = 5
+    # adresy, z których dostępne są liczniki (/admission/stats)
+    STATS_ALLOWED = ('127.0.0.1', '::1')
+    # zajęte miejsca w limitach, wspólne dla workerów
+    SLOTS_PATH = os.environ.get('ADMISSION_SLOTS_PATH', '/dev/shm/graveyard_admission')
+    # sekundy między próbami zajęcia miejsca w limicie
+    POLL_INTERVAL = 0.01
+
+
+class CONFIG_TEMPLATES:
+    """Konfiguracja szablonów."""
+
+    # None wyłącza cache bajtkodu
+    BYTECODE_CACHE_PATH = 'cache/jinja/'
+    WARM_UP_ON_START = True
+    WARM_UP = ['/', '/obituaries', '/graves']
+
+
+class CONFIG_MAP:
+    """Konfiguracja mapy cmentarza renderowanej po stronie serwera."""
+
+    CELL_SIZE = 12
+    TILE_SIZE = 64
+    # łączny rozmiar gotowych obrazów w cache procesu (bajty)
+    CACHE_BYTES = 32 * 1024 * 1024
+
+
+class CONFIG_ZOMBIE:
+    """Konfiguracja śledzenia zombie."""
+
+    # sekundy między krokami symulacji
+    TICK = 1
+    STREAM_SECONDS = 60
+    # po tylu sekundach przeglądarka nawiązuje zamknięte połączenie ponownie
+    RETRY_SECONDS = 5
+    # co tyle ticków zombie wracają do grobów i wychodzą z nich od nowa
+    WALK_TICKS = 300
+
+
+class CONFIG_LEDGER:
+    """Konfiguracja księgi wpłat."""
+
+    # groszy w złotym
+    MINOR_UNITS = 100
+    # prefiks numeru płatności w tytule przelewu, np. GM00000123
+    REFERENCE_PREFIX = 'GM'
+    # liczba wpisów w jednej transakcji importu i uzgadniania
+    BATCH = 1000
+    # nazwy kolumn w pliku CSV z wyciągiem bankowym
+    STATEMENT_COLUMNS = {'id': 'transaction_id',
+                         'date': 'booking_date',
+                         'amount': 'amount',
+                         'title': 'title'}
+    STATEMENT_DELIMITER = ';'
+    STATEMENT_DATE_FORMAT = '%Y-%m-%d'
+
+
+class CONFIG_PROFILER:
+    """Konfiguracja profilowania żądań na życzenie administratora."""
+
+    ENABLED = True
+    # odstęp między próbkami stosu (sekundy)
+    INTERVAL = 0.005
+    # ważność tokenu uruchamiającego profilowanie (sekundy)
+    TOKEN_MAX_AGE = 3600
+    PATH = 'profiles'
+    # liczba przechowywanych profili
+    KEEP = 50
+
+
+class CONFIG_DATA_QUALITY:
+    """Konfiguracja kontroli jakości danych grobów."""
+
+    # liczba grobów czytanych do tablic numpy naraz
+    CHUNK = 100000
+    REPORT_PATH = 'reports/grave_quality.csv'
+    FIX_QUEUE_PATH = 'reports/grave_fixes.jsonl'
+    # liczba poprawek stosowanych w jednej transakcji
+    APPLY_BATCH = 500
+
+
+class CONFIG_JOBS:
+    """Konfiguracja zadań okresowych."""
+
+    # liczba użytkowników na jedno połączenie SMTP i jeden punkt wznowienia
+    ANNIVERSARY_BATCH = 200
+    # sekundy
+    ANNIVERSARY_TIME_BUDGET = 1800
+    # niedokończona wysyłka starsza niż tyle dni nie jest już dokańczana
+    ANNIVERSARY_MAX_DELAY = 7
+    # liczba grobów / osieroconych wierszy usuwanych w jednej transakcji
+    CLEANUP_BATCH = 500
+    # przerwa między partiami (sekundy) - inne transakcje mogą w tym czasie przejąć blokady
+    CLEANUP_PAUSE = 0.05
+    # liczba niepotwierdzonych kont usuwanych w jednej transakcji
+    PURGE_USERS_BATCH = 200
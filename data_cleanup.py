@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Masowe usuwanie grobów razem z zależnymi wierszami oraz sprzątanie osieroconych wierszy.
+
+Pojedynczy grób usuwany w widoku korzysta z kaskady ORM (Grave.family, Grave.payments).
+Przy usuwaniu użytkownika lub czyszczeniu całego cmentarza przechodzenie po obiektach ORM
+jeden po drugim byłoby zbyt wolne, dlatego tutaj groby wybierane są partiami
+(JOBS.CLEANUP_BATCH, stronicowanie po id) i każda partia to trzy instrukcje DELETE ... WHERE IN
+w osobnej, krótkiej transakcji - blokady nie są trzymane przez cały przebieg.
+Instrukcje z pominięciem ORM nie wywołują zdarzeń sesji, więc zestawienia (data_rollups)
+korygowane są w tej samej transakcji na podstawie zapytań GROUP BY po usuwanych wierszach.
+
+Uruchomienie (np. cron): python3 data_cleanup.py - usuwa wiersze Family i Payments, które
+wskazują na nieistniejące groby lub użytkowników (pozostałości po wcześniejszym delete_grave),
+oraz konta niepotwierdzone w czasie ważności linku aktywacyjnego (APP.CONFIRM_MAX_AGE).
+"""
+# importy modułów py
+import datetime
+import time
+from sqlalchemy import func, and_, or_, extract
+
+# importy nasze
+from audit_log import audit
+from config import APP, JOBS
+from data_occupancy import occupancy_for
+from data_rollups import apply_delta
+from db_models import db, User, Grave, Parcel, Family, Payments, AuditLog, ParcelRollup, \
+    RevenueRollup, DeathsRollup, PAYMENT_BOOKED, GRAVE_BOOKED, BookedPaymentError
+from search_cache import bump_search_generation
+from user_summary import invalidate_users
+
+
+def revenue_deltas(connection, criterion):
+    """Odjęcie od zestawień przychodów płatności spełniających warunek (przed ich usunięciem)."""
+    rows = db.session.query(Payments.cemetery_id, func.sum(Payments.amount_paid),
+                            func.sum(Payments.payment_amount - Payments.amount_paid))\
+        .filter(criterion).group_by(Payments.cemetery_id).all()
+    for cemetery_id, collected, outstanding in rows:
+        apply_delta(connection, RevenueRollup, {'cemetery_id': cemetery_id},
+                    {'collected': -(collected or 0), 'outstanding': -(outstanding or 0)})
+
+
+def delete_graves_batch(grave_ids):
+    """Usunięcie partii grobów z obserwującymi i płatnościami w jednej transakcji.
+
+    Groby, których płatności mają zaksięgowane wpłaty (LedgerEntry), są pomijane.
+    """
+    graves = db.session.query(Grave.id, Grave.cemetery_id, Grave.parcel_id, Grave.user_id)\
+        .filter(Grave.id.in_(grave_ids), ~GRAVE_BOOKED).all()
+    if not graves:
+        return 0
+    grave_ids = [grave.id for grave in graves]
+    parcel_ids = [grave.parcel_id for grave in graves]
+    users = {grave.user_id for grave in graves}
+    users.update(user_id for user_id, in db.session.query(Family.user_id)
+                 .filter(Family.grave_id.in_(grave_ids)))
+    connection = db.session.connection()
+
+    taken = db.session.query(Grave.cemetery_id, Parcel.parcel_type_id, func.count(Grave.id))\
+        .join(Parcel, Parcel.id == Grave.parcel_id)\
+        .filter(Grave.id.in_(grave_ids))\
+        .group_by(Grave.cemetery_id, Parcel.parcel_type_id).all()
+    for cemetery_id, parcel_type_id, count in taken:
+        apply_delta(connection, ParcelRollup,
+                    {'cemetery_id': cemetery_id, 'parcel_type_id': parcel_type_id},
+                    {'taken': -count})
+    year = extract('year', Grave.day_of_death)
+    deaths = db.session.query(Grave.cemetery_id, year, func.count(Grave.id))\
+        .filter(Grave.id.in_(grave_ids), Grave.day_of_death.isnot(None))\
+        .group_by(Grave.cemetery_id, year).all()
+    for cemetery_id, death_year, count in deaths:
+        apply_delta(connection, DeathsRollup, {'cemetery_id': cemetery_id, 'year': int(death_year)},
+                    {'deaths': -count})
+    revenue_deltas(connection, Payments.parcel_id.in_(parcel_ids))
+
+    connection.execute(Family.__table__.delete().where(Family.grave_id.in_(grave_ids)))
+    connection.execute(Payments.__table__.delete().where(Payments.parcel_id.in_(parcel_ids)))
+    connection.execute(Grave.__table__.delete().where(Grave.id.in_(grave_ids)))
+    db.session.commit()
+
+    invalidate_users(users)
+    bump_search_generation()
+    for grave_id, cemetery_id, parcel_id, _ in graves:
+        occupancy_for(cemetery_id).mark(parcel_id, False)
+        audit('delete', 'grave', grave_id, 'bulk')
+    return len(graves)
+
+
+def delete_graves(*criteria, batch_size=JOBS.CLEANUP_BATCH, pause=JOBS.CLEANUP_PAUSE):
+    """Usunięcie wszystkich grobów spełniających warunki, partiami; zwraca liczbę grobów."""
+    deleted = 0
+    last_id = 0
+    while True:
+        grave_ids = [grave_id for grave_id, in db.session.query(Grave.id)
+                     .filter(Grave.id > last_id, *criteria)
+                     .order_by(Grave.id).limit(batch_size)]
+        if not grave_ids:
+            return deleted
+        deleted += delete_graves_batch(grave_ids)
+        last_id = grave_ids[-1]
+        time.sleep(pause)
+
+
+def delete_cemetery_graves(cemetery_id):
+    """Wyczyszczenie wszystkich grobów cmentarza."""
+    return delete_graves(Grave.cemetery_id == cemetery_id)
+
+
+def delete_user(user_id):
+    """Usunięcie użytkownika z jego grobami, obserwowanymi grobami i płatnościami.
+
+    BookedPaymentError, zanim cokolwiek zostanie usunięte, gdy płatności użytkownika lub jego
+    grobów mają zaksięgowane wpłaty - księga wpłat musi wskazywać na istniejące płatności.
+    """
+    own_parcels = db.session.query(Grave.parcel_id).filter(Grave.user_id == user_id)
+    if db.session.query(Payments.id).filter(or_(Payments.user_id == user_id,
+                                                Payments.parcel_id.in_(own_parcels)),
+                                            PAYMENT_BOOKED).first():
+        raise BookedPaymentError('Użytkownik {} ma zaksięgowane wpłaty!'.format(user_id))
+    deleted = delete_graves(Grave.user_id == user_id)
+    connection = db.session.connection()
+    revenue_deltas(connection, Payments.user_id == user_id)
+    connection.execute(Payments.__table__.delete().where(Payments.user_id == user_id))
+    connection.execute(Family.__table__.delete().where(Family.user_id == user_id))
+    # dziennik zmian zostaje - bez wskazania na usunięte konto
+    connection.execute(AuditLog.__table__.update().where(AuditLog.user_id == user_id)
+                       .values(user_id=None))
+    connection.execute(User.__table__.delete().where(User.id == user_id))
+    db.session.commit()
+    return deleted
+
+
+def sweep(model, criterion, batch_size, pause, before_delete=None):
+    """Usuwanie partiami wierszy spełniających warunek, aż do wyczerpania."""
+    swept = 0
+    while True:
+        ids = [row_id for row_id, in db.session.query(model.id).filter(criterion)
+               .limit(batch_size)]
+        if not ids:
+            return swept
+        connection = db.session.connection()
+        if before_delete:
+            before_delete(connection, model.id.in_(ids))
+        # warunek sprawdzany ponownie - wiersz mógł się zmienić od wybrania partii
+        result = connection.execute(model.__table__.delete()
+                                    .where(and_(model.id.in_(ids), criterion)))
+        db.session.commit()
+        swept += result.rowcount
+        time.sleep(pause)
+
+
+def sweep_orphans(batch_size=JOBS.CLEANUP_BATCH, pause=JOBS.CLEANUP_PAUSE):
+    """Usunięcie osieroconych wierszy Family i Payments; zwraca liczby usuniętych wierszy."""
+    no_grave = ~db.session.query(Grave.id).filter(Grave.id == Family.grave_id).exists()
+    no_user = ~db.session.query(User.id).filter(User.id == Family.user_id).exists()
+    family = sweep(Family, or_(no_grave, no_user), batch_size, pause)
+
+    no_grave = ~db.session.query(Grave.id).filter(Grave.parcel_id == Payments.parcel_id).exists()
+    no_user = ~db.session.query(User.id).filter(User.id == Payments.user_id).exists()
+    # płatności z zaksięgowanymi wpłatami zostają - wskazują na nie wpisy księgi
+    payments = sweep(Payments, and_(or_(no_grave, no_user), ~PAYMENT_BOOKED), batch_size, pause,
+                     before_delete=revenue_deltas)
+    return {'family': family, 'payments': payments}
+
+
+def purge_unconfirmed_users(now=None, batch_size=JOBS.PURGE_USERS_BATCH,
+                            pause=JOBS.CLEANUP_PAUSE):
+    """Usunięcie kont niepotwierdzonych w czasie ważności linku aktywacyjnego.
+
+    Partie wybierane są po indeksie (active_user, created_at). Konta bez created_at pochodzą
+    sprzed dodania kolumny, więc ich linki dawno wygasły. Konto z jakimkolwiek grobem,
+    obserwowanym grobem lub płatnością jest pomijane. Zwraca liczbę usuniętych kont.
+    """
+    cutoff = (now or datetime.datetime.now()) - datetime.timedelta(seconds=APP.CONFIRM_MAX_AGE)
+    criterion = and_(User.active_user.is_(False),
+                     or_(User.created_at < cutoff, User.created_at.is_(None)),
+                     ~db.session.query(Grave.id).filter(Grave.user_id == User.id).exists(),
+                     ~db.session.query(Family.id).filter(Family.user_id == User.id).exists(),
+                     ~db.session.query(Payments.id).filter(Payments.user_id == User.id).exists())
+    return sweep(User, criterion, batch_size, pause)
+
+
+if __name__ == '__main__':
+    from main import app
+    app.app_context().push()
+    print('usunięto osierocone wiersze: {}'.format(sweep_orphans()))
+    print('usunięto niepotwierdzone konta: {}'.format(purge_unconfirmed_users()))
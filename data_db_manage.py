@@ -54,10 +54,11 @@ def change_user_data(user, form_data):
     user.flat_number = form_data.flat_number.data
 
 
-def obituary_add_data(form_obituary, funeral_date, funeral_time, calendar_is_html=True,
-                      clock_is_str=True):
+def obituary_add_data(form_obituary, funeral_date, funeral_time, cemetery_id,
+                      calendar_is_html=True, clock_is_str=True):
     """Dodanie nowego nekrologu."""
-    return Obituaries(name=form_obituary.name.data,
+    return Obituaries(cemetery_id=cemetery_id,
+                      name=form_obituary.name.data,
                       surname=form_obituary.surname.data,
                       years_old=form_obituary.years_old.data,
                       death_date=form_obituary.death_date.data,
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Obsługa przebiegów zadań okresowych (tabela JobRun).
+
+Zadanie uruchamiane np. z crona zapisuje po każdej partii punkt wznowienia (cursor), więc
+przerwany lub ograniczony czasowo przebieg jest kontynuowany przy następnym uruchomieniu,
+a przebieg zakończony dla danego dnia nie jest powtarzany.
+"""
+# importy modułów py
+import datetime
+
+# importy nasze
+from db_models import db, JobRun
+
+
+def start_job(name, day=None):
+    """Rozpoczęcie lub wznowienie przebiegu, None gdy przebieg na ten dzień jest zakończony."""
+    day = day or datetime.date.today()
+    run = JobRun.query.filter_by(name=name, day=day).first()
+    if run is None:
+        run = JobRun(name=name, day=day, status='running', cursor=0, processed=0,
+                     updated_at=datetime.datetime.now())
+        db.session.add(run)
+        db.session.commit()
+    return None if run.status == 'done' else run
+
+
+def unfinished_jobs(name, before_day):
+    """Niedokończone przebiegi z dni wcześniejszych niż before_day, od najstarszego."""
+    return JobRun.query.filter(JobRun.name == name, JobRun.status == 'running',
+                               JobRun.day < before_day).order_by(JobRun.day).all()
+
+
+def checkpoint(run, cursor, processed):
+    """Zapis punktu wznowienia po przetworzeniu partii."""
+    run.cursor = cursor
+    run.processed += processed
+    run.updated_at = datetime.datetime.now()
+    db.session.commit()
+
+
+def finish_job(run):
+    """Oznaczenie przebiegu jako zakończonego."""
+    run.status = 'done'
+    run.updated_at = datetime.datetime.now()
+    db.session.commit()
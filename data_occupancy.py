@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Współdzielona między procesami mapa zajętości parceli.
+
+Każdy cmentarz ma własny plik OCCUPANCY.PATH_<id cmentarza> (domyślnie w /dev/shm), mapowany do
+pamięci przez każdy proces workera. Układ pliku:
+    nagłówek      - magic, licznik generacji, base (min id parceli), rozmiar, max_p
+    bitmapa       - 1 bit na parcelę (1 = zajęta), indeksowana numerem parceli minus base
+    typy          - uint32 na parcelę (parcel_type_id)
+    pozycje x, y  - uint16 na parcelę
+Zapisy odbywają się pod blokadą pliku (fcntl) i każdy zwiększa licznik generacji, który służy
+też jako klucz dla cache zależnych od zajętości. Odczyty biorą blokadę współdzieloną i przed
+odczytem mapują plik ponownie, gdy inny proces zmienił jego rozmiar. Plik nigdy nie jest
+zmniejszany - proces z mapowaniem sprzed odbudowy nie może sięgnąć za koniec pliku (SIGBUS).
+Workery tylko podłączają się do pliku. Mapę buduje z bazy - pod blokadą wyłączną - pierwszy
+proces, który nie zastanie gotowego pliku (np. po restarcie serwera), albo jawnie:
+    python3 data_occupancy.py  - odbudowa map wszystkich cmentarzy (np. po odtworzeniu bazy)
+"""
+# importy modułów py
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+import numpy as np
+from flask import abort
+
+# importy nasze
+from cemeteries import cemetery_choices
+from config import OCCUPANCY
+from data_read_models import ParcelRow
+from db_models import db, Cemetery, Grave, Parcel
+
+HEADER = struct.Struct('<8sQQQQ')
+MAGIC = b'GRAVEMP2'
+
+
+class SharedOccupancy:
+    """Bitmapa zajętości i tablice parceli w pliku mapowanym do pamięci."""
+
+    def __init__(self, cemetery_id, path):
+        self.cemetery_id = cemetery_id
+        self.path = path
+        self.file = None
+        self.map = None
+        self.pid = None
+        self.base = 0
+        self.size = 0
+        # flock wyklucza procesy, wątki jednego procesu dzielą deskryptor - osobna blokada
+        self.thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, exclusive=True):
+        """Blokada pliku na czas zapisu (lub spójnego odczytu)."""
+        self._open()
+        with self.thread_lock:
+            fcntl.flock(self.file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+
+    def _open(self):
+        """Otwarcie pliku - osobno w każdym procesie.
+
+        Deskryptor odziedziczony po fork (np. gunicorn --preload) wskazuje ten sam opis
+        otwartego pliku co w innych workerach, a wtedy flock ich nie wyklucza.
+        """
+        if self.pid != os.getpid():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self.file = os.fdopen(fd, 'r+b')
+            self.map = None
+            self.pid = os.getpid()
+
+    def _built(self):
+        """Czy plik zawiera zbudowaną mapę w bieżącym formacie."""
+        return os.pread(self.file.fileno(), len(MAGIC), 0) == MAGIC
+
+    def _attach(self):
+        """Podłączenie do mapy; gdy jej brak, budowa z bazy przez pierwszy proces."""
+        self._open()
+        if not self._built():
+            with self._locked():
+                # inny proces mógł zbudować mapę, gdy czekaliśmy na blokadę
+                if not self._built():
+                    self._build()
+        self._ensure_mapped()
+
+    def _header(self):
+        """Odczyt nagłówka: (generacja, base, rozmiar, max_p)."""
+        magic, generation, base, size, max_p = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise RuntimeError('Mapa zajętości nie została zbudowana!')
+        return generation, base, size, max_p
+
+    def _ensure_mapped(self):
+        """Zmapowanie pliku, ponowne gdy inny proces zmienił jego rozmiar."""
+        self._open()
+        file_size = os.fstat(self.file.fileno()).st_size
+        if file_size < HEADER.size:
+            raise RuntimeError('Mapa zajętości nie została zbudowana!')
+        if self.map is None or len(self.map) != file_size:
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), file_size)
+        _, self.base, self.size, _ = self._header()
+
+    def _arrays(self):
+        """Widoki numpy na poszczególne sekcje pliku (bez kopiowania)."""
+        size = self.size
+        bitmap_len = (size + 7) // 8
+        offset = HEADER.size
+        bitmap = np.frombuffer(self.map, dtype=np.uint8, count=bitmap_len, offset=offset)
+        offset += bitmap_len
+        types = np.frombuffer(self.map, dtype=np.uint32, count=size, offset=offset)
+        offset += 4 * size
+        xs = np.frombuffer(self.map, dtype=np.uint16, count=size, offset=offset)
+        offset += 2 * size
+        ys = np.frombuffer(self.map, dtype=np.uint16, count=size, offset=offset)
+        return bitmap, types, xs, ys
+
+    def _bump_generation(self):
+        """Zwiększenie licznika generacji - wywoływane pod blokadą."""
+        generation, base, size, max_p = self._header()
+        HEADER.pack_into(self.map, 0, MAGIC, generation + 1, base, size, max_p)
+
+    def _build(self):
+        """Zapis całej mapy z bazy danych - wywoływane pod blokadą wyłączną.
+
+        Baza czytana jest pod blokadą, więc mark() z innych procesów czeka na koniec budowy
+        i żadne oznaczenie nie zostaje nadpisane.
+        """
+        parcels = db.session.query(Parcel.id, Parcel.parcel_type_id,
+                                   Parcel.position_x, Parcel.position_y)\
+            .filter(Parcel.cemetery_id == self.cemetery_id).all()
+        taken = np.array([parcel_id for parcel_id, in db.session.query(Grave.parcel_id)
+                          .filter(Grave.cemetery_id == self.cemetery_id)], dtype=np.int64)
+        ids = np.array([row[0] for row in parcels], dtype=np.int64)
+        base = int(ids.min()) if len(ids) else 0
+        ids -= base
+        taken -= base
+        size = int(ids.max()) + 1 if len(ids) else 0
+        max_p = max([row[2] for row in parcels]) if parcels else 0
+        occupied = np.zeros((size + 7) // 8 * 8, dtype=np.uint8)
+        occupied[taken] = 1
+        types = np.zeros(size, dtype=np.uint32)
+        xs = np.zeros(size, dtype=np.uint16)
+        ys = np.zeros(size, dtype=np.uint16)
+        types[ids] = [row[1] for row in parcels]
+        xs[ids] = [row[2] for row in parcels]
+        ys[ids] = [row[3] for row in parcels]
+        body = np.packbits(occupied).tobytes() + types.tobytes() + xs.tobytes() + ys.tobytes()
+        fd = self.file.fileno()
+        header = os.pread(fd, HEADER.size, 0).ljust(HEADER.size, b'\0')
+        magic, generation, _, _, _ = HEADER.unpack(header)
+        generation = generation if magic == MAGIC else 0
+        # tylko powiększanie - mapowania innych procesów pozostają w granicach pliku
+        if os.fstat(fd).st_size < HEADER.size + len(body):
+            os.ftruncate(fd, HEADER.size + len(body))
+        os.pwrite(fd, HEADER.pack(MAGIC, generation + 1, base, size, max_p) + body, 0)
+
+    def rebuild(self):
+        """Wymuszona odbudowa mapy z bazy danych (db_init, uruchomienie z wiersza poleceń)."""
+        with self._locked():
+            self._build()
+        self._ensure_mapped()
+
+    def mark(self, parcel_id, taken):
+        """Oznaczenie parceli jako zajętej / wolnej (po zapisie grobu do bazy)."""
+        self._attach()
+        with self._locked():
+            self._ensure_mapped()
+            index = int(parcel_id) - self.base
+            if not 0 <= index < self.size:
+                # parcela dodana po zbudowaniu mapy - odbudowa, a potem sprawdzenie ponowne
+                self._build()
+                self._ensure_mapped()
+                index = int(parcel_id) - self.base
+                if not 0 <= index < self.size:
+                    raise ValueError('Parcela {} spoza cmentarza {}'.format(parcel_id,
+                                                                          self.cemetery_id))
+            byte = HEADER.size + index // 8
+            bit = 1 << (7 - index % 8)
+            self.map[byte] = (self.map[byte] | bit) if taken else (self.map[byte] & ~bit)
+            self._bump_generation()
+
+    def generation(self):
+        """Aktualny numer generacji - zmienia się po każdym zapisie."""
+        self._attach()
+        with self._locked(exclusive=False):
+            self._ensure_mapped()
+            return self._header()[0]
+
+    def max_p(self):
+        """Rozmiar boku cmentarza."""
+        self._attach()
+        with self._locked(exclusive=False):
+            self._ensure_mapped()
+            return self._header()[3]
+
+    def is_taken(self, parcel_id):
+        """Czy parcela jest zajęta - bez zapytania do bazy."""
+        self._attach()
+        with self._locked(exclusive=False):
+            self._ensure_mapped()
+            index = int(parcel_id) - self.base
+            if not 0 <= index < self.size:
+                return False
+            return bool(self.map[HEADER.size + index // 8] & (1 << (7 - index % 8)))
+
+    def snapshot(self):
+        """Spójna kopia tablic: (zajętość 0/1, typy, x, y) indeksowane numerem parceli minus base."""
+        self._attach()
+        with self._locked(exclusive=False):
+            self._ensure_mapped()
+            bitmap, types, xs, ys = self._arrays()
+            taken = np.unpackbits(bitmap)[:self.size]
+            return taken, types.copy(), xs.copy(), ys.copy()
+
+    def taken_parcels(self):
+        """Lista numerów zajętych parceli."""
+        return [int(index) + self.base for index in np.flatnonzero(self.snapshot()[0])]
+
+    def parcels(self):
+        """Parcele (ParcelRow) odtworzone ze współdzielonych tablic - bez zapytania do bazy."""
+        _, types, xs, ys = self.snapshot()
+        return [ParcelRow(int(index) + self.base, self.cemetery_id, int(types[index]),
+                          int(xs[index]), int(ys[index])) for index in np.flatnonzero(xs)]
+
+
+_occupancies = {}
+
+
+def occupancy_for(cemetery_id):
+    """Mapa zajętości danego cmentarza; 404 dla nieistniejącego cmentarza.
+
+    Plik tworzony jest tylko dla cmentarzy z bazy - id z adresu nie może tworzyć nowych plików.
+    """
+    if cemetery_id not in _occupancies:
+        if cemetery_id not in dict(cemetery_choices()):
+            abort(404)
+        _occupancies[cemetery_id] = SharedOccupancy(cemetery_id,
+                                                    '{}_{}'.format(OCCUPANCY.PATH, cemetery_id))
+    return _occupancies[cemetery_id]
+
+
+def rebuild_all():
+    """Odbudowa map zajętości wszystkich cmentarzy."""
+    for cemetery_id, in db.session.query(Cemetery.id):
+        occupancy_for(cemetery_id).rebuild()
+
+
+if __name__ == '__main__':
+    from main import app
+    app.app_context().push()
+    rebuild_all()
+    print('odbudowano mapy zajętości')
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Moduł wyceny parceli na podstawie stref cenowych (premium).
+
+Cena parceli to cena jej typu (ParcelType), chyba że parcela leży w strefie z tabeli PricingZone -
+wtedy obowiązuje cena strefy o najwyższym priorytecie. Ceny wszystkich parceli liczone są
+jednym wektorowym przebiegiem po tablicach współrzędnych i trzymane w mapie cen indeksowanej
+numerem parceli, dzięki czemu wycena dowolnej liczby parceli to zwykłe odczyty z tablicy.
+Mapa jest osobna w każdym procesie - zmiana strefy (save_zone, delete_zone, panel /admin/zones)
+zwiększa licznik we współdzielonym pliku PRICING.GENERATION_PATH, a pozostałe procesy
+przebudowują mapę przy następnej wycenie.
+"""
+# importy modułów py
+from collections import namedtuple
+import numpy as np
+
+# importy nasze
+from config import PRICING
+from db_models import db, Parcel, ParcelType, PricingZone
+from user_summary import SharedStamps
+
+
+ZoneRule = namedtuple('ZoneRule', ['id', 'cemetery_id', 'kind', 'x_min', 'x_max', 'y_min',
+                                   'y_max', 'gate_x', 'gate_y', 'radius', 'price', 'priority'])
+
+
+def zone_rule(zone):
+    """Niezależna od sesji kopia reguły strefy (obiekt PricingZone -> ZoneRule)."""
+    return ZoneRule(*[getattr(zone, field) for field in ZoneRule._fields])
+
+
+def within(values, low, high):
+    """Maska wartości z przedziału [low, high] - brak granicy (NULL) oznacza przedział otwarty."""
+    mask = np.ones(len(values), dtype=bool)
+    if low is not None:
+        mask &= values >= low
+    if high is not None:
+        mask &= values <= high
+    return mask
+
+
+def zone_mask(rule, xs, ys):
+    """Maska parceli należących do strefy, liczona wektorowo na tablicach współrzędnych."""
+    if rule.kind == 'rect':
+        return within(xs, rule.x_min, rule.x_max) & within(ys, rule.y_min, rule.y_max)
+    if rule.kind == 'rows':
+        return within(xs, rule.x_min, rule.x_max)
+    if rule.kind == 'gate':
+        if None in (rule.gate_x, rule.gate_y, rule.radius):
+            # niekompletna strefa przy bramie nie obejmuje żadnej parceli
+            return np.zeros(len(xs), dtype=bool)
+        return np.hypot(xs - rule.gate_x, ys - rule.gate_y) <= rule.radius
+    raise ValueError('Nieznany rodzaj strefy: {}'.format(rule.kind))
+
+
+class PriceMap:
+    """Mapa cen wszystkich parceli, przeliczana przyrostowo po zmianie stref."""
+
+    def __init__(self):
+        self.built = False
+        self.generation = None
+        self.ids = self.cemeteries = self.xs = self.ys = self.base = self.prices = None
+        self.zones = {}
+
+    def build(self):
+        """Wczytanie współrzędnych i cen bazowych z bazy oraz pełne przeliczenie mapy."""
+        # odczyt przed zapytaniami - zmiana strefy w trakcie budowy wymusi kolejną
+        self.generation = generation.get(0)
+        rows = db.session.query(Parcel.id, Parcel.cemetery_id, Parcel.position_x,
+                                Parcel.position_y, ParcelType.price)\
+            .join(ParcelType, Parcel.parcel_type_id == ParcelType.id).all()
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.cemeteries = np.array([row[1] for row in rows], dtype=np.int64)
+        self.xs = np.array([row[2] for row in rows], dtype=np.int64)
+        self.ys = np.array([row[3] for row in rows], dtype=np.int64)
+        self.base = np.array([row[4] for row in rows], dtype=np.float64)
+        size = int(self.ids.max()) + 1 if len(self.ids) else 0
+        self.prices = np.full(size, np.nan)
+        self.zones = {zone.id: zone_rule(zone) for zone in PricingZone.query.all()}
+        self._assign(np.arange(len(self.ids)))
+        self.built = True
+
+    def _assign(self, idx):
+        """Przeliczenie cen dla wybranych pozycji tablic współrzędnych."""
+        ids = self.ids[idx]
+        self.prices[ids] = self.base[idx]
+        # strefy o wyższym priorytecie nadpisują ceny stref niższych
+        for rule in sorted(self.zones.values(), key=lambda z: (z.priority, z.id)):
+            self.prices[ids[self._rule_mask(rule, idx)]] = rule.price
+
+    def _rule_mask(self, rule, idx=slice(None)):
+        """Maska parceli strefy - tylko w obrębie cmentarza, do którego strefa należy."""
+        return (self.cemeteries[idx] == rule.cemetery_id) & \
+            zone_mask(rule, self.xs[idx], self.ys[idx])
+
+    def update_zone(self, old_rule, new_rule):
+        """Przeliczenie tylko tych parceli, które należały lub należą do zmienionej strefy."""
+        if not self.built:
+            return
+        affected = np.zeros(len(self.ids), dtype=bool)
+        if old_rule is not None:
+            affected |= self._rule_mask(old_rule)
+            self.zones.pop(old_rule.id, None)
+        if new_rule is not None:
+            affected |= self._rule_mask(new_rule)
+            self.zones[new_rule.id] = new_rule
+        self._assign(np.flatnonzero(affected))
+
+    def quote(self, parcel_ids):
+        """Wycena listy parceli - słownik {id parceli: cena}, None dla nieistniejących."""
+        ids = np.asarray(parcel_ids, dtype=np.int64)
+        valid = (ids >= 0) & (ids < len(self.prices))
+        prices = np.full(len(ids), np.nan)
+        prices[valid] = self.prices[ids[valid]]
+        return {int(p_id): (None if np.isnan(price) else float(price))
+                for p_id, price in zip(ids, prices)}
+
+
+price_map = PriceMap()
+# pojedynczy licznik zmian stref - ten sam mechanizm co znaczniki podsumowań użytkowników
+generation = SharedStamps(PRICING.GENERATION_PATH, 1)
+
+
+def quote_parcels(parcel_ids):
+    """Wycena wielu parceli naraz - mapa cen budowana przy pierwszym użyciu i po zmianie stref."""
+    if not price_map.built or price_map.generation != generation.get(0):
+        price_map.build()
+    return price_map.quote(parcel_ids)
+
+
+def parcel_price(parcel_id):
+    """Cena pojedynczej parceli."""
+    return quote_parcels([int(parcel_id)])[int(parcel_id)]
+
+
+def zone_changed(old_rule, new_rule, previous):
+    """Unieważnienie map cen innych procesów i przyrostowa aktualizacja własnej.
+
+    Własna mapa aktualizowana jest tylko wtedy, gdy nie przegapiła zmian z innych procesów
+    (licznik przed zmianą równy licznikowi mapy) - inaczej zostanie przebudowana.
+    """
+    generation.bump([0])
+    if price_map.built and price_map.generation == previous:
+        price_map.update_zone(old_rule, new_rule)
+        price_map.generation = previous + 1
+
+
+def save_zone(zone):
+    """Zapisanie nowej lub zmienionej strefy i przyrostowa aktualizacja mapy cen."""
+    old_rule = price_map.zones.get(zone.id)
+    previous = generation.get(0)
+    db.session.add(zone)
+    db.session.commit()
+    zone_changed(old_rule, zone_rule(zone), previous)
+
+
+def delete_zone(zone):
+    """Usunięcie strefy i przywrócenie wcześniejszych cen parceli z jej obszaru."""
+    old_rule = price_map.zones.get(zone.id, zone_rule(zone))
+    previous = generation.get(0)
+    db.session.delete(zone)
+    db.session.commit()
+    zone_changed(old_rule, None, previous)
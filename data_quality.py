@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Kontrola jakości danych grobów - te same reguły co NewGraveForm, dla całej tabeli naraz.
+
+Formularz sprawdza tylko nowo dodawane groby, a wiersze starsze i importowane nigdy nie były
+weryfikowane. Skaner czyta tabelę Grave partiami (DATA_QUALITY.CHUNK wierszy, stronicowanie po
+id) do tablic numpy i sprawdza reguły wektorowo:
+    name_format         imię / nazwisko puste lub spoza [A-Za-z -]
+    birth_missing       brak daty urodzenia (kolumna NOT NULL - wiersze z importów)
+    birth_future        data urodzenia późniejsza niż dzisiejsza
+    death_future        data śmierci późniejsza niż dzisiejsza
+    death_before_birth  data śmierci wcześniejsza niż data urodzenia
+    death_mmdd          death_mmdd niezgodne z datą śmierci (zapisy z pominięciem ORM)
+Naruszenia zapisywane są do raportu CSV (DATA_QUALITY.REPORT_PATH). Dla reguł, które da się
+bezpiecznie poprawić, skaner może dopisać propozycje poprawek do kolejki JSONL
+(DATA_QUALITY.FIX_QUEUE_PATH), zastosowywanej osobno - po przejrzeniu - przez ORM, więc
+zestawienia, podsumowania użytkowników i dziennik zmian pozostają spójne.
+Użycie: python3 data_quality.py [--fix]      - skanowanie (i kolejka poprawek)
+        python3 data_quality.py --apply PLIK  - zastosowanie kolejki poprawek
+"""
+# importy modułów py
+import collections
+import csv
+import datetime
+import json
+import os
+import re
+import numpy as np
+
+# importy nasze
+from audit_log import audit
+from config import DATA_QUALITY
+from db_models import db, Grave
+from search_cache import bump_search_generation
+
+NAME_PATTERN = re.compile(r'^[A-Za-z -]+$')
+NAT = np.iinfo(np.int64).min
+DATE_FIELDS = ('day_of_birth', 'day_of_death')
+
+# dozwolone bajty imion i nazwisk - znaki wielobajtowe UTF-8 (>= 0x80) są niedozwolone,
+# tak jak w wyrażeniu regularnym formularza
+ALLOWED = np.zeros(256, dtype=bool)
+ALLOWED[[ord(char) for char in 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz -']] = True
+
+Chunk = collections.namedtuple('Chunk', ['ids', 'names', 'last_names', 'birth', 'death',
+                                         'death_mmdd'])
+
+
+def invalid_names(values):
+    """Maska wartości pustych lub zawierających znaki spoza [A-Za-z -].
+
+    Wszystkie wartości łączone są w jeden bufor bajtów rozdzielony znakiem nowej linii,
+    a liczba niedozwolonych bajtów w każdej wartości liczona jest z sum skumulowanych.
+    """
+    if not values:
+        return np.zeros(0, dtype=bool)
+    buffer = np.frombuffer('\n'.join((value or '').replace('\n', '\0') for value in values)
+                           .encode('utf-8'), dtype=np.uint8)
+    separators = np.flatnonzero(buffer == 10)
+    starts = np.concatenate(([0], separators + 1))
+    ends = np.concatenate((separators, [len(buffer)]))
+    bad = ~ALLOWED[buffer]
+    bad[separators] = False
+    bad_count = np.concatenate(([0], np.cumsum(bad)))
+    return (ends == starts) | (bad_count[ends] > bad_count[starts])
+
+
+def day_numbers(dates):
+    """Daty (None -> NaT) jako liczby dni od 1970-01-01; NaT jako NAT."""
+    return np.array(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+def load_chunks(chunk_size=DATA_QUALITY.CHUNK):
+    """Tabela Grave partiami, jako tablice numpy."""
+    last_id = 0
+    while True:
+        rows = db.session.query(Grave.id, Grave.name, Grave.last_name, Grave.day_of_birth,
+                                Grave.day_of_death, Grave.death_mmdd)\
+            .filter(Grave.id > last_id).order_by(Grave.id).limit(chunk_size).all()
+        if not rows:
+            return
+        ids, names, last_names, birth, death, death_mmdd = zip(*rows)
+        yield Chunk(ids=np.array(ids, dtype=np.int64), names=list(names),
+                    last_names=list(last_names), birth=day_numbers(birth),
+                    death=day_numbers(death),
+                    death_mmdd=np.array([-1 if mmdd is None else mmdd for mmdd in death_mmdd],
+                                        dtype=np.int64))
+        last_id = rows[-1][0]
+
+
+def expected_mmdd(death):
+    """death_mmdd wyliczone z dat śmierci (dni od 1970-01-01); -1 dla NaT."""
+    dates = death.astype('datetime64[D]')
+    months = dates.astype('datetime64[M]')
+    mmdd = (months.astype(np.int64) % 12 + 1) * 100 + (dates - months).astype(np.int64) + 1
+    return np.where(death == NAT, -1, mmdd)
+
+
+def check_chunk(chunk, today):
+    """Maski naruszeń reguł dla jednej partii: {(reguła, pole): maska}."""
+    has_death = chunk.death != NAT
+    return collections.OrderedDict([
+        (('name_format', 'name'), invalid_names(chunk.names)),
+        (('name_format', 'last_name'), invalid_names(chunk.last_names)),
+        (('birth_missing', 'day_of_birth'), chunk.birth == NAT),
+        (('birth_future', 'day_of_birth'), (chunk.birth != NAT) & (chunk.birth > today)),
+        (('death_future', 'day_of_death'), has_death & (chunk.death > today)),
+        (('death_before_birth', 'day_of_death'),
+         has_death & (chunk.birth != NAT) & (chunk.death < chunk.birth)),
+        (('death_mmdd', 'death_mmdd'), chunk.death_mmdd != expected_mmdd(chunk.death)),
+    ])
+
+
+def field_value(chunk, field, i):
+    """Wartość pola wiersza i partii do raportu."""
+    if field in ('name', 'last_name'):
+        return getattr(chunk, field + 's')[i]
+    if field == 'death_mmdd':
+        return '' if chunk.death_mmdd[i] < 0 else int(chunk.death_mmdd[i])
+    days = chunk.birth[i] if field == 'day_of_birth' else chunk.death[i]
+    return '' if days == NAT else str(np.datetime64(int(days), 'D'))
+
+
+def proposed_fix(chunk, rule, field, i, today):
+    """Poprawka dla naruszenia albo None, gdy nie da się jej bezpiecznie ustalić."""
+    if rule == 'name_format':
+        # tabulatory, twarde spacje i nadmiarowe odstępy z importów
+        value = ' '.join((field_value(chunk, field, i) or '').split())
+        return {field: value} if NAME_PATTERN.match(value) else None
+    if rule == 'death_before_birth' and chunk.birth[i] <= today:
+        # zamienione pola dat
+        return {'day_of_birth': field_value(chunk, 'day_of_death', i),
+                'day_of_death': field_value(chunk, 'day_of_birth', i)}
+    if rule == 'death_mmdd':
+        mmdd = int(expected_mmdd(chunk.death[i:i + 1])[0])
+        return {'death_mmdd': None if mmdd < 0 else mmdd}
+    return None
+
+
+def scan(report_path=DATA_QUALITY.REPORT_PATH, fix_path=None, chunk_size=DATA_QUALITY.CHUNK):
+    """Pełne skanowanie tabeli Grave; zwraca liczby naruszeń dla reguł i liczbę poprawek."""
+    today = np.datetime64(datetime.date.today(), 'D').astype(np.int64)
+    counts = collections.Counter()
+    fixes = 0
+    for path in (report_path, fix_path):
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    fix_file = open(fix_path, 'w', encoding='utf-8') if fix_path else None
+    try:
+        with open(report_path, 'w', newline='', encoding='utf-8') as report_file:
+            report = csv.writer(report_file)
+            report.writerow(['grave_id', 'rule', 'field', 'value'])
+            for chunk in load_chunks(chunk_size):
+                for (rule, field), mask in check_chunk(chunk, today).items():
+                    rows = np.flatnonzero(mask)
+                    counts[rule] += len(rows)
+                    for i in rows:
+                        report.writerow([int(chunk.ids[i]), rule, field,
+                                         field_value(chunk, field, i)])
+                        fix = proposed_fix(chunk, rule, field, i, today) if fix_file else None
+                        if fix is not None:
+                            fix_file.write(json.dumps({'grave_id': int(chunk.ids[i]),
+                                                       'rule': rule, 'changes': fix}) + '\n')
+                            fixes += 1
+    finally:
+        if fix_file:
+            fix_file.close()
+    return counts, fixes
+
+
+def apply_fix_batch(batch):
+    """Zastosowanie partii poprawek przez ORM w jednej transakcji."""
+    graves = {grave.id: grave for grave in
+              Grave.query.filter(Grave.id.in_([fix['grave_id'] for fix in batch]))}
+    applied = []
+    for fix in batch:
+        grave = graves.get(fix['grave_id'])
+        if grave is None:
+            continue
+        for field, value in fix['changes'].items():
+            if field in DATE_FIELDS:
+                value = datetime.datetime.strptime(value, '%Y-%m-%d').date() if value else None
+            setattr(grave, field, value)
+        applied.append(fix)
+    db.session.commit()
+    for fix in applied:
+        audit('edit', 'grave', fix['grave_id'], 'quality:{}'.format(fix['rule']))
+    return len(applied)
+
+
+def apply_fixes(fix_path=DATA_QUALITY.FIX_QUEUE_PATH, batch_size=DATA_QUALITY.APPLY_BATCH):
+    """Zastosowanie kolejki poprawek; zwraca liczbę zastosowanych."""
+    applied = 0
+    batch = []
+    with open(fix_path, encoding='utf-8') as fix_file:
+        for line in fix_file:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) == batch_size:
+                applied += apply_fix_batch(batch)
+                batch = []
+    if batch:
+        applied += apply_fix_batch(batch)
+    if applied:
+        bump_search_generation()
+    return applied
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from main import app
+    app.app_context().push()
+    if '--apply' in sys.argv:
+        fix_path = sys.argv[sys.argv.index('--apply') + 1]
+        print('zastosowano poprawek: {}'.format(apply_fixes(fix_path)))
+    else:
+        started = time.monotonic()
+        counts, fixes = scan(fix_path=DATA_QUALITY.FIX_QUEUE_PATH if '--fix' in sys.argv
+                             else None)
+        for rule, count in sorted(counts.items()):
+            print('{:20} {}'.format(rule, count))
+        print('poprawek w kolejce: {}, czas: {:.1f} s'.format(fixes,
+                                                              time.monotonic() - started))
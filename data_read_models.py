@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Lekkie rekordy do widoków tylko do odczytu.
+
+Zapytania o pojedyncze kolumny nie trafiają do identity map sesji i nie są śledzone pod kątem
+zmian, a wynik przepisywany jest do krotek (namedtuple) - dużo tańszych niż pełne obiekty ORM.
+Dla mapy cmentarza dostępna jest dodatkowo wersja kolumnowa w tablicach numpy.
+"""
+# importy modułów py
+from collections import namedtuple
+import numpy as np
+
+# importy nasze
+from db_models import db, User, Grave, Parcel
+
+
+GraveRow = namedtuple('GraveRow', ['id', 'cemetery_id', 'user_id', 'parcel_id', 'name',
+                                   'last_name', 'day_of_birth', 'day_of_death'])
+ParcelRow = namedtuple('ParcelRow', ['id', 'cemetery_id', 'parcel_type_id', 'position_x',
+                                     'position_y'])
+UserEmailRow = namedtuple('UserEmailRow', ['id', 'email'])
+
+GRAVE_COLUMNS = [getattr(Grave, field) for field in GraveRow._fields]
+PARCEL_COLUMNS = [getattr(Parcel, field) for field in ParcelRow._fields]
+
+
+def grave_rows(query):
+    """Zamiana wyniku zapytania o kolumny grobu na listę GraveRow."""
+    return [GraveRow._make(row) for row in query]
+
+
+def user_graves(user_id):
+    """Groby danego użytkownika."""
+    return grave_rows(db.session.query(*GRAVE_COLUMNS).filter(Grave.user_id == user_id)
+                      .order_by(Grave.id))
+
+
+def all_graves(cemetery_id=None):
+    """Wszystkie groby (opcjonalnie tylko z jednego cmentarza)."""
+    query = db.session.query(*GRAVE_COLUMNS)
+    if cemetery_id is not None:
+        query = query.filter(Grave.cemetery_id == cemetery_id)
+    return grave_rows(query.order_by(Grave.id))
+
+
+def parcel_query(cemetery_id=None):
+    """Zapytanie o kolumny parceli (opcjonalnie tylko z jednego cmentarza)."""
+    query = db.session.query(*PARCEL_COLUMNS)
+    if cemetery_id is not None:
+        query = query.filter(Parcel.cemetery_id == cemetery_id)
+    return query.order_by(Parcel.id)
+
+
+def all_parcels(cemetery_id=None):
+    """Wszystkie parcele."""
+    return [ParcelRow._make(row) for row in parcel_query(cemetery_id)]
+
+
+def parcel_columns(cemetery_id=None):
+    """Parcele w postaci kolumnowej - słownik tablic numpy o wspólnym indeksie."""
+    rows = parcel_query(cemetery_id).all()
+    return {field: np.array([row[i] for row in rows], dtype=np.int64)
+            for i, field in enumerate(ParcelRow._fields)}
+
+
+def active_user_emails(batch_size=1000):
+    """Adresy aktywnych użytkowników, pobierane strumieniowo partiami."""
+    query = db.session.query(User.id, User.email).filter(User.active_user.is_(True))\
+        .yield_per(batch_size)
+    for row in query:
+        yield UserEmailRow._make(row)
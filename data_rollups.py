@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Zestawienia (rollupy) zajętości, przychodów i zgonów dla panelu administratora.
+
+Tabele ParcelRollup, RevenueRollup i DeathsRollup aktualizowane są przyrostowo w zdarzeniu
+after_flush sesji - w tej samej transakcji co zmiana grobu lub płatności - więc panel czyta
+kilka wierszy zamiast skanować Parcel, Grave i Payments.
+Operacje z pominięciem ORM (masowe DELETE / UPDATE) nie wywołują zdarzeń, dlatego okresowo
+(np. cron: python3 data_rollups.py) zestawienia przeliczane są od nowa - reconcile().
+"""
+# importy modułów py
+from sqlalchemy import event, and_, func, select, extract, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+# importy nasze
+from db_models import db, Grave, Parcel, Payments, ParcelRollup, RevenueRollup, DeathsRollup
+
+
+def apply_delta(connection, model, keys, deltas):
+    """UPDATE kolumna = kolumna + delta, a gdy wiersza jeszcze nie ma - INSERT.
+
+    INSERT wykonywany jest w punkcie zapisu (SAVEPOINT): gdy równoległa transakcja wstawiła
+    ten sam klucz pierwsza, wycofywany jest tylko INSERT, a delta dodawana UPDATE-em do jej
+    wiersza - bez przerywania transakcji zapisu grobu lub płatności.
+    """
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    table = model.__table__
+    update = table.update()\
+        .where(and_(*[table.c[column] == value for column, value in keys.items()]))\
+        .values({column: table.c[column] + delta for column, delta in deltas.items()})
+    if connection.execute(update).rowcount:
+        return
+    savepoint = connection.begin_nested()
+    try:
+        connection.execute(table.insert().values(dict(keys, **deltas)))
+    except IntegrityError:
+        savepoint.rollback()
+        connection.execute(update)
+    else:
+        savepoint.commit()
+
+
+def parcel_type_of(connection, parcel_id):
+    """Typ parceli grobu."""
+    return connection.execute(select([Parcel.parcel_type_id])
+                              .where(Parcel.id == parcel_id)).scalar()
+
+
+def grave_deltas(connection, grave, sign):
+    """Zmiana zestawień po dodaniu (sign=1) lub usunięciu (sign=-1) grobu."""
+    apply_delta(connection, ParcelRollup,
+                {'cemetery_id': grave.cemetery_id,
+                 'parcel_type_id': parcel_type_of(connection, grave.parcel_id)},
+                {'taken': sign})
+    if grave.day_of_death:
+        apply_delta(connection, DeathsRollup,
+                    {'cemetery_id': grave.cemetery_id, 'year': grave.day_of_death.year},
+                    {'deaths': sign})
+
+
+def payment_deltas(connection, payment, sign, amount=None, paid=None):
+    """Zmiana przychodów - domyślnie o całą płatność, przy edycji o różnice kwot."""
+    amount = payment.payment_amount if amount is None else amount
+    paid = payment.amount_paid if paid is None else paid
+    apply_delta(connection, RevenueRollup, {'cemetery_id': payment.cemetery_id},
+                {'collected': sign * paid, 'outstanding': sign * (amount - paid)})
+
+
+def history_change(obj, attribute):
+    """(stara, nowa) wartość atrybutu zmienionego w tej transakcji albo None."""
+    history = inspect(obj).attrs[attribute].history
+    if not history.added:
+        return None
+    return (history.deleted[0] if history.deleted else None), history.added[0]
+
+
+@event.listens_for(Session, 'after_flush')
+def update_rollups(session, flush_context):
+    """Przyrostowa aktualizacja zestawień w tej samej transakcji co zapis."""
+    connection = session.connection()
+    for obj in session.new:
+        if isinstance(obj, Grave):
+            grave_deltas(connection, obj, 1)
+        elif isinstance(obj, Payments):
+            payment_deltas(connection, obj, 1)
+    for obj in session.deleted:
+        if isinstance(obj, Grave):
+            grave_deltas(connection, obj, -1)
+        elif isinstance(obj, Payments):
+            payment_deltas(connection, obj, -1)
+    for obj in session.dirty:
+        if isinstance(obj, Grave):
+            change = history_change(obj, 'day_of_death')
+            if change:
+                old, new = change
+                for day, sign in ((old, -1), (new, 1)):
+                    if day:
+                        apply_delta(connection, DeathsRollup,
+                                    {'cemetery_id': obj.cemetery_id, 'year': day.year},
+                                    {'deaths': sign})
+        elif isinstance(obj, Payments):
+            amount = history_change(obj, 'payment_amount')
+            paid = history_change(obj, 'amount_paid')
+            if amount or paid:
+                amount_delta = amount[1] - (amount[0] or 0) if amount else 0
+                paid_delta = paid[1] - (paid[0] or 0) if paid else 0
+                payment_deltas(connection, obj, 1, amount_delta, paid_delta)
+
+
+def reconcile():
+    """Pełne przeliczenie zestawień z tabel źródłowych (w jednej transakcji)."""
+    parcels = db.session.query(Parcel.cemetery_id, Parcel.parcel_type_id, func.count(Parcel.id),
+                               func.count(Grave.id))\
+        .outerjoin(Grave, Grave.parcel_id == Parcel.id)\
+        .group_by(Parcel.cemetery_id, Parcel.parcel_type_id).all()
+    revenue = db.session.query(Payments.cemetery_id, func.sum(Payments.amount_paid),
+                               func.sum(Payments.payment_amount - Payments.amount_paid))\
+        .group_by(Payments.cemetery_id).all()
+    year = extract('year', Grave.day_of_death)
+    deaths = db.session.query(Grave.cemetery_id, year, func.count(Grave.id))\
+        .filter(Grave.day_of_death.isnot(None))\
+        .group_by(Grave.cemetery_id, year).all()
+    for model in (ParcelRollup, RevenueRollup, DeathsRollup):
+        db.session.query(model).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(ParcelRollup, [
+        {'cemetery_id': c, 'parcel_type_id': t, 'total': total, 'taken': taken}
+        for c, t, total, taken in parcels])
+    db.session.bulk_insert_mappings(RevenueRollup, [
+        {'cemetery_id': c, 'collected': collected or 0, 'outstanding': outstanding or 0}
+        for c, collected, outstanding in revenue])
+    db.session.bulk_insert_mappings(DeathsRollup, [
+        {'cemetery_id': c, 'year': int(y), 'deaths': count} for c, y, count in deaths])
+    db.session.commit()
+
+
+def dashboard(cemetery_id):
+    """Dane panelu statystyk - wyłącznie odczyt z zestawień."""
+    return {'parcels': ParcelRollup.query.filter_by(cemetery_id=cemetery_id)
+                                         .order_by(ParcelRollup.parcel_type_id).all(),
+            'revenue': RevenueRollup.query.get(cemetery_id),
+            'deaths': DeathsRollup.query.filter_by(cemetery_id=cemetery_id)
+                                        .order_by(DeathsRollup.year.desc()).all()}
+
+
+if __name__ == '__main__':
+    from main import app
+    app.app_context().push()
+    reconcile()
+    print('przeliczono zestawienia')
@@ -8,7 +8,8 @@ from flask import abort
 from flask_login import current_user
 from functools import wraps
 from urllib.parse import urlparse
-from wtforms import Form, StringField, PasswordField, IntegerField, RadioField
+from wtforms import Form, StringField, PasswordField, IntegerField, RadioField, SelectField, \
+    FloatField
 from wtforms.fields.html5 import DateField
 from wtforms.validators import ValidationError, input_required, email, length, equal_to, Optional
 
@@ -126,6 +127,33 @@ class ObituaryForm(Form):
     gender = RadioField('Płeć', choices=[('man', 'Mężczyzna'), ('woman', 'Kobieta')], default='man')
 
 
+class ZoneForm(Form):
+    """Klasa wtforms do walidacji stref cenowych (PricingZone) - puste granice to brak granicy."""
+    def validate(self):
+        valid = super().validate()
+        if self.kind.data == 'gate':
+            for field in (self.gate_x, self.gate_y, self.radius):
+                if field.data is None:
+                    field.errors.append('Pole wymagane dla strefy przy bramie!')
+                    valid = False
+        return valid
+
+    name = StringField('Nazwa', [input_required(message='Pole wymagane!'), length(max=120)],
+                       render_kw={'required': True})
+    kind = SelectField('Rodzaj', choices=[('rect', 'Prostokąt'), ('rows', 'Rzędy'),
+                                          ('gate', 'Przy bramie')])
+    x_min = IntegerField('Rząd od', [Optional()])
+    x_max = IntegerField('Rząd do', [Optional()])
+    y_min = IntegerField('Kolumna od', [Optional()])
+    y_max = IntegerField('Kolumna do', [Optional()])
+    gate_x = IntegerField('Brama - rząd', [Optional()])
+    gate_y = IntegerField('Brama - kolumna', [Optional()])
+    radius = FloatField('Promień', [Optional()])
+    price = FloatField('Cena', [input_required(message='Pole wymagane!')],
+                       render_kw={'required': True, 'type': 'number', 'min': 0, 'step': '0.01'})
+    priority = IntegerField('Priorytet', [Optional()], default=0)
+
+
 class NewGraveForm(Form):
     """Klasa wtforms do walidacji danych dotyczących grobu."""
     def name_validator(self, field):
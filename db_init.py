@@ -5,13 +5,14 @@
 Uwaga - tylko do jednokrotnego użycia gdy baza danych nie istnieje!!!
 """
 # importy modułów py
-import itertools
 from sqlalchemy import event
 import numpy as np
 
 # importy nasze
 from main import app, db
-from db_models import Parcel, ParcelType
+from data_occupancy import rebuild_all
+from data_rollups import reconcile
+from db_models import Cemetery, Parcel, ParcelType, PricingZone
 
 
 app.app_context().push()
@@ -19,32 +20,37 @@ db.create_all()
 print('utworzono bazę danych')
 
 print('tworzenie danych dodatkowych')
+def insert_initial_cemetery(max_p, name='Cmentarz XYZ'):
+    """Funkcja tworząca cmentarz, zwraca jego id."""
+    cemetery = Cemetery(name=name, size=max_p)
+    db.session.add(cemetery)
+    db.session.commit()
+    return cemetery.id
+
+
 @event.listens_for(Parcel.__table__, 'after_create')
-def insert_initial_coordinates(max_p):
-    """Funkcja generująca koordynaty dla cmentarza o wymiarach 1 x max_p."""
-    xvalues = np.arange(1, max_p + 1, 1)
-    yvalues = np.arange(1, max_p + 1, 1)
-    coordinates = list(itertools.product(xvalues, yvalues))
-
-    for pair in coordinates:
-        if (int(pair[1]) == 1) or \
-                (int(pair[0]) in np.arange(1, ((1 + max_p) * max_p), max_p)) or \
-                (int(pair[0]) in np.arange(max_p, max_p * max_p, max_p)) or \
-                (int(pair[1]) == max_p + 1):
-            new_parcel = Parcel(parcel_type_id=1,
-                                position_x=int(pair[0]),
-                                position_y=int(pair[1]))
-        else:
-            new_parcel = Parcel(parcel_type_id=2,
-                                position_x=int(pair[0]),
-                                position_y=int(pair[1]))
-        db.session.add(new_parcel)
-        db.session.commit()
+def insert_initial_coordinates(max_p, cemetery_id):
+    """Funkcja generująca koordynaty dla cmentarza o wymiarach max_p x max_p.
+
+    Typ parceli (brzegowa / wewnętrzna) wyznaczany jest wektorowo dla całej siatki, tak jak
+    w pierwotnej pętli: brzegowe są parcele z x == 1, x == max_p lub y == 1 (warunek
+    y == max_p + 1 nigdy nie był spełniony, więc ostatnia kolumna pozostaje wewnętrzna).
+    """
+    xvalues, yvalues = np.meshgrid(np.arange(1, max_p + 1), np.arange(1, max_p + 1), indexing='ij')
+    xvalues, yvalues = xvalues.ravel(), yvalues.ravel()
+    border = (xvalues == 1) | (xvalues == max_p) | (yvalues == 1)
+    parcel_types = np.where(border, 1, 2)
+    db.session.bulk_insert_mappings(Parcel, [{'cemetery_id': cemetery_id,
+                                              'parcel_type_id': int(p_type),
+                                              'position_x': int(x),
+                                              'position_y': int(y)}
+                                             for x, y, p_type in zip(xvalues, yvalues, parcel_types)])
+    db.session.commit()
 
 
 @event.listens_for(ParcelType.__table__, 'after_create')
 def insert_initial_types():
-    """Funkcja tworząca dwa typy parceli."""
+    """Funkcja tworząca dwa typy parceli - ceny bazowe poza strefami premium."""
     border_type = ParcelType(price=150,
                              description='Border position')
     inner_type = ParcelType(price=100,
@@ -54,6 +60,25 @@ def insert_initial_types():
     db.session.commit()
 
 
-insert_initial_coordinates(10)
+def insert_initial_zones(max_p, cemetery_id):
+    """Funkcja tworząca przykładową strefę premium - parcele najbliżej bramy głównej."""
+    gate_zone = PricingZone(cemetery_id=cemetery_id,
+                            name='Przy bramie głównej',
+                            kind='gate',
+                            gate_x=1,
+                            gate_y=(max_p + 1) // 2,
+                            radius=2,
+                            price=200,
+                            priority=1)
+    db.session.add(gate_zone)
+    db.session.commit()
+
+
+default_cemetery = insert_initial_cemetery(10)
+insert_initial_coordinates(10, default_cemetery)
 insert_initial_types()
+insert_initial_zones(10, default_cemetery)
+reconcile()
+# plik mapy mógł pozostać po poprzedniej bazie
+rebuild_all()
 print('zakonczono cały proces :)')
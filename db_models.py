@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 """Plik z tabelami do SQLAlchemy."""
+import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event, inspect, exists, and_
 from config import DB
 
 db = SQLAlchemy()
@@ -11,6 +13,9 @@ db = SQLAlchemy()
 class User(UserMixin, db.Model):
     """Tabela użytkownika."""
 
+    # niepotwierdzone konta starsze niż ważność linku aktywacyjnego (data_cleanup)
+    __table_args__ = (db.Index('ix_user_active_created', 'active_user', 'created_at'),)
+
     id = db.Column(db.Integer, primary_key=True)
     active_user = db.Column(db.Boolean, default=DB.DEFAULT_ACTIVE_USER)
     token_id = db.Column(db.Text, unique=True)
@@ -24,28 +29,67 @@ class User(UserMixin, db.Model):
     house_number = db.Column(db.Integer)
     flat_number = db.Column(db.Integer)
     admin = db.Column(db.Boolean, default=False)
+    # rejestracja lub ponowne wysłanie linku aktywacyjnego
+    created_at = db.Column(db.DateTime, default=datetime.datetime.now)
 
     def get_id(self):
         """Zmiana domyślnego pobierania id podczas logowania na token."""
         return self.token_id
 
 
+class Cemetery(db.Model):
+    """Tabela cmentarzy - każdy cmentarz to osobna partycja parceli, grobów, płatności i nekrologów."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    city = db.Column(db.String(80))
+    # długość boku siatki parceli
+    size = db.Column(db.Integer, nullable=False)
+
+
 class Grave(db.Model):
     """Tabela właściwości grobów."""
 
+    __table_args__ = (db.Index('ix_grave_cemetery_last_name', 'cemetery_id', 'last_name'),
+                      db.Index('ix_grave_death_mmdd', 'death_mmdd'),
+                      db.Index('ix_grave_cemetery_search', 'cemetery_id', 'last_name_search',
+                               'name_search'))
+
     id = db.Column(db.Integer, primary_key=True)
+    cemetery_id = db.Column(db.Integer, db.ForeignKey('cemetery.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     parcel_id = db.Column(db.Integer, db.ForeignKey('parcel.id'), nullable=False, unique=True)
     name = db.Column(db.String(80), nullable=False)
     last_name = db.Column(db.String(120), nullable=False)
     day_of_birth = db.Column(db.Date(), nullable=False)
     day_of_death = db.Column(db.Date(), nullable=True)
+    # miesiąc * 100 + dzień śmierci - indeksowane wyszukiwanie rocznic
+    death_mmdd = db.Column(db.SmallInteger, nullable=True)
+    # imię i nazwisko bez wielkości liter i znaków diakrytycznych - wyszukiwarka (search_cache)
+    name_search = db.Column(db.String(80), nullable=True)
+    last_name_search = db.Column(db.String(120), nullable=True)
+    # usunięcie grobu usuwa obserwujących go (Family) i płatności za jego parcelę
+    family = db.relationship('Family', backref='grave', cascade='all, delete-orphan')
+    payments = db.relationship('Payments', cascade='all, delete-orphan',
+                               primaryjoin='Grave.parcel_id == foreign(Payments.parcel_id)')
+
+
+@event.listens_for(Grave, 'before_insert')
+@event.listens_for(Grave, 'before_update')
+def set_death_mmdd(mapper, connection, grave):
+    """Uzupełnienie death_mmdd przy każdym zapisie grobu."""
+    grave.death_mmdd = (grave.day_of_death.month * 100 + grave.day_of_death.day
+                        if grave.day_of_death else None)
 
 
 class Parcel(db.Model):
     """Tabela odnoszona do Grave - współrzędne grobów."""
 
+    __table_args__ = (db.Index('ix_parcel_cemetery_position', 'cemetery_id', 'position_x',
+                               'position_y', unique=True),)
+
     id = db.Column(db.Integer, primary_key=True)
+    cemetery_id = db.Column(db.Integer, db.ForeignKey('cemetery.id'), nullable=False)
     parcel_type_id = db.Column(db.Integer, db.ForeignKey('parcel_type.id'), nullable=False)
     position_x = db.Column(db.Integer, nullable=False)
     position_y = db.Column(db.Integer, nullable=False)
@@ -57,25 +101,113 @@ class ParcelType(db.Model):
     description = db.Column(db.String(120))
 
 
+class PricingZone(db.Model):
+    """Tabela stref cenowych (premium) - reguły geometryczne nakładane na parcele."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    cemetery_id = db.Column(db.Integer, db.ForeignKey('cemetery.id'), nullable=False, index=True)
+    name = db.Column(db.String(120), nullable=False)
+    # rect // rows // gate
+    kind = db.Column(db.String(5), nullable=False)
+    x_min = db.Column(db.Integer)
+    x_max = db.Column(db.Integer)
+    y_min = db.Column(db.Integer)
+    y_max = db.Column(db.Integer)
+    gate_x = db.Column(db.Integer)
+    gate_y = db.Column(db.Integer)
+    radius = db.Column(db.Float)
+    price = db.Column(db.Float, nullable=False)
+    # przy nakładających się strefach wygrywa wyższy priorytet
+    priority = db.Column(db.Integer, nullable=False, default=0)
+
+
 class Family(db.Model):
+    __table_args__ = (db.Index('ix_family_grave_user', 'grave_id', 'user_id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    grave_id = db.Column(db.Integer, db.ForeignKey('grave.id'), nullable=False)
+    grave_id = db.Column(db.Integer, db.ForeignKey('grave.id', ondelete='CASCADE'),
+                         nullable=False)
 
 
 class Payments(db.Model):
     """Tabela dotycząca płatności."""
 
+    __table_args__ = (db.Index('ix_payments_cemetery_user', 'cemetery_id', 'user_id'),)
+
     id = db.Column(db.Integer, primary_key=True)
+    cemetery_id = db.Column(db.Integer, db.ForeignKey('cemetery.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     parcel_id = db.Column(db.Integer, db.ForeignKey('parcel.id'), nullable=False)
     date_of_payments = db.Column(db.DateTime(), nullable=False)
+    # pending // partial // paid
     status = db.Column(db.String(120), nullable=False)
-    payment_amount = db.Column(db.Float, nullable=False)
-    amount_paid = db.Column(db.Float, nullable=False)
+    # kwoty w groszach - bez błędów zaokrągleń liczb zmiennoprzecinkowych
+    payment_amount = db.Column(db.BigInteger, nullable=False)
+    amount_paid = db.Column(db.BigInteger, nullable=False, default=0)
     payment_date = db.Column(db.DateTime(), nullable=False)
 
 
+class LedgerEntry(db.Model):
+    """Księga wpłat (tylko dopisywanie) - klucz idempotencji chroni przed podwójnym wpisem."""
+
+    __table_args__ = (db.Index('ix_ledger_entry_unmatched', 'payment_id', 'id'),
+                      db.Index('ix_ledger_entry_unreconciled', 'reconciled_at', 'id'))
+
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(120), nullable=False, unique=True)
+    # przypisywane raz, przy uzgadnianiu z płatnością
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'), nullable=True)
+    # kwota w groszach (ujemna dla zwrotów)
+    amount = db.Column(db.BigInteger, nullable=False)
+    # bank // manual
+    source = db.Column(db.String(10), nullable=False)
+    # tytuł przelewu lub opis wpisu
+    title = db.Column(db.String(255))
+    booked_at = db.Column(db.DateTime(), nullable=False)
+    created_at = db.Column(db.DateTime(), nullable=False)
+    # ustawiane raz, przy uzgadnianiu - także dla wpisu niedopasowanego (nie wraca do kolejki)
+    reconciled_at = db.Column(db.DateTime())
+
+
+@event.listens_for(LedgerEntry, 'before_update')
+def ledger_entry_update(mapper, connection, entry):
+    """Jedyną dozwoloną zmianą wpisu jest jednorazowe uzgodnienie (przypisanie płatności)."""
+    state = inspect(entry)
+    for attribute in state.attrs:
+        history = attribute.history
+        if not history.has_changes():
+            continue
+        if attribute.key not in ('payment_id', 'reconciled_at') or \
+                (history.deleted and history.deleted[0] is not None):
+            raise ValueError('Wpisy księgi wpłat nie mogą być zmieniane!')
+
+
+@event.listens_for(LedgerEntry, 'before_delete')
+def ledger_entry_delete(mapper, connection, entry):
+    """Wpisy księgi nie są usuwane - korekta to nowy wpis z ujemną kwotą."""
+    raise ValueError('Wpisy księgi wpłat nie mogą być usuwane!')
+
+
+# płatność z przypisanymi wpłatami z księgi - nie jest usuwana (ani kaskadą, ani masowo)
+PAYMENT_BOOKED = exists().where(LedgerEntry.payment_id == Payments.id)
+# grób, którego parcela ma płatność z przypisanymi wpłatami
+GRAVE_BOOKED = exists().where(and_(Payments.parcel_id == Grave.parcel_id,
+                                   LedgerEntry.payment_id == Payments.id))
+
+
+class BookedPaymentError(ValueError):
+    """Usunięcie płatności (lub grobu, użytkownika), do której przypisano wpłaty z księgi."""
+
+
+@event.listens_for(Payments, 'before_delete')
+def payment_delete(mapper, connection, payment):
+    """Blokada usunięcia płatności z wpłatami - także przez kaskadę Grave.payments."""
+    if connection.execute(LedgerEntry.__table__.select()
+                          .where(LedgerEntry.payment_id == payment.id).limit(1)).first():
+        raise BookedPaymentError('Płatność {} ma zaksięgowane wpłaty!'.format(payment.id))
+
+
 class Messages(db.Model):
     """Tabela przechowująca posty administratora na stronę główną."""
 
@@ -88,11 +220,96 @@ class Messages(db.Model):
 class Obituaries(db.Model):
     """Tabela do przechowywania nekrologów."""
 
+    __table_args__ = (db.Index('ix_obituaries_cemetery_funeral', 'cemetery_id', 'funeral_date'),)
+
     id = db.Column(db.Integer, primary_key=True)
+    cemetery_id = db.Column(db.Integer, db.ForeignKey('cemetery.id'), nullable=False)
     name = db.Column(db.String(80), nullable=False)
     surname = db.Column(db.String(120), nullable=False)
     # man // woman
     gender = db.Column(db.String(5))
     years_old = db.Column(db.Integer)
     death_date = db.Column(db.DateTime(), nullable=False)
+    # osobny indeks dla zadania archiwizacji (wybór po dacie bez względu na cmentarz)
+    funeral_date = db.Column(db.DateTime(), nullable=False, index=True)
+
+
+class ObituariesArchive(db.Model):
+    """Archiwum nekrologów po pogrzebie - partycjonowane miesiącem pogrzebu (archive_month)."""
+
+    __table_args__ = (db.Index('ix_obituaries_archive_cemetery_month', 'cemetery_id',
+                               'archive_month'),
+                      db.Index('ix_obituaries_archive_cemetery_surname', 'cemetery_id',
+                               'surname'))
+
+    id = db.Column(db.Integer, primary_key=True)
+    # id z Obituaries - niejednoznaczne, SQLite nadaje ponownie id usuniętych wierszy
+    obituary_id = db.Column(db.Integer, nullable=False)
+    cemetery_id = db.Column(db.Integer, db.ForeignKey('cemetery.id'), nullable=False)
+    # rok * 100 + miesiąc pogrzebu
+    archive_month = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(80), nullable=False)
+    surname = db.Column(db.String(120), nullable=False)
+    gender = db.Column(db.String(5))
+    years_old = db.Column(db.Integer)
+    death_date = db.Column(db.DateTime(), nullable=False)
     funeral_date = db.Column(db.DateTime(), nullable=False)
+    archived_at = db.Column(db.DateTime(), nullable=False)
+
+
+class AuditLog(db.Model):
+    """Tabela dziennika zmian (kto, co i kiedy utworzył, zmienił lub usunął)."""
+
+    __table_args__ = (db.Index('ix_audit_log_entity', 'entity', 'entity_id', 'created_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    # create // edit // delete
+    action = db.Column(db.String(10), nullable=False)
+    # grave // obituary // message // payment // zone
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime(), nullable=False, index=True)
+    details = db.Column(db.Text)
+
+
+class JobRun(db.Model):
+    """Tabela przebiegów zadań okresowych - wznawianie przerwanych i pomijanie wykonanych."""
+
+    __table_args__ = (db.UniqueConstraint('name', 'day'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    day = db.Column(db.Date(), nullable=False)
+    # running // done
+    status = db.Column(db.String(10), nullable=False)
+    # ostatni przetworzony klucz (np. id użytkownika) - punkt wznowienia
+    cursor = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(), nullable=False)
+
+
+class ParcelRollup(db.Model):
+    """Zestawienie parceli - liczba wszystkich i zajętych wg cmentarza i typu parceli."""
+
+    cemetery_id = db.Column(db.Integer, db.ForeignKey('cemetery.id'), primary_key=True)
+    parcel_type_id = db.Column(db.Integer, db.ForeignKey('parcel_type.id'), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    taken = db.Column(db.Integer, nullable=False, default=0)
+
+
+class RevenueRollup(db.Model):
+    """Zestawienie płatności - kwoty wpłacone i zaległe wg cmentarza."""
+
+    cemetery_id = db.Column(db.Integer, db.ForeignKey('cemetery.id'), primary_key=True)
+    # grosze
+    collected = db.Column(db.BigInteger, nullable=False, default=0)
+    outstanding = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class DeathsRollup(db.Model):
+    """Zestawienie liczby zgonów wg cmentarza i roku."""
+
+    cemetery_id = db.Column(db.Integer, db.ForeignKey('cemetery.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    deaths = db.Column(db.Integer, nullable=False, default=0)
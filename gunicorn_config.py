@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Konfiguracja gunicorn: gunicorn -c gunicorn_config.py main:app
+
+Rozgrzewanie (template_cache.warm_up) uruchamiane jest w każdym workerze po fork, także przy
+--preload, gdy main importowany jest raz w procesie nadrzędnym.
+Domyślnie gunicorn przyjmuje połączenia bezpośrednio (APP.IP:APP.PORT). Za serwerem proxy
+(nginx, także przed async_server.py) trzeba ustawić zmienną środowiskową PROXY_COUNT=1 - adres
+klienta dla limitów żądań i /admission/stats brany jest wtedy z X-Forwarded-For, a gunicorn
+powinien nasłuchiwać tylko na 127.0.0.1, żeby nagłówka nie dało się podać z pominięciem proxy.
+"""
+# importy nasze
+from config import APP, TEMPLATES
+
+bind = '{}:{}'.format(APP.IP, APP.PORT)
+
+
+def post_fork(server, worker):
+    """Rozgrzanie świeżo uruchomionego workera przed przyjęciem pierwszego żądania."""
+    if TEMPLATES.WARM_UP_ON_START:
+        from main import app
+        from template_cache import warm_up
+        warm_up(app)
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """Moduł do obsługi wysyłania e-maili."""
+import json
+import urllib.request
 from flask_mail import Mail, Message
-from config import EMAIL
+from config import EMAIL, ASYNC
 
 mail = Mail()
 
@@ -14,7 +16,11 @@ def common_msg(title, send_to, filename, *args):
     send_to = adresat,
     filename = nazwa pliku w folderze static/emails,
     *args - parametry dodawane do formatki
+    Gdy działa serwer async (ASYNC.MAIL_URL), wiadomość trafia do jego kolejki i worker
+    nie czeka na serwer SMTP.
     """
+    if ASYNC.MAIL_URL and queue_msg(title, send_to, filename, *args):
+        return
     msg = Message(title, recipients=[send_to])
     with open('{}{}'.format(EMAIL.FILES_PATH, filename), 'r') as file:
         message = file.read().format(*args)
@@ -22,6 +28,19 @@ def common_msg(title, send_to, filename, *args):
     mail.send(msg)
 
 
+def queue_msg(title, send_to, filename, *args):
+    """Przekazanie wiadomości do kolejki serwera async, False gdy jest niedostępny."""
+    data = json.dumps({'title': title, 'send_to': send_to, 'filename': filename,
+                       'args': list(args)}).encode()
+    request = urllib.request.Request(ASYNC.MAIL_URL, data,
+                                     {'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=2) as response:
+            return response.status == 202
+    except OSError:
+        return False
+
+
 def msg_to_all_users(subject, message, users):
     """Wiadomość wysyłana do wszystkich aktywnych użytkowników."""
     with mail.connect() as conn:
@@ -32,3 +51,16 @@ def msg_to_all_users(subject, message, users):
                           body=message,
                           subject=subject)
             conn.send(msg)
+
+
+def file_msg(title, send_to, filename, *args):
+    """Przygotowanie (bez wysyłania) wiadomości z formatki w folderze static/emails."""
+    with open('{}{}'.format(EMAIL.FILES_PATH, filename), 'r') as file:
+        return Message(title, recipients=[send_to], body=file.read().format(*args))
+
+
+def msg_batch(messages):
+    """Wysyłanie wielu wiadomości jednym połączeniem SMTP."""
+    with mail.connect() as conn:
+        for msg in messages:
+            conn.send(msg)
@@ -4,6 +4,7 @@
 
 # importy modułów py
 from flask import Flask
+from werkzeug.contrib.fixers import ProxyFix
 
 # importy nasze
 from views import pages
@@ -11,11 +12,24 @@ from views_admin import pages_admin
 from views_ajax import pages_ajax
 from views_login_system import pages_log_sys, login_manager
 from views_user import pages_user
+from views_map import pages_map
+from views_zombie import pages_zombie
 from mail_sending import mail
+from static_assets import pages_assets, init_assets
+from audit_log import writer as audit_writer
+from cemeteries import cemetery_choices
+from rate_limit import init_rate_limit
+from admission import pages_admission, init_admission
+from template_cache import init_template_cache
+from profiler import init_profiler
+from name_index import init_name_index
 from db_models import db
 from config import DB, APP, EMAIL
 
 app = Flask(__name__)
+if APP.PROXY_COUNT:
+    # adres klienta (limity żądań, dostęp do statystyk) zamiast adresu serwera proxy
+    app.wsgi_app = ProxyFix(app.wsgi_app, num_proxies=APP.PROXY_COUNT)
 
 app.config['SQLALCHEMY_DATABASE_URI'] = DB.PATH
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = DB.TRACK_MODIFICATIONS
@@ -32,9 +46,21 @@ app.register_blueprint(pages_admin)
 app.register_blueprint(pages_ajax)
 app.register_blueprint(pages_log_sys)
 app.register_blueprint(pages_user)
+app.register_blueprint(pages_map)
+app.register_blueprint(pages_zombie)
+app.register_blueprint(pages_assets)
+app.register_blueprint(pages_admission)
 login_manager.init_app(app)
 mail.init_app(app)
 db.init_app(app)
+init_assets(app)
+init_name_index(app)
+audit_writer.init_app(app)
+app.add_template_global(cemetery_choices)
+init_rate_limit(app)
+init_admission(app)
+init_template_cache(app)
+init_profiler(app)
 
 if __name__ == '__main__':
     app.run(host=APP.IP, port=APP.PORT, debug=APP.DEBUG)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Jednorazowe przejście istniejącej bazy na wiele cmentarzy.
+
+Tabele grave, parcel, payments i obituaries mają teraz kolumnę cemetery_id (klucz obcy do nowej
+tabeli cemetery, NOT NULL) - db.create_all() nie dodaje kolumn do istniejących tabel. Skrypt
+tworzy tabelę cemetery z cmentarzem domyślnym (CEMETERY.DEFAULT_ID), dodaje brakujące kolumny
+cemetery_id z wartością cmentarza domyślnego dla istniejących wierszy oraz indeksy z modelu.
+Uruchomić raz, po wdrożeniu nowego modelu, przed migrate_payment_amounts.py:
+    python3 migrate_cemeteries.py
+Ponowne uruchomienie niczego nie zmienia - dodawane są tylko brakujące kolumny i indeksy
+(indeksy obejmujące kolumny jeszcze nieistniejące w bazie pomijane są do kolejnego uruchomienia).
+Na koniec przeliczane są zestawienia i mapy zajętości, a lista cmentarzy unieważniana
+we wszystkich procesach.
+"""
+# importy modułów py
+from sqlalchemy import func, inspect
+
+# importy nasze
+from cemeteries import generation
+from config import CEMETERY
+from data_occupancy import rebuild_all
+from data_rollups import reconcile
+from db_models import Cemetery, Grave, Obituaries, Parcel, Payments
+from main import app, db
+
+MODELS = (Parcel, Grave, Payments, Obituaries)
+
+
+def ensure_default_cemetery(connection):
+    """Tabela cemetery z cmentarzem domyślnym o wymiarze z istniejących parceli."""
+    Cemetery.__table__.create(connection, checkfirst=True)
+    if connection.execute(Cemetery.__table__.select()
+                          .where(Cemetery.id == CEMETERY.DEFAULT_ID)).first() is not None:
+        return False
+    columns = {column['name'] for column in inspect(connection).get_columns('parcel')}
+    size = 0
+    if 'position_x' in columns:
+        size = connection.execute(db.select([func.max(Parcel.position_x)])).scalar() or 0
+    connection.execute(Cemetery.__table__.insert().values(id=CEMETERY.DEFAULT_ID,
+                                                          name='Cmentarz', size=size))
+    if connection.dialect.name == 'postgresql':
+        # jawnie podane id - sekwencja musi wskazywać za nim
+        connection.execute("SELECT setval(pg_get_serial_sequence('cemetery', 'id'), "
+                           "(SELECT max(id) FROM cemetery))")
+    return True
+
+
+def add_cemetery_columns(connection):
+    """Brakujące kolumny cemetery_id i indeksy z modelu; zwraca listę zmienionych tabel."""
+    changed = []
+    for model in MODELS:
+        table = model.__table__
+        inspector = inspect(connection)
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        if 'cemetery_id' not in columns:
+            connection.execute('ALTER TABLE {} ADD COLUMN cemetery_id INTEGER NOT NULL '
+                               'DEFAULT {} REFERENCES cemetery (id)'.format(table.name,
+                                                                            CEMETERY.DEFAULT_ID))
+            if connection.dialect.name == 'postgresql':
+                # nowe wiersze muszą podawać cmentarz - jak w modelu
+                connection.execute('ALTER TABLE {} ALTER COLUMN cemetery_id DROP DEFAULT'
+                                   .format(table.name))
+            changed.append(table.name)
+            columns.add('cemetery_id')
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            # indeksy z kolumnami dodawanymi przez inne migracje (migrate_grave_search_names.py)
+            if (index.name not in existing and 'cemetery_id' in index.columns
+                    and set(index.columns.keys()) <= columns):
+                index.create(connection)
+    return changed
+
+
+if __name__ == '__main__':
+    app.app_context().push()
+    connection = db.session.connection()
+    created = ensure_default_cemetery(connection)
+    tables = add_cemetery_columns(connection)
+    db.session.commit()
+    generation.bump([0])
+    if created or tables:
+        reconcile()
+        rebuild_all()
+    print('cmentarz domyślny: {}, dodano cemetery_id: {}'.format(
+        'utworzony' if created else 'istniał', ', '.join(tables) or 'brak'))
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Dodawanie do istniejących tabel kolumn i indeksów, które pojawiły się w modelu.
+
+db.create_all() tworzy tylko brakujące tabele - nowe kolumny istniejących tabel trzeba dodać
+ALTER TABLE. Funkcje sprawdzają stan bazy (SQLite: PRAGMA, PostgreSQL: information_schema
+i pg_indexes), więc skrypty migracji korzystające z nich można uruchamiać wielokrotnie.
+Kolumny dodawane są jako NULL bez wartości domyślnej - wartości dla istniejących wierszy
+uzupełnia skrypt migracji.
+"""
+
+
+def table_columns(connection, table_name):
+    """Nazwy kolumn tabeli w bazie."""
+    if connection.dialect.name == 'postgresql':
+        return {name for name, in connection.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = %s",
+            table_name)}
+    return {row[1] for row in connection.execute('PRAGMA table_info("{}")'.format(table_name))}
+
+
+def table_indexes(connection, table_name):
+    """Nazwy indeksów tabeli w bazie."""
+    if connection.dialect.name == 'postgresql':
+        return {name for name, in connection.execute(
+            "SELECT indexname FROM pg_indexes WHERE tablename = %s", table_name)}
+    return {row[1] for row in connection.execute('PRAGMA index_list("{}")'.format(table_name))}
+
+
+def add_columns(connection, model, names):
+    """Brakujące kolumny modelu i indeksy na nich; zwraca listę dodanych kolumn.
+
+    Indeks obejmujący także kolumnę jeszcze nieistniejącą w bazie (dodawaną inną migracją)
+    jest pomijany - tworzy go ponowne uruchomienie po tamtej migracji.
+    """
+    table = model.__table__
+    quote = connection.dialect.identifier_preparer.quote
+    columns = table_columns(connection, table.name)
+    added = []
+    for name in names:
+        if name not in columns:
+            connection.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                quote(table.name), quote(name),
+                table.c[name].type.compile(dialect=connection.dialect)))
+            columns.add(name)
+            added.append(name)
+    existing = table_indexes(connection, table.name)
+    for index in table.indexes:
+        index_columns = set(index.columns.keys())
+        if index.name not in existing and index_columns & set(names) and index_columns <= columns:
+            index.create(connection)
+    return added
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Jednorazowe dodanie kolumny Grave.death_mmdd i indeksu ix_grave_death_mmdd.
+
+Powiadomienia o rocznicach (anniversary_job) wyszukują groby po miesiącu i dniu śmierci,
+a bez kolumny w bazie każde odczytanie i zapisanie grobu kończy się błędem. Uruchomić raz,
+po wdrożeniu nowego modelu, przed startem aplikacji:
+    python3 migrate_grave_death_mmdd.py
+Kolumna uzupełniana jest dla istniejących grobów (backfill_death_mmdd), a nowe i zmienione
+groby ustawiają ją same przy zapisie. Ponowne uruchomienie uzupełnia tylko brakujące wartości.
+"""
+# importy nasze
+from anniversary_job import backfill_death_mmdd
+from db_models import Grave
+from main import app, db
+from migrate_columns import add_columns
+
+if __name__ == '__main__':
+    app.app_context().push()
+    added = add_columns(db.session.connection(), Grave, ['death_mmdd'])
+    db.session.commit()
+    backfill_death_mmdd()
+    print('dodano kolumny: {}'.format(', '.join(added) or 'brak'))
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Jednorazowe dodanie kolumn Grave.name_search / Grave.last_name_search i ich indeksu.
+
+Wyszukiwarka grobów (search_cache) dopasowuje imię i nazwisko w bazie po kolumnach
+znormalizowanych, a bez nich w bazie każde odczytanie i zapisanie grobu kończy się błędem.
+Uruchomić raz, po wdrożeniu nowego modelu i po migrate_cemeteries.py (indeks
+ix_grave_cemetery_search obejmuje cemetery_id), przed startem aplikacji:
+    python3 migrate_grave_search_names.py
+Kolumny uzupełniane są dla istniejących grobów (backfill_search_names), a nowe i zmienione
+groby ustawiają je same przy zapisie. Ponowne uruchomienie uzupełnia tylko brakujące wartości.
+"""
+# importy nasze
+from db_models import Grave
+from main import app, db
+from migrate_columns import add_columns
+from search_cache import backfill_search_names
+
+if __name__ == '__main__':
+    app.app_context().push()
+    added = add_columns(db.session.connection(), Grave, ['name_search', 'last_name_search'])
+    db.session.commit()
+    print('dodano kolumny: {}, uzupełniono grobów: {}'.format(', '.join(added) or 'brak',
+                                                             backfill_search_names()))
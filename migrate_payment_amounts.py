@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Jednorazowa konwersja kwot płatności ze złotych (Float) na grosze (BigInteger).
+
+Kolumny Payments.payment_amount i Payments.amount_paid przechowywały złote jako liczby
+zmiennoprzecinkowe - model zapisuje teraz grosze (LEDGER.MINOR_UNITS). Bez konwersji każda
+istniejąca kwota byłaby 100 razy za mała. Uruchomić raz, po wdrożeniu nowego modelu
+i po migrate_cemeteries.py (odtwarzana tabela payments ma już kolumnę cemetery_id):
+    python3 migrate_payment_amounts.py
+Ponowne uruchomienie niczego nie zmienia - PostgreSQL: tylko kolumny jeszcze nie typu bigint,
+SQLite: tylko tabela z kolumnami jeszcze nie typu BIGINT (tabela odtwarzana z modelu).
+Zestawienie przychodów (RevenueRollup) przeliczane jest na koniec od nowa.
+"""
+# importy nasze
+from config import LEDGER
+from data_rollups import reconcile
+from db_models import Payments, RevenueRollup
+from main import app, db
+
+COLUMNS = ('payment_amount', 'amount_paid')
+
+
+def convert_postgresql(connection):
+    """Zmiana typu kolumn z przeliczeniem wartości; zwraca listę przekonwertowanych kolumn."""
+    converted = []
+    for column in COLUMNS:
+        data_type = connection.execute(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = 'payments' AND column_name = %s", column).scalar()
+        if data_type != 'bigint':
+            connection.execute('ALTER TABLE payments ALTER COLUMN {0} TYPE BIGINT '
+                               'USING round({0} * {1})'.format(column, LEDGER.MINOR_UNITS))
+            converted.append(column)
+    for column in ('collected', 'outstanding'):
+        # wartości przeliczane od nowa przez reconcile()
+        connection.execute('ALTER TABLE revenue_rollup ALTER COLUMN {} TYPE BIGINT'.format(column))
+    return converted
+
+
+def rebuild_sqlite_table(connection, table, expressions):
+    """Odtworzenie tabeli SQLite z typami z modelu - SQLite nie zmienia typu kolumny ALTER-em."""
+    # ta sama metadata - klucze obce wskazują na istniejące tabele
+    new_table = table.tometadata(table.metadata, name='{}_new'.format(table.name))
+    new_table.indexes.clear()
+    new_table.create(connection)
+    table.metadata.remove(new_table)
+    columns = ', '.join(column.name for column in table.columns)
+    connection.execute('INSERT INTO {} ({}) SELECT {} FROM {}'.format(
+        new_table.name, columns,
+        ', '.join(expressions.get(column.name, column.name) for column in table.columns),
+        table.name))
+    connection.execute('DROP TABLE {}'.format(table.name))
+    connection.execute('ALTER TABLE {} RENAME TO {}'.format(new_table.name, table.name))
+    for index in table.indexes:
+        index.create(connection)
+
+
+def convert_sqlite(connection):
+    """Odtworzenie tabel z kolumnami BIGINT i przeliczeniem kwot; zwraca listę kolumn."""
+    declared = {row[1]: row[2] for row in connection.execute('PRAGMA table_info(payments)')}
+    if all(declared[column].upper() == 'BIGINT' for column in COLUMNS):
+        return []
+    rebuild_sqlite_table(connection, Payments.__table__,
+                         {column: 'CAST(round({} * {}) AS INTEGER)'.format(column,
+                                                                          LEDGER.MINOR_UNITS)
+                          for column in COLUMNS})
+    # wartości przeliczane od nowa przez reconcile()
+    rebuild_sqlite_table(connection, RevenueRollup.__table__, {})
+    return list(COLUMNS)
+
+
+if __name__ == '__main__':
+    app.app_context().push()
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        columns = convert_postgresql(connection)
+    else:
+        columns = convert_sqlite(connection)
+    db.session.commit()
+    reconcile()
+    print('przekonwertowano kolumny: {}'.format(', '.join(columns) or 'brak'))
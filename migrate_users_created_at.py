@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Jednorazowe dodanie kolumny User.created_at i indeksu ix_user_active_created.
+
+Model użytkownika zapisuje datę rejestracji (usuwanie niepotwierdzonych kont - data_cleanup),
+a bez kolumny w bazie każde zapytanie o użytkownika, także logowanie, kończy się błędem.
+Uruchomić raz, po wdrożeniu nowego modelu, przed startem aplikacji:
+    python3 migrate_users_created_at.py
+Istniejące konta dostają created_at NULL - purge_unconfirmed_users traktuje je jako konta
+z wygasłym linkiem aktywacyjnym. Ponowne uruchomienie niczego nie zmienia.
+"""
+# importy nasze
+from db_models import User
+from main import app, db
+from migrate_columns import add_columns
+
+if __name__ == '__main__':
+    app.app_context().push()
+    added = add_columns(db.session.connection(), User, ['created_at'])
+    db.session.commit()
+    print('dodano kolumny: {}'.format(', '.join(added) or 'brak'))
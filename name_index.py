@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Indeks prefiksowy imion i nazwisk z grobów dla podpowiedzi w wyszukiwarce.
+
+Dla każdego cmentarza i pola (name, last_name) trzymana jest posortowana lista
+znormalizowanych wartości (małe litery, bez polskich znaków) i liczności ich wystąpień.
+Wyszukanie prefiksu to dwa bisect-y na liście - bez zapytań do bazy. Krótkie prefiksy
+(do NAMES.TOP_PREFIX_LENGTH znaków) obejmują dużą część listy, dlatego ich najczęstsze wartości
+liczone są z góry, przy budowie indeksu, i liczone ponownie dopiero po zmianie pasującej wartości.
+Indeks budowany jest przed pierwszym żądaniem workera, a zmiany grobów zapisane w tym procesie
+nanoszone są przyrostowo po zatwierdzeniu transakcji (after_commit - wycofane zmiany nie trafiają
+do indeksu). Zmiany z innych workerów i z operacji z pominięciem ORM (data_cleanup) widoczne są
+po przebudowie, uruchamianej co NAMES.REBUILD_INTERVAL sekund w wątku w tle - żądania korzystają
+w tym czasie z poprzedniego indeksu.
+"""
+# importy modułów py
+import bisect
+import collections
+import heapq
+import threading
+import time
+import unicodedata
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+# importy nasze
+from config import NAMES
+from db_models import db, Grave
+
+FIELDS = ('name', 'last_name')
+# litery, których NFKD nie rozkłada na literę bazową i znak diakrytyczny
+SPECIAL_LETTERS = str.maketrans({'ł': 'l', 'ß': 'ss', 'ø': 'o', 'đ': 'd'})
+
+
+def normalize(value):
+    """Postać wartości używana w indeksie - małe litery bez znaków diakrytycznych."""
+    value = unicodedata.normalize('NFKD', value.strip().casefold().translate(SPECIAL_LETTERS))
+    return ''.join(char for char in value if not unicodedata.combining(char))
+
+
+@event.listens_for(Grave, 'before_insert')
+@event.listens_for(Grave, 'before_update')
+def set_search_names(mapper, connection, grave):
+    """Uzupełnienie znormalizowanego imienia i nazwiska przy każdym zapisie grobu."""
+    grave.name_search = normalize(grave.name or '')
+    grave.last_name_search = normalize(grave.last_name or '')
+
+
+class PrefixIndex:
+    """Posortowane klucze z licznościami pisowni (np. 'kowalski' -> {'Kowalski': 3})."""
+
+    def __init__(self):
+        self.keys = []
+        self.values = {}
+        self.totals = {}
+        # krótki prefiks -> najczęstsze klucze (NAMES.LIMIT)
+        self.top = {}
+
+    def add(self, value, count=1):
+        key = normalize(value)
+        if not key:
+            return
+        if key not in self.values:
+            bisect.insort(self.keys, key)
+            self.values[key] = collections.Counter()
+            self.totals[key] = 0
+        self.values[key][value] += count
+        self.totals[key] += count
+        self._invalidate(key)
+
+    def remove(self, value):
+        key = normalize(value)
+        spellings = self.values.get(key)
+        if spellings is None:
+            return
+        spellings[value] -= 1
+        self.totals[key] -= 1
+        if spellings[value] <= 0:
+            del spellings[value]
+        if not spellings:
+            del self.values[key]
+            del self.totals[key]
+            del self.keys[bisect.bisect_left(self.keys, key)]
+        self._invalidate(key)
+
+    def _invalidate(self, key):
+        """Usunięcie policzonych z góry wyników krótkich prefiksów klucza."""
+        for length in range(1, NAMES.TOP_PREFIX_LENGTH + 1):
+            self.top.pop(key[:length], None)
+
+    def _best(self, prefix, limit):
+        """Najczęstsze klucze zaczynające się od prefiksu."""
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff', start)
+        return heapq.nlargest(limit, self.keys[start:end], key=self.totals.__getitem__)
+
+    def precompute(self):
+        """Policzenie z góry wyników wszystkich krótkich prefiksów (po zbudowaniu indeksu)."""
+        for length in range(1, NAMES.TOP_PREFIX_LENGTH + 1):
+            for prefix in {key[:length] for key in self.keys}:
+                self.top[prefix] = self._best(prefix, NAMES.LIMIT)
+
+    def lookup(self, prefix, limit):
+        """Wartości zaczynające się od prefiksu - [(najczęstsza pisownia, liczba grobów)]."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= NAMES.TOP_PREFIX_LENGTH and limit <= NAMES.LIMIT:
+            best = self.top.get(prefix)
+            if best is None:
+                best = self.top[prefix] = self._best(prefix, NAMES.LIMIT)
+            best = best[:limit]
+        else:
+            best = self._best(prefix, limit)
+        return [(self.values[key].most_common(1)[0][0], self.totals[key]) for key in best]
+
+
+class NameIndex:
+    """Indeksy prefiksowe wszystkich cmentarzy w bieżącym procesie."""
+
+    def __init__(self):
+        self.app = None
+        self.lock = threading.Lock()
+        self.indexes = {}
+        self.built = None
+        self.rebuilding = False
+
+    def rebuild(self):
+        """Zbudowanie indeksów od nowa - jedno zapytanie GROUP BY na pole."""
+        indexes = collections.defaultdict(PrefixIndex)
+        for field in FIELDS:
+            column = getattr(Grave, field)
+            rows = db.session.query(Grave.cemetery_id, column, func.count(Grave.id))\
+                .group_by(Grave.cemetery_id, column)
+            for cemetery_id, value, count in rows:
+                indexes[cemetery_id, field].add(value, count)
+        for index in indexes.values():
+            index.precompute()
+        with self.lock:
+            self.indexes = indexes
+            self.built = time.monotonic()
+
+    def _rebuild_in_background(self):
+        """Przebudowa w wątku - żądania w tym czasie czytają poprzedni indeks."""
+        try:
+            with self.app.app_context():
+                self.rebuild()
+        finally:
+            with self.lock:
+                self.rebuilding = False
+
+    def refresh(self):
+        """Start przebudowy w tle, gdy indeks jest przeterminowany - najwyżej jednej naraz."""
+        if self.built is None or time.monotonic() - self.built <= NAMES.REBUILD_INTERVAL:
+            return
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name='name-index-rebuild',
+                         daemon=True).start()
+
+    def lookup(self, cemetery_id, field, prefix, limit=NAMES.LIMIT):
+        self.refresh()
+        with self.lock:
+            index = self.indexes.get((cemetery_id, field))
+            return index.lookup(prefix, limit) if index else []
+
+    def apply(self, changes):
+        """Naniesienie zatwierdzonych zmian: (cemetery_id, pole, wartość, +1/-1)."""
+        with self.lock:
+            for cemetery_id, field, value, sign in changes:
+                index = self.indexes.setdefault((cemetery_id, field), PrefixIndex())
+                if sign > 0:
+                    index.add(value)
+                else:
+                    index.remove(value)
+
+
+names = NameIndex()
+
+
+def grave_changes(grave, sign):
+    """Zmiany indeksu po dodaniu (sign=1) lub usunięciu (sign=-1) grobu."""
+    return [(grave.cemetery_id, field, getattr(grave, field), sign) for field in FIELDS]
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_changes(session, flush_context):
+    """Zapamiętanie zmian imion i nazwisk do czasu zatwierdzenia transakcji."""
+    changes = session.info.setdefault('name_index', [])
+    for obj in session.new:
+        if isinstance(obj, Grave):
+            changes.extend(grave_changes(obj, 1))
+    for obj in session.deleted:
+        if isinstance(obj, Grave):
+            changes.extend(grave_changes(obj, -1))
+    for obj in session.dirty:
+        if isinstance(obj, Grave):
+            for field in FIELDS:
+                history = inspect(obj).attrs[field].history
+                if history.added and history.deleted:
+                    changes.append((obj.cemetery_id, field, history.deleted[0], -1))
+                    changes.append((obj.cemetery_id, field, history.added[0], 1))
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_changes(session):
+    """Naniesienie zmian na indeks dopiero po zatwierdzeniu transakcji."""
+    changes = session.info.pop('name_index', None)
+    if changes and names.built is not None:
+        names.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changes(session):
+    """Wycofana transakcja - zmiany nie trafiają do indeksu."""
+    session.info.pop('name_index', None)
+
+
+def init_name_index(app):
+    """Budowa indeksu przed pierwszym żądaniem workera.
+
+    Nie przy imporcie main - z main korzystają też skrypty db_init i create_new_admin.
+    """
+    names.app = app
+    app.before_first_request(names.rebuild)
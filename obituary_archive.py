@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Cykl życia nekrologów - przenoszenie po pogrzebie do archiwum i wyszukiwanie w archiwum.
+
+Uruchamiane okresowo (np. cron raz na dobę lub raz w miesiącu): python3 obituary_archive.py
+Nekrologi starsze niż OBITUARIES.ARCHIVE_AFTER_DAYS po pogrzebie przenoszone są miesiąc po
+miesiącu (od najstarszego) partiami po OBITUARIES.ARCHIVE_BATCH - wstawienie do
+ObituariesArchive i usunięcie z Obituaries w jednej transakcji, więc przerwany przebieg niczego
+nie gubi ani nie dubluje. Tabela Obituaries zawiera dzięki temu tylko nadchodzące pogrzeby.
+Archiwum ma własny klucz główny - id nekrologu (obituary_id) może się powtórzyć, bo SQLite
+po usunięciu najnowszych wierszy nadaje nowym nekrologom te same id.
+Nekrologi znikają z /obituaries OBITUARIES.ACTIVE_HOURS po pogrzebie, więc wyszukiwanie
+w archiwum obejmuje także minione pogrzeby, które jeszcze nie zostały przeniesione.
+"""
+# importy modułów py
+import datetime
+from sqlalchemy import func, select, union_all, false
+
+# importy nasze
+from config import OBITUARIES
+from db_models import db, Obituaries, ObituariesArchive
+
+COLUMNS = ('cemetery_id', 'name', 'surname', 'gender', 'years_old', 'death_date',
+           'funeral_date')
+# kolumny wyników wyszukiwania - wspólne dla archiwum i nieprzeniesionych nekrologów
+SEARCH_COLUMNS = ('name', 'surname', 'years_old', 'death_date', 'funeral_date')
+
+
+def month_key(day):
+    """Klucz partycji archiwum - rok * 100 + miesiąc."""
+    return day.year * 100 + day.month
+
+
+def month_end(day):
+    """Początek miesiąca następującego po dacie."""
+    return datetime.datetime(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def archive_batch(obituary_ids, archived_at):
+    """Przeniesienie partii nekrologów do archiwum w jednej transakcji."""
+    rows = db.session.query(Obituaries.id, *[getattr(Obituaries, column) for column in COLUMNS])\
+        .filter(Obituaries.id.in_(obituary_ids)).all()
+    db.session.execute(ObituariesArchive.__table__.insert(), [
+        dict(zip(COLUMNS, row[1:]), obituary_id=row.id,
+             archive_month=month_key(row.funeral_date), archived_at=archived_at)
+        for row in rows])
+    db.session.execute(Obituaries.__table__.delete().where(Obituaries.id.in_(obituary_ids)))
+    db.session.commit()
+    return len(rows)
+
+
+def archive_obituaries(now=None, batch_size=OBITUARIES.ARCHIVE_BATCH):
+    """Archiwizacja minionych pogrzebów miesiącami; zwraca liczbę przeniesionych nekrologów."""
+    now = now or datetime.datetime.now()
+    cutoff = now - datetime.timedelta(days=OBITUARIES.ARCHIVE_AFTER_DAYS)
+    moved = 0
+    while True:
+        oldest = db.session.query(func.min(Obituaries.funeral_date))\
+            .filter(Obituaries.funeral_date < cutoff).scalar()
+        if oldest is None:
+            return moved
+        month_cutoff = min(cutoff, month_end(oldest))
+        obituary_ids = [obituary_id for obituary_id, in db.session.query(Obituaries.id)
+                        .filter(Obituaries.funeral_date < month_cutoff)
+                        .order_by(Obituaries.funeral_date).limit(batch_size)]
+        moved += archive_batch(obituary_ids, now)
+
+
+def starts_with(value):
+    """Wzorzec LIKE 'wartość%' z zabezpieczonymi znakami specjalnymi."""
+    return '{}%'.format(value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+
+
+def month_filter(column, month):
+    """Warunek na miesiąc (rok * 100 + miesiąc) dla kolumny z datą."""
+    try:
+        start = datetime.datetime(month // 100, month % 100, 1)
+    except ValueError:
+        return false()
+    return (column >= start) & (column < month_end(start))
+
+
+def archive_search(cemetery_id, surname=None, month=None, page=1,
+                   per_page=OBITUARIES.ARCHIVE_PER_PAGE, now=None):
+    """Stronicowane wyszukiwanie w archiwum po początku nazwiska i miesiącu pogrzebu.
+
+    Obejmuje też nekrologi z Obituaries, których pogrzeb minął ponad OBITUARIES.ACTIVE_HOURS
+    temu (nie ma ich już na /obituaries), a których archiwizacja jeszcze ich nie przeniosła.
+    """
+    now = now or datetime.datetime.now()
+    archived = select([getattr(ObituariesArchive, column) for column in SEARCH_COLUMNS])\
+        .where(ObituariesArchive.cemetery_id == cemetery_id)
+    recent = select([getattr(Obituaries, column) for column in SEARCH_COLUMNS])\
+        .where((Obituaries.cemetery_id == cemetery_id) &
+               (Obituaries.funeral_date < now - datetime.timedelta(hours=OBITUARIES.ACTIVE_HOURS)))
+    if surname:
+        pattern = starts_with(surname)
+        archived = archived.where(ObituariesArchive.surname.like(pattern, escape='\\'))
+        recent = recent.where(Obituaries.surname.like(pattern, escape='\\'))
+    if month:
+        archived = archived.where(ObituariesArchive.archive_month == month)
+        recent = recent.where(month_filter(Obituaries.funeral_date, month))
+    found = union_all(archived, recent).alias('found')
+    return db.session.query(found)\
+        .order_by(found.c.funeral_date.desc(), found.c.surname, found.c.name)\
+        .paginate(page, per_page, False)
+
+
+if __name__ == '__main__':
+    from main import app
+    app.app_context().push()
+    print('przeniesiono do archiwum {} nekrologów'.format(archive_obituaries()))
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Księga wpłat: idempotentne księgowanie, import wyciągów bankowych i uzgadnianie z płatnościami.
+
+Kwoty przechowywane są w groszach (liczby całkowite). Każda wpłata to wpis LedgerEntry
+z unikalnym kluczem idempotencji - ponowne przesłanie tego samego formularza lub ponowny
+import tego samego wyciągu niczego nie dopisuje.
+Uzgadnianie pobiera partię nieuzgodnionych wpisów, odczytuje z tytułu przelewu numer płatności
+(LEDGER.REFERENCE_PREFIX + id, np. GM00000123), dopasowuje wpisy do zaległych płatności na
+tablicach numpy (searchsorted + add.at) i w jednej transakcji na partię aktualizuje salda,
+statusy, przypisanie wpisów oraz zestawienie przychodów (RevenueRollup).
+Import z wiersza poleceń: python3 payment_ledger.py wyciag.csv [wyciag2.csv ...]
+"""
+# importy modułów py
+import csv
+import datetime
+import hashlib
+import re
+from decimal import Decimal, InvalidOperation
+import numpy as np
+from sqlalchemy import bindparam, select, and_
+from sqlalchemy.exc import IntegrityError
+
+# importy nasze
+from audit_log import audit
+from config import LEDGER
+from data_rollups import apply_delta
+from db_models import db, Payments, LedgerEntry, RevenueRollup
+
+REFERENCE = re.compile(r'{}\s*0*(\d+)'.format(re.escape(LEDGER.REFERENCE_PREFIX)), re.I)
+STATUSES = np.array(['pending', 'partial', 'paid'])
+
+
+def to_minor(amount):
+    """Kwota tekstowa ('1 234,56', '-10.5') na grosze; ValueError przy niepoprawnej kwocie."""
+    try:
+        value = Decimal(str(amount).replace(' ', '').replace('\xa0', '').replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError('Niepoprawna kwota: {}'.format(amount))
+    minor = value * LEDGER.MINOR_UNITS
+    if minor != minor.to_integral_value():
+        raise ValueError('Kwota z dokładnością większą niż grosz: {}'.format(amount))
+    return int(minor)
+
+
+def payment_reference(payment_id):
+    """Numer płatności podawany w tytule przelewu."""
+    return '{}{:08d}'.format(LEDGER.REFERENCE_PREFIX, payment_id)
+
+
+def record_entry(amount, idempotency_key, source='manual', title=None, booked_at=None):
+    """Zaksięgowanie pojedynczej wpłaty; zwraca (wpis, czy_dopisano).
+
+    Powtórzenie z tym samym kluczem zwraca istniejący wpis zamiast tworzyć drugi.
+    """
+    entry = LedgerEntry.query.filter_by(idempotency_key=idempotency_key).first()
+    if entry is not None:
+        return entry, False
+    now = datetime.datetime.now()
+    entry = LedgerEntry(idempotency_key=idempotency_key, amount=amount, source=source,
+                        title=title, booked_at=booked_at or now, created_at=now)
+    db.session.add(entry)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # równoległe żądanie z tym samym kluczem zdążyło pierwsze
+        db.session.rollback()
+        return LedgerEntry.query.filter_by(idempotency_key=idempotency_key).first(), False
+    return entry, True
+
+
+def parse_statement(file):
+    """Wiersze wyciągu CSV (kolumny wg LEDGER.STATEMENT_COLUMNS) jako słowniki wpisów."""
+    columns = LEDGER.STATEMENT_COLUMNS
+    for row in csv.DictReader(file, delimiter=LEDGER.STATEMENT_DELIMITER):
+        transaction_id = (row.get(columns['id']) or '').strip()
+        if not transaction_id:
+            # bez identyfikatora transakcji - klucz z treści wiersza
+            transaction_id = hashlib.sha256('|'.join(
+                row.get(columns[key]) or '' for key in ('date', 'amount', 'title'))
+                .encode()).hexdigest()
+        yield {'idempotency_key': 'bank:{}'.format(transaction_id),
+               'amount': to_minor(row[columns['amount']]),
+               'source': 'bank',
+               'title': (row.get(columns['title']) or '')[:255],
+               'booked_at': datetime.datetime.strptime(row[columns['date']].strip(),
+                                                       LEDGER.STATEMENT_DATE_FORMAT)}
+
+
+def ingest_entries(entries, batch_size=LEDGER.BATCH):
+    """Masowe dopisanie wpisów z pominięciem już zaksięgowanych; zwraca (dopisane, powtórzone)."""
+    inserted = duplicates = 0
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == batch_size:
+            added = insert_batch(batch)
+            inserted, duplicates = inserted + added, duplicates + len(batch) - added
+            batch = []
+    if batch:
+        added = insert_batch(batch)
+        inserted, duplicates = inserted + added, duplicates + len(batch) - added
+    return inserted, duplicates
+
+
+def insert_batch(batch):
+    """Jedna transakcja: odfiltrowanie istniejących kluczy i jeden INSERT dla pozostałych."""
+    unique = {entry['idempotency_key']: entry for entry in batch}
+    existing = {key for key, in db.session.query(LedgerEntry.idempotency_key)
+                .filter(LedgerEntry.idempotency_key.in_(list(unique)))}
+    now = datetime.datetime.now()
+    new = [dict(entry, created_at=now) for key, entry in unique.items() if key not in existing]
+    if new:
+        db.session.execute(LedgerEntry.__table__.insert(), new)
+    db.session.commit()
+    return len(new)
+
+
+def ingest_statement(file):
+    """Import wyciągu bankowego i uzgodnienie nowych wpisów; zwraca słownik z licznikami."""
+    inserted, duplicates = ingest_entries(parse_statement(file))
+    matched, unmatched = reconcile_entries()
+    return {'inserted': inserted, 'duplicates': duplicates, 'matched': matched,
+            'unmatched': unmatched}
+
+
+def referenced_payments(titles):
+    """Numery płatności odczytane z tytułów przelewów (-1 gdy brak)."""
+    ids = []
+    for title in titles:
+        match = REFERENCE.search(title or '')
+        ids.append(int(match.group(1)) if match else -1)
+    return np.array(ids, dtype=np.int64)
+
+
+def reconcile_batch(entry_ids, amounts, payment_refs):
+    """Dopasowanie partii wpisów do zaległych płatności w jednej transakcji.
+
+    Zwraca (dopasowane, niedopasowane). Każdy wpis uzgadniany jest dokładnie raz - także
+    niedopasowany (reconciled_at), więc nie wraca do kolejki. Równoległe uzgadnianie (cron
+    i import w panelu) nie zalicza wpłaty dwukrotnie: płatności są blokowane przed odczytem
+    sald, a wpisy uzgodnione w międzyczasie przez inny proces są pomijane.
+    """
+    connection = db.session.connection()
+    references = np.unique(payment_refs[payment_refs > 0]).tolist()
+    if references:
+        # pusty UPDATE blokuje wiersze płatności (PostgreSQL) lub zapis do bazy (SQLite)
+        # do końca transakcji - drugi proces czeka tu i czyta już zatwierdzone salda
+        connection.execute(Payments.__table__.update().where(Payments.id.in_(references))
+                           .values(status=Payments.status))
+    pending = {entry_id for entry_id, in connection.execute(
+        select([LedgerEntry.id]).where(and_(LedgerEntry.id.in_(entry_ids.tolist()),
+                                            LedgerEntry.reconciled_at.is_(None))))}
+    keep = np.in1d(entry_ids, list(pending))
+    entry_ids, amounts, payment_refs = entry_ids[keep], amounts[keep], payment_refs[keep]
+    if not len(entry_ids):
+        db.session.commit()
+        return 0, 0
+
+    rows = connection.execute(
+        select([Payments.id, Payments.cemetery_id, Payments.payment_amount,
+                Payments.amount_paid])
+        .where(and_(Payments.id.in_(references), Payments.status != 'paid'))
+        .order_by(Payments.id)).fetchall() if references else []
+    matched = np.zeros(len(entry_ids), dtype=bool)
+    credited = []
+    if rows:
+        payment_ids, cemeteries, due, paid = (np.array(column, dtype=np.int64)
+                                              for column in zip(*rows))
+        position = np.searchsorted(payment_ids, payment_refs)
+        position[position >= len(payment_ids)] = 0
+        matched = payment_ids[position] == payment_refs
+
+    if matched.any():
+        received = np.zeros(len(payment_ids), dtype=np.int64)
+        np.add.at(received, position[matched], amounts[matched])
+        new_paid = paid + received
+        status = STATUSES[np.where(new_paid >= due, 2, np.where(new_paid > 0, 1, 0))]
+        changed = np.flatnonzero(received)
+        credited = [(int(payment_ids[i]), int(received[i])) for i in changed]
+        if len(changed):
+            connection.execute(
+                Payments.__table__.update().where(Payments.id == bindparam('payment_id'))
+                .values(amount_paid=bindparam('new_paid'), status=bindparam('new_status')),
+                [{'payment_id': int(payment_ids[i]), 'new_paid': int(new_paid[i]),
+                  'new_status': str(status[i])} for i in changed])
+        # zestawienie przychodów - UPDATE z pominięciem ORM nie wywołuje zdarzeń sesji
+        for cemetery_id in np.unique(cemeteries[changed]):
+            total = int(received[changed][cemeteries[changed] == cemetery_id].sum())
+            apply_delta(connection, RevenueRollup, {'cemetery_id': int(cemetery_id)},
+                        {'collected': total, 'outstanding': -total})
+
+    now = datetime.datetime.now()
+    connection.execute(
+        LedgerEntry.__table__.update()
+        .where(LedgerEntry.id == bindparam('entry_id'))
+        .where(LedgerEntry.reconciled_at.is_(None))
+        .values(payment_id=bindparam('matched_payment'), reconciled_at=now),
+        [{'entry_id': int(entry_id), 'matched_payment': int(payment_id) if is_matched else None}
+         for entry_id, payment_id, is_matched in zip(entry_ids, payment_refs, matched)])
+    db.session.commit()
+    for payment_id, amount in credited:
+        audit('edit', 'payment', payment_id, 'ledger:+{}'.format(amount))
+    return int(matched.sum()), int((~matched).sum())
+
+
+def reconcile_entries(batch_size=LEDGER.BATCH):
+    """Uzgodnienie wszystkich nowych wpisów; zwraca (dopasowane, niedopasowane)."""
+    matched = unmatched = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(LedgerEntry.id, LedgerEntry.amount, LedgerEntry.title)\
+            .filter(LedgerEntry.reconciled_at.is_(None), LedgerEntry.id > last_id)\
+            .order_by(LedgerEntry.id).limit(batch_size).all()
+        if not rows:
+            return matched, unmatched
+        entry_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        amounts = np.array([row[1] for row in rows], dtype=np.int64)
+        batch_matched, batch_unmatched = reconcile_batch(
+            entry_ids, amounts, referenced_payments(row[2] for row in rows))
+        matched += batch_matched
+        unmatched += batch_unmatched
+        last_id = rows[-1][0]
+
+
+if __name__ == '__main__':
+    import sys
+    from main import app
+    app.app_context().push()
+    for path in sys.argv[1:]:
+        with open(path, newline='', encoding='utf-8') as statement:
+            print('{}: {}'.format(path, ingest_statement(statement)))
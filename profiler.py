@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Profilowanie pojedynczych żądań na życzenie administratora.
+
+Domyślnie nic nie jest mierzone. Administrator pobiera w panelu (/admin/profiles) podpisany
+token i dokleja go do adresu strony (?_profile=<token>) albo wysyła w nagłówku X-Profile.
+Token ważny jest PROFILER.TOKEN_MAX_AGE sekund i tylko dla konta, które go wygenerowało
+i nadal ma status administratora.
+Na czas takiego żądania wątek próbkujący co PROFILER.INTERVAL sekund odczytuje stos wątku
+obsługującego żądanie (sys._current_frames) - narzut nie zależy od liczby wywołań funkcji.
+Wynik zapisywany jest w PROFILER.PATH jako plik .collapsed (format flamegraph.pl / speedscope)
+oraz .json z czasem żądania i listą zapytań SQL z czasami wykonania.
+"""
+# importy modułów py
+import collections
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from flask import request, g, current_app, has_request_context
+from flask_login import current_user
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# importy nasze
+from config import PROFILER
+
+
+class Sampler(threading.Thread):
+    """Wątek zbierający próbki stosu jednego wątku."""
+
+    def __init__(self, thread_id):
+        super().__init__(name='profiler-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(PROFILER.INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename),
+                                                 code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def serializer(app):
+    """Podpisywanie tokenów kluczem aplikacji."""
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='profiler')
+
+
+def profile_token(user_id):
+    """Token uruchamiający profilowanie dla danego administratora."""
+    return serializer(current_app).dumps(user_id)
+
+
+def profile_requested():
+    """Czy żądanie ma poprawny token bieżącego administratora."""
+    token = request.headers.get('X-Profile') or request.args.get('_profile')
+    if not token or not current_user.is_authenticated or not current_user.admin:
+        return False
+    try:
+        user_id = serializer(current_app).loads(token, max_age=PROFILER.TOKEN_MAX_AGE)
+    except BadSignature:
+        return False
+    return user_id == current_user.id
+
+
+def start_profile():
+    """before_request - start próbkowania, gdy administrator o to poprosił."""
+    if not profile_requested():
+        return
+    g.profile = {'started': time.perf_counter(), 'queries': []}
+    g.profile_sampler = Sampler(threading.get_ident())
+    g.profile_sampler.start()
+
+
+def stop_profile(response):
+    """after_request - zatrzymanie próbkowania i zapis wyników."""
+    profile = getattr(g, 'profile', None)
+    if profile is None:
+        return response
+    g.profile = None
+    g.profile_sampler.stop()
+    duration = time.perf_counter() - profile['started']
+    name = '{}_{}'.format(datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f'),
+                          request.endpoint or 'unknown')
+    path = os.path.join(current_app.root_path, PROFILER.PATH)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, name + '.collapsed'), 'w') as file:
+        for stack, count in g.profile_sampler.stacks.most_common():
+            file.write('{} {}\n'.format(stack, count))
+    meta = {'name': name,
+            # bez tokenu - nie powinien trafić do zapisanych plików
+            'url': request.path + ''.join(
+                '{}{}={}'.format('&' if index else '?', key, value) for index, (key, value) in
+                enumerate((key, value) for key, value in request.args.items(multi=True)
+                          if key != '_profile')),
+            'method': request.method,
+            'status': response.status_code,
+            'user_id': current_user.id,
+            'duration_ms': round(duration * 1000, 2),
+            'samples': sum(g.profile_sampler.stacks.values()),
+            'sql_ms': round(sum(query['ms'] for query in profile['queries']), 2),
+            'queries': profile['queries']}
+    with open(os.path.join(path, name + '.json'), 'w') as file:
+        json.dump(meta, file, indent=1)
+    prune_profiles(path)
+    response.headers['X-Profile-Name'] = name
+    return response
+
+
+def teardown_profile(error):
+    """Zatrzymanie próbkowania, gdy żądanie zakończyło się wyjątkiem (bez zapisu profilu)."""
+    if getattr(g, 'profile', None) is not None:
+        g.profile = None
+        g.profile_sampler.stop()
+
+
+def prune_profiles(path):
+    """Pozostawienie tylko PROFILER.KEEP najnowszych profili."""
+    names = sorted(name[:-5] for name in os.listdir(path) if name.endswith('.json'))
+    for name in names[:-PROFILER.KEEP]:
+        for extension in ('.json', '.collapsed'):
+            try:
+                os.remove(os.path.join(path, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+def recent_profiles():
+    """Metadane zapisanych profili, najnowsze pierwsze."""
+    path = os.path.join(current_app.root_path, PROFILER.PATH)
+    if not os.path.isdir(path):
+        return []
+    profiles = []
+    for name in sorted((name for name in os.listdir(path) if name.endswith('.json')),
+                       reverse=True):
+        with open(os.path.join(path, name)) as file:
+            profiles.append(json.load(file))
+    return profiles
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_query(connection, cursor, statement, parameters, context, executemany):
+    """Zapamiętanie czasu startu zapytania w profilowanym żądaniu."""
+    if has_request_context() and getattr(g, 'profile', None):
+        context._profile_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_query(connection, cursor, statement, parameters, context, executemany):
+    """Dopisanie zapytania i jego czasu do profilu żądania."""
+    started = getattr(context, '_profile_started', None)
+    if started is not None and has_request_context() and getattr(g, 'profile', None):
+        g.profile['queries'].append({'statement': statement,
+                                     'ms': round((time.perf_counter() - started) * 1000, 3)})
+
+
+def init_profiler(app):
+    """Podpięcie profilera do aplikacji (PROFILER.ENABLED = False wyłącza go całkowicie)."""
+    if PROFILER.ENABLED:
+        app.before_request(start_profile)
+        app.after_request(stop_profile)
+        app.teardown_request(teardown_profile)
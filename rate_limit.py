@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Ograniczanie liczby żądań (token bucket) dla logowania, rejestracji, odzyskiwania hasła i ajaxa.
+
+Limity ustawiane są w RATE_LIMIT.LIMITS osobno dla każdego endpointu: (pojemność kubełka,
+liczba żetonów odnawianych na minutę). Każde żądanie zużywa żeton z kubełka adresu IP oraz -
+gdy formularz zawiera adres e-mail - z kubełka konta. Sprawdzenie odbywa się w before_request,
+więc odrzucone żądanie (429) nie dotyka ani bazy danych, ani bcrypta, ani serwera poczty.
+Kubełki trzymane są w pamięci procesu (RATE_LIMIT.STORE = 'memory') lub we wspólnym pliku
+SQLite ('sqlite'), dzięki czemu limity obowiązują łącznie dla wszystkich workerów.
+Adres klienta za serwerem proxy pochodzi z X-Forwarded-For - ProxyFix w main.py, APP.PROXY_COUNT.
+"""
+# importy modułów py
+import sqlite3
+import threading
+import time
+from flask import request, Response
+
+# importy nasze
+from config import RATE_LIMIT
+
+
+class MemoryBucketStore:
+    """Kubełki w słowniku procesu: klucz -> (żetony, czas ostatniej aktualizacji)."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.last_eviction = time.monotonic()
+
+    def take(self, key, capacity, rate):
+        """Próba pobrania żetonu, zwraca (czy_przepuścić, sekundy_do_kolejnego_żetonu)."""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_eviction > RATE_LIMIT.EVICT_INTERVAL:
+                self._evict(now)
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+        return allowed, (1 - tokens) / rate if not allowed else 0
+
+    def _evict(self, now):
+        """Usunięcie kubełków nieużywanych dłużej niż RATE_LIMIT.IDLE_TIMEOUT (i tak są pełne)."""
+        self.buckets = {key: bucket for key, bucket in self.buckets.items()
+                        if now - bucket[1] < RATE_LIMIT.IDLE_TIMEOUT}
+        self.last_eviction = now
+
+
+class SqliteBucketStore:
+    """Kubełki we wspólnym pliku SQLite - limity wspólne dla wszystkich procesów."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.last_eviction = time.time()
+
+    def _connection(self):
+        """Osobne połączenie dla każdego wątku."""
+        if not hasattr(self.local, 'conn'):
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket '
+                         '(key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+            self.local.conn = conn
+        return self.local.conn
+
+    def take(self, key, capacity, rate):
+        """Próba pobrania żetonu, zwraca (czy_przepuścić, sekundy_do_kolejnego_żetonu)."""
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            if now - self.last_eviction > RATE_LIMIT.EVICT_INTERVAL:
+                conn.execute('DELETE FROM bucket WHERE updated < ?',
+                             (now - RATE_LIMIT.IDLE_TIMEOUT,))
+                self.last_eviction = now
+            row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?',
+                               (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO bucket VALUES (?, ?, ?)', (key, tokens, now))
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            # także "database is locked" przy BEGIN - awaria magazynu limitów nie może
+            # blokować użytkowników
+            conn = getattr(self.local, 'conn', None)
+            if conn is not None and conn.in_transaction:
+                conn.execute('ROLLBACK')
+            return True, 0
+        return allowed, (1 - tokens) / rate if not allowed else 0
+
+
+store = (SqliteBucketStore(RATE_LIMIT.SQLITE_PATH) if RATE_LIMIT.STORE == 'sqlite'
+         else MemoryBucketStore())
+
+
+def too_many_requests(retry_after):
+    """Tania odpowiedź 429, bez renderowania szablonów."""
+    return Response('Zbyt wiele żądań, spróbuj ponownie później.', 429,
+                    {'Retry-After': str(max(1, int(retry_after + 0.5))),
+                     'Content-Type': 'text/plain; charset=utf-8'})
+
+
+def check_rate_limit():
+    """Hook before_request - sprawdza limit dla IP oraz konta (jeżeli podano e-mail)."""
+    limit = RATE_LIMIT.LIMITS.get(request.endpoint)
+    if limit is None or request.method not in RATE_LIMIT.METHODS:
+        return None
+    capacity, per_minute = limit
+    rate = per_minute / 60
+    keys = ['{}|ip|{}'.format(request.endpoint, request.remote_addr)]
+    for field in RATE_LIMIT.ACCOUNT_FIELDS:
+        account = request.form.get(field)
+        if account:
+            keys.append('{}|account|{}'.format(request.endpoint, account.strip().lower()))
+    for key in keys:
+        allowed, retry_after = store.take(key, capacity, rate)
+        if not allowed:
+            return too_many_requests(retry_after)
+    return None
+
+
+def init_rate_limit(app):
+    """Rejestracja sprawdzania limitów przed każdym żądaniem."""
+    app.before_request(check_rate_limit)
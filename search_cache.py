@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Cache wyników wyszukiwarki grobów (/graves).
+
+Kluczem jest znormalizowane zapytanie - cmentarz oraz imię i nazwisko bez wielkości liter
+i znaków diakrytycznych (name_index.normalize). Dopasowanie wykonuje baza na kolumnach
+Grave.name_search / Grave.last_name_search (ta sama normalizacja, uzupełniana przy zapisie
+grobu, indeks ix_grave_cemetery_search).
+Wartością są tylko id pasujących grobów - wiersze do wyświetlenia pobierane są po kluczu
+głównym, a oznaczenia "znany grób" (Family) nakładane osobno dla bieżącego użytkownika,
+więc jeden wpis cache służy wszystkim użytkownikom, zalogowanym i anonimowym.
+Wpisy ważne są dla bieżącej generacji - licznika we współdzielonym pliku
+SEARCH_CACHE.GENERATION_PATH, zwiększanego przez każdy zapis grobu (views_user, data_cleanup).
+Kolumny wyszukiwania w istniejącej bazie: python3 migrate_grave_search_names.py
+"""
+# importy modułów py
+import collections
+import threading
+from sqlalchemy import bindparam
+
+# importy nasze
+from config import SEARCH_CACHE
+from data_read_models import grave_rows, GRAVE_COLUMNS
+from db_models import db, Grave
+from name_index import normalize
+from user_summary import SharedStamps
+
+# pojedynczy licznik - ten sam mechanizm co znaczniki podsumowań użytkowników
+generation = SharedStamps(SEARCH_CACHE.GENERATION_PATH, 1)
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def bump_search_generation():
+    """Unieważnienie wszystkich wyników we wszystkich procesach - po zapisie grobu."""
+    generation.bump([0])
+
+
+def contains(value):
+    """Wzorzec LIKE '%wartość%' z zabezpieczonymi znakami specjalnymi."""
+    return '%{}%'.format(value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+
+
+def matching_ids(cemetery_id, name, last_name):
+    """Id grobów, których znormalizowane imię i nazwisko zawierają szukane fragmenty."""
+    query = db.session.query(Grave.id).filter(Grave.cemetery_id == cemetery_id)
+    if last_name:
+        query = query.filter(Grave.last_name_search.like(contains(last_name), escape='\\'))
+    if name:
+        query = query.filter(Grave.name_search.like(contains(name), escape='\\'))
+    return tuple(grave_id for grave_id, in query.order_by(Grave.id))
+
+
+def search_ids(cemetery_id, name, last_name):
+    """Id pasujących grobów - z cache albo z bazy."""
+    key = (cemetery_id, normalize(name or ''), normalize(last_name or ''))
+    current = generation.get(0)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == current:
+            _cache.move_to_end(key)
+            return cached[1]
+    ids = matching_ids(cemetery_id, key[1], key[2])
+    with _cache_lock:
+        _cache[key] = (current, ids)
+        _cache.move_to_end(key)
+        while len(_cache) > SEARCH_CACHE.SIZE:
+            _cache.popitem(last=False)
+    return ids
+
+
+def graves_by_ids(ids, chunk_size=500):
+    """Wiersze grobów (GraveRow) po kluczu głównym, w kolejności id."""
+    rows = []
+    for start in range(0, len(ids), chunk_size):
+        rows.extend(grave_rows(db.session.query(*GRAVE_COLUMNS)
+                               .filter(Grave.id.in_(ids[start:start + chunk_size]))
+                               .order_by(Grave.id)))
+    return rows
+
+
+def backfill_search_names(batch_size=1000):
+    """Uzupełnienie kolumn wyszukiwania grobów zapisanych przed ich dodaniem; zwraca liczbę."""
+    filled = 0
+    while True:
+        rows = db.session.query(Grave.id, Grave.name, Grave.last_name)\
+            .filter(Grave.name_search.is_(None)).order_by(Grave.id).limit(batch_size).all()
+        if not rows:
+            break
+        db.session.execute(Grave.__table__.update().where(Grave.id == bindparam('grave_id'))
+                           .values(name_search=bindparam('folded_name'),
+                                   last_name_search=bindparam('folded_last_name')),
+                           [{'grave_id': grave_id, 'folded_name': normalize(name or ''),
+                             'folded_last_name': normalize(last_name or '')}
+                            for grave_id, name, last_name in rows])
+        db.session.commit()
+        filled += len(rows)
+    if filled:
+        bump_search_generation()
+    return filled
+
+
+if __name__ == '__main__':
+    from main import app
+    app.app_context().push()
+    print('uzupełniono grobów: {}'.format(backfill_search_names()))
@@ -0,0 +1,30 @@
+function fillHints(input){
+    var xhr = ajaxInit();
+    var list = document.getElementById(input.getAttribute('list'));
+    if (xhr == null || list == null){
+        return;
+    }
+    xhr.open('GET', '/ajax/autocomplete?field=' + input.dataset.autocomplete +
+             '&q=' + encodeURIComponent(input.value), true);
+    xhr.onreadystatechange = function(){
+        if (xhr.readyState == 4 && xhr.status == 200){
+            list.innerHTML = '';
+            JSON.parse(xhr.responseText).forEach(function(hint){
+                var option = document.createElement('option');
+                option.value = hint.value;
+                option.label = hint.value + ' (' + hint.count + ')';
+                list.appendChild(option);
+            });
+        }
+    };
+    xhr.send();
+}
+
+var autocompleteInputs = document.querySelectorAll('input[data-autocomplete]');
+for (var i = 0; i < autocompleteInputs.length; i++){
+    autocompleteInputs[i].addEventListener('input', function(event){
+        if (event.target.value.length > 0){
+            fillHints(event.target);
+        }
+    });
+}
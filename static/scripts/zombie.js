@@ -0,0 +1,43 @@
+function markParcel(parcelId, taken){
+    var cell = document.getElementById('parcel_' + parcelId);
+    if (cell != null){
+        cell.className = taken ? 'parcel_taken' : 'parcel_free';
+    }
+}
+
+function followZombie(streamUrl){
+    var source = new EventSource(streamUrl);
+    // pełny stan - po otwarciu połączenia lub po pominięciu ticku
+    source.addEventListener('snapshot', function(event){
+        var data = JSON.parse(event.data);
+        var taken = {};
+        data.positions.forEach(function(parcelId){ taken[parcelId] = true; });
+        var cells = document.querySelectorAll('.parcel_taken, .parcel_free');
+        for (var i = 0; i < cells.length; i++){
+            var parcelId = cells[i].id.replace('parcel_', '');
+            markParcel(parcelId, taken[parcelId] === true);
+        }
+    });
+    // zmiana względem poprzedniego ticku - aktualizowane są tylko zmienione komórki
+    source.onmessage = function(event){
+        var data = JSON.parse(event.data);
+        data.left.forEach(function(parcelId){ markParcel(parcelId, false); });
+        data.entered.forEach(function(parcelId){ markParcel(parcelId, true); });
+    };
+    // odrzucone połączenie (503 przy zajętym limicie strumieni) przeglądarka zamyka na stałe
+    source.onerror = function(){
+        if (source.readyState === EventSource.CLOSED){
+            setTimeout(function(){ followZombie(streamUrl); }, 5000);
+        }
+    };
+    return source;
+}
+
+var followButton = document.getElementById('follow_zombie');
+if (followButton != null){
+    followButton.addEventListener('click', function(event){
+        event.preventDefault();
+        followButton.disabled = true;
+        followZombie(followButton.getAttribute('data-stream-url'));
+    });
+}
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Potok plików statycznych - nazwy z hashem treści i wstępnie skompresowane warianty.
+
+Przy starcie aplikacji (lub ręcznie: python3 static_assets.py) pliki z katalogów ASSETS.DIRS
+kopiowane są do ASSETS.BUILD_PATH pod nazwą zawierającą hash treści, a pliki tekstowe dodatkowo
+kompresowane do wariantów .gz i .br (brotli tylko jeżeli zainstalowano pakiet Brotli).
+W szablonach zamiast url_for('static', filename=...) używamy asset_for('static', filename=...),
+a blueprint pages_assets serwuje pliki z nagłówkiem "immutable" i wariantem zgodnym
+z nagłówkiem Accept-Encoding klienta.
+"""
+# importy modułów py
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+from flask import Blueprint, request, send_from_directory, url_for, abort, current_app
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# importy nasze
+from config import ASSETS
+
+pages_assets = Blueprint('pages_assets', __name__)
+# ścieżka logiczna (np. styles/navbar.css) -> ścieżka z hashem (styles/navbar.1a2b3c4d5e6f.css)
+manifest = {}
+built_files = set()
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.txt')
+
+
+def hashed_name(logical_path, content):
+    """Nazwa pliku z wstawionym hashem treści przed rozszerzeniem."""
+    root, ext = os.path.splitext(logical_path)
+    return '{}.{}{}'.format(root, hashlib.sha256(content).hexdigest()[:12], ext)
+
+
+def write_atomic(path, data):
+    """Zapis pliku pod docelową nazwą w całości albo wcale.
+
+    Treść trafia najpierw do pliku tymczasowego w tym samym katalogu, a os.replace podmienia
+    go atomowo - równoległy worker ani przerwane budowanie nie zostawią uciętego pliku.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def variants(target, content):
+    """Warianty pliku do zbudowania: (ścieżka, funkcja zwracająca treść)."""
+    yield target, lambda: content
+    if target.endswith(COMPRESSIBLE):
+        yield target + '.gz', lambda: gzip.compress(content, compresslevel=9)
+        if brotli is not None:
+            yield target + '.br', lambda: brotli.compress(content, quality=11)
+
+
+def build_assets(static_path=ASSETS.STATIC_PATH, build_path=ASSETS.BUILD_PATH):
+    """Budowanie plików z hashem i wariantów skompresowanych, zwraca manifest.
+
+    Każdy wariant (plik, .gz, .br) sprawdzany jest osobno - brakujący, np. .br zbudowanego
+    przed instalacją pakietu Brotli, jest dobudowywany. Warianty już zbudowane (ten sam hash)
+    są pomijane, więc wywołanie przy każdym starcie kosztuje jedynie odczyt i hashowanie źródeł.
+    """
+    new_manifest = {}
+    os.makedirs(build_path, exist_ok=True)
+    for directory in ASSETS.DIRS:
+        for dir_path, _, filenames in os.walk(os.path.join(static_path, directory)):
+            for filename in filenames:
+                source = os.path.join(dir_path, filename)
+                logical_path = os.path.relpath(source, static_path).replace(os.sep, '/')
+                with open(source, 'rb') as file:
+                    content = file.read()
+                target_name = hashed_name(logical_path, content)
+                target = os.path.join(build_path, target_name)
+                new_manifest[logical_path] = target_name
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                for path, compress in variants(target, content):
+                    if not os.path.exists(path):
+                        write_atomic(path, compress())
+    write_atomic(os.path.join(build_path, 'manifest.json'),
+                 json.dumps(new_manifest, indent=1, sort_keys=True).encode('utf-8'))
+    return new_manifest
+
+
+def init_assets(app):
+    """Budowanie plików przy starcie i rejestracja helpera asset_for w szablonach."""
+    manifest.clear()
+    manifest.update(build_assets(os.path.join(app.root_path, ASSETS.STATIC_PATH),
+                                 os.path.join(app.root_path, ASSETS.BUILD_PATH)))
+    built_files.clear()
+    built_files.update(manifest.values())
+    app.add_template_global(asset_for)
+
+
+def asset_for(endpoint, **values):
+    """Odpowiednik url_for - dla plików statycznych z manifestu zwraca adres wersji z hashem."""
+    filename = values.get('filename')
+    if endpoint == 'static' and filename in manifest:
+        values['filename'] = manifest[filename]
+        return url_for('pages_assets.asset', **values)
+    return url_for(endpoint, **values)
+
+
+@pages_assets.route('/assets/<path:filename>')
+def asset(filename):
+    """Serwowanie zbudowanych plików z długim czasem cache i kompresją wg Accept-Encoding."""
+    if filename not in built_files:
+        return abort(404)
+    build_path = os.path.join(current_app.root_path, ASSETS.BUILD_PATH)
+    encoding, served_name = pick_encoding(build_path, filename)
+    response = send_from_directory(build_path, served_name,
+                                   mimetype=mimetypes.guess_type(filename)[0],
+                                   cache_timeout=ASSETS.MAX_AGE)
+    response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(ASSETS.MAX_AGE)
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def pick_encoding(build_path, filename):
+    """Wybór wstępnie skompresowanego wariantu obsługiwanego przez klienta."""
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and \
+                os.path.exists(os.path.join(build_path, filename + suffix)):
+            return encoding, filename + suffix
+    return None, filename
+
+
+if __name__ == '__main__':
+    print('zbudowano {} plików'.format(len(build_assets())))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Cache bajtkodu szablonów Jinja i rozgrzewanie workera.
+
+Skompilowane szablony zapisywane są w TEMPLATES.BYTECODE_CACHE_PATH, więc kolejne procesy
+wczytują gotowy bajtkod zamiast parsować i kompilować pliki z templates/.
+    python3 template_cache.py  - wstępna kompilacja wszystkich szablonów (np. przy wdrożeniu)
+Po starcie workera (hook post_fork w gunicorn_config.py) wszystkie szablony ładowane są do pamięci,
+a strony z TEMPLATES.WARM_UP renderowane raz przez klienta testowego - pierwsze prawdziwe żądanie
+trafia na rozgrzany proces. Import main (db_init, skrypty z crona) niczego nie rozgrzewa.
+"""
+# importy modułów py
+import os
+import time
+from jinja2 import FileSystemBytecodeCache
+
+# importy nasze
+from config import TEMPLATES
+
+
+def init_template_cache(app):
+    """Podpięcie cache bajtkodu do środowiska Jinja aplikacji."""
+    if TEMPLATES.BYTECODE_CACHE_PATH:
+        path = os.path.join(app.root_path, TEMPLATES.BYTECODE_CACHE_PATH)
+        os.makedirs(path, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(path)
+
+
+def precompile_templates(app):
+    """Kompilacja (lub wczytanie z cache bajtkodu) wszystkich szablonów, zwraca ich liczbę."""
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def warm_up(app):
+    """Jednokrotne wyrenderowanie najczęściej odwiedzanych stron w bieżącym procesie.
+
+    Wywoływane w workerze po fork - nie w procesie nadrzędnym gunicorn --preload, gdzie
+    hooki before_first_request zostałyby uruchomione raz, zamiast w każdym workerze.
+    Błędy są tylko wypisywane - worker ma wystartować także przy niedostępnej bazie.
+    """
+    precompile_templates(app)
+    client = app.test_client()
+    for url in TEMPLATES.WARM_UP:
+        start = time.perf_counter()
+        try:
+            status = client.get(url).status_code
+        except Exception as error:
+            print('rozgrzewanie {} nie powiodło się: {}'.format(url, error))
+            continue
+        print('rozgrzano {} ({}) w {:.1f} ms'.format(url, status,
+                                                     (time.perf_counter() - start) * 1000))
+
+
+if __name__ == '__main__':
+    from main import app
+    print('skompilowano {} szablonów'.format(precompile_templates(app)))
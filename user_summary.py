@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Podsumowanie panelu użytkownika (własne i obserwowane groby) z cache w procesie.
+
+Groby użytkownika i groby obserwowane (Family) pobierane są jednym zapytaniem UNION ALL.
+Wynik trzymany jest w cache LRU procesu razem ze znacznikiem użytkownika odczytanym ze
+współdzielonego pliku USER_SUMMARY.STAMPS_PATH (tablica liczników mapowana do pamięci przez
+wszystkie workery). Zatwierdzona zmiana grobów lub Family zwiększa liczniki właściciela grobu,
+obserwujących go i dodającego/usuwającego obserwację - cache każdego procesu zauważa to przy
+kolejnym odczycie. Licznik wybierany jest jako user_id % USER_SUMMARY.SLOTS, więc kolizja
+powoduje co najwyżej zbędne odświeżenie podsumowania.
+Mapa cmentarza nie jest częścią podsumowania - pochodzi ze wspólnej mapy zajętości
+(data_occupancy).
+"""
+# importy modułów py
+import collections
+import mmap
+import os
+import threading
+from sqlalchemy import event, literal, select
+from sqlalchemy.orm import Session
+import numpy as np
+
+# importy nasze
+from config import USER_SUMMARY
+from data_read_models import GraveRow, GRAVE_COLUMNS
+from db_models import db, Grave, Family
+
+UserSummary = collections.namedtuple('UserSummary', ['graves', 'favourites'])
+
+
+class SharedStamps:
+    """Liczniki zmian użytkowników w pliku mapowanym do pamięci."""
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self.stamps = None
+        self.pid = None
+
+    def _array(self):
+        """Widok numpy na plik - mapowany osobno w każdym procesie."""
+        if self.pid != os.getpid():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size < self.slots * 4:
+                    os.ftruncate(fd, self.slots * 4)
+                buffer = mmap.mmap(fd, self.slots * 4)
+            finally:
+                os.close(fd)
+            self.stamps = np.frombuffer(buffer, dtype=np.uint32, count=self.slots)
+            self.pid = os.getpid()
+        return self.stamps
+
+    def get(self, user_id):
+        return int(self._array()[user_id % self.slots])
+
+    def bump(self, user_ids):
+        stamps = self._array()
+        for user_id in user_ids:
+            stamps[user_id % self.slots] += 1
+
+
+stamps = SharedStamps(USER_SUMMARY.STAMPS_PATH, USER_SUMMARY.SLOTS)
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load_summary(user_id):
+    """Własne i obserwowane groby użytkownika - jedno zapytanie do bazy."""
+    own = db.session.query(literal('own').label('kind'), *GRAVE_COLUMNS)\
+        .filter(Grave.user_id == user_id)
+    # pierwsza kolumna to stała - złączenie musi zaczynać się jawnie od Grave
+    favourite = db.session.query(literal('favourite').label('kind'), *GRAVE_COLUMNS)\
+        .select_from(Grave).join(Family, Family.grave_id == Grave.id)\
+        .filter(Family.user_id == user_id)
+    rows = sorted(own.union_all(favourite).all(), key=lambda row: row[1])
+    return UserSummary(graves=[GraveRow._make(row[1:]) for row in rows if row[0] == 'own'],
+                       favourites=[GraveRow._make(row[1:]) for row in rows
+                                   if row[0] == 'favourite'])
+
+
+def user_summary(user_id):
+    """Podsumowanie z cache, odświeżane po zmianie znacznika użytkownika."""
+    stamp = stamps.get(user_id)
+    with _cache_lock:
+        cached = _cache.get(user_id)
+        if cached is not None and cached[0] == stamp:
+            _cache.move_to_end(user_id)
+            return cached[1]
+    summary = load_summary(user_id)
+    with _cache_lock:
+        _cache[user_id] = (stamp, summary)
+        _cache.move_to_end(user_id)
+        while len(_cache) > USER_SUMMARY.CACHE_SIZE:
+            _cache.popitem(last=False)
+    return summary
+
+
+def invalidate_users(user_ids):
+    """Unieważnienie podsumowań we wszystkich procesach."""
+    stamps.bump(set(user_ids))
+
+
+def grave_followers(connection, grave_id):
+    """Użytkownicy obserwujący grób."""
+    return [user_id for user_id, in connection.execute(
+        select([Family.user_id]).where(Family.grave_id == grave_id))]
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_users(session, flush_context):
+    """Zapamiętanie użytkowników, których podsumowanie zmieni zatwierdzenie transakcji."""
+    users = session.info.setdefault('user_summary', set())
+    connection = session.connection()
+    for obj in session.new | session.deleted:
+        if isinstance(obj, Grave):
+            users.add(obj.user_id)
+        elif isinstance(obj, Family):
+            users.add(obj.user_id)
+    for obj in session.dirty:
+        if isinstance(obj, Grave) and session.is_modified(obj):
+            users.add(obj.user_id)
+            users.update(grave_followers(connection, obj.id))
+
+
+@event.listens_for(Session, 'after_commit')
+def bump_users(session):
+    """Zwiększenie liczników dopiero po zatwierdzeniu transakcji."""
+    users = session.info.pop('user_summary', None)
+    if users:
+        invalidate_users(users)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_users(session):
+    """Wycofana transakcja - nic się nie zmieniło."""
+    session.info.pop('user_summary', None)
@@ -6,11 +6,15 @@
 import datetime
 from flask import render_template, request, redirect, url_for, flash, Blueprint
 from flask_login import current_user, login_required
-from sqlalchemy import func, and_, or_
 
 
 # importy nasze
-from db_models import db, Grave, Parcel, Family, Messages, Obituaries
+from cemeteries import current_cemetery_id
+from config import OBITUARIES
+from db_models import db, Family, Messages, Obituaries
+from obituary_archive import archive_search
+from search_cache import search_ids, graves_by_ids
+from user_summary import user_summary
 
 pages = Blueprint('pages', __name__)
 
@@ -25,40 +29,40 @@ def index():
 @pages.route('/obituaries')
 def obituaries():
     """Wyświatlanie nekrologów uporządkowane datami i tylko aktualne."""
-    today_date = datetime.datetime.now() - datetime.timedelta(hours=4)
+    today_date = datetime.datetime.now() - datetime.timedelta(hours=OBITUARIES.ACTIVE_HOURS)
     obits = Obituaries.query.order_by(Obituaries.funeral_date.asc()).filter(
+        Obituaries.cemetery_id == current_cemetery_id(),
         Obituaries.funeral_date >= today_date)
     return render_template('obituaries.html', obits=obits)
 
 
+@pages.route('/obituaries/archive')
+def obituaries_archive():
+    """Archiwum nekrologów - wyszukiwanie po nazwisku i miesiącu pogrzebu (RRRR-MM)."""
+    surname = request.args.get('surname', '').strip()
+    month = request.args.get('month', '')
+    page = request.args.get('page', 1, type=int)
+    try:
+        month_key = int(month.replace('-', '')) if month else None
+    except ValueError:
+        month_key = None
+    obits = archive_search(current_cemetery_id(), surname, month_key, max(page, 1))
+    return render_template('obituaries_archive.html', obits=obits, surname=surname, month=month)
+
+
 @pages.route('/graves', methods=['GET'])
 def graves():
+    """Lista grobów cmentarza z wyszukiwarką - id wyników z cache (search_cache)."""
     search_name = request.args.get('search_name')
     search_last_name = request.args.get('search_last_name')
-    if current_user.is_authenticated:
-        if not search_name and not search_last_name:
-            #tworzy listę grobów
-            graves_list = db.session.query(Grave.id, Grave.name, Grave.last_name, Grave.day_of_birth, Grave.day_of_death, Grave.parcel_id, Family.id.label("my_family"))\
-                .outerjoin(Family, and_((Grave.id == Family.grave_id),(Family.user_id == current_user.id)))
-        else:
-            #wyszukiwarka
-            search_like_name = '%'+search_name+'%'
-            search_like_last_name = '%' + search_last_name + '%'
-            graves_list = db.session.query(Grave.name, Grave.last_name, Grave.day_of_birth, Grave.day_of_death,Grave.parcel_id, Family.id.label("my_family"))\
-                .outerjoin(Family, and_((Grave.id == Family.grave_id),(Family.user_id == current_user.id)))\
-                .filter(and_(Grave.name.like(search_like_name), Grave.last_name.like(search_like_last_name)))
-    else:
-        if not search_name and not search_last_name:
-            #tworzy listę grobów
-            graves_list = db.session.query(Grave.id, Grave.name, Grave.last_name, Grave.day_of_birth, Grave.day_of_death, Grave.parcel_id)
-        else:
-            #wyszukiwarka
-            search_like_name = '%'+search_name+'%'
-            search_like_last_name = '%' + search_last_name + '%'
-            graves_list = db.session.query(Grave.name, Grave.last_name, Grave.day_of_birth, Grave.day_of_death,Grave.parcel_id)\
-                .filter(and_(Grave.name.like(search_like_name), Grave.last_name.like(search_like_last_name)))
-
-    return render_template('graves.html', graves_list=graves_list, current_user=current_user)
+    grave_ids = search_ids(current_cemetery_id(), search_name, search_last_name)
+    graves_list = graves_by_ids(grave_ids)
+    # znane groby bieżącego użytkownika - z podsumowania w cache (user_summary)
+    family_ids = ({grave.id for grave in user_summary(current_user.id).favourites}
+                  if current_user.is_authenticated else set())
+    return render_template('graves.html', graves_list=graves_list, family_ids=family_ids,
+                           current_user=current_user)
+
 
 @pages.route('/graves/<grave_id>/add-favourite', methods=['GET'])
 @login_required
@@ -95,7 +99,7 @@ def delete_favourite(grave_id):
 @pages.app_errorhandler(404)
 def page_not_found(e):
     """Obsługa erroru 404."""
-    return render_template('page_404.html')
+    return render_template('page_404.html'), 404
 
 
 @pages.app_errorhandler(405)
@@ -2,16 +2,27 @@
 # -*- coding: utf-8 -*-
 """Plik zawierający funkcje renderowanych stron dla administratora."""
 
-from flask import Blueprint, redirect, url_for, render_template, request, flash, abort
+from flask import Blueprint, redirect, url_for, render_template, request, flash, abort, \
+    send_from_directory, current_app
 from flask_login import current_user, login_required
 from functools import wraps
 import datetime
+import io
+import os
 
+from audit_log import audit
+from cemeteries import current_cemetery_id
 from data_db_manage import obituary_add_data
 from data_func_manage import convert_date
-from db_models import db, User, Messages, Obituaries
+from data_read_models import active_user_emails
+from data_pricing import save_zone, delete_zone
+from data_rollups import dashboard
+from payment_ledger import ingest_statement
+from db_models import db, Messages, Obituaries, PricingZone
 from mail_sending import msg_to_all_users
-from data_validate import ObituaryForm, is_time_format, is_date_format
+from data_validate import ObituaryForm, ZoneForm, is_time_format, is_date_format
+from config import PROFILER, LEDGER
+from profiler import profile_token, recent_profiles
 
 pages_admin = Blueprint('pages_admin', __name__)
 
@@ -49,10 +60,11 @@ def admin():
                                    create_date=datetime.datetime.now())
             db.session.add(new_message)
             db.session.commit()
+            audit('create', 'message', new_message.id)
             flash('Dodawanie wiadomości zakończone powodzeniem!', 'succes')
         elif email_title and email_content:
             # wysyłanie wiadomości do wszystkich aktywowanych użytkowników
-            users = User.query.filter_by(active_user=True)
+            users = active_user_emails()
             msg_to_all_users(email_title, email_content, users)
             flash('Wysyłanie wiadomości zakończone!', 'succes')
         elif all([form_obituary.validate(),
@@ -62,10 +74,12 @@ def admin():
             new_obituary = obituary_add_data(form_obituary,
                                              funeral_date,
                                              funeral_time,
+                                             current_cemetery_id(),
                                              calendar_is_html=True,
                                              clock_is_str=True)
             db.session.add(new_obituary)
             db.session.commit()
+            audit('create', 'obituary', new_obituary.id)
             flash('Dodano nowy nekrolog!', 'succes')
         else:
             flash('Nieprawidłowe dane', 'error')
@@ -73,6 +87,91 @@ def admin():
     return render_template('admin_page.html', form_obituary=form_obituary)
 
 
+@pages_admin.route('/admin/stats')
+@login_required
+@admin_required
+def admin_stats():
+    """Statystyki cmentarza - odczyt wyłącznie z tabel zestawień (data_rollups)."""
+    return render_template('admin_stats.html', minor_units=LEDGER.MINOR_UNITS,
+                           **dashboard(current_cemetery_id()))
+
+
+@pages_admin.route('/admin/payments/statement', methods=['POST'])
+@login_required
+@admin_required
+def admin_payments_statement():
+    """Import wyciągu bankowego (CSV) i uzgodnienie wpłat z płatnościami."""
+    statement = request.files.get('statement')
+    if not statement:
+        flash('Nie wybrano pliku z wyciągiem!', 'error')
+        return redirect(url_for('pages_admin.admin_stats'))
+    try:
+        result = ingest_statement(io.TextIOWrapper(statement.stream, encoding='utf-8'))
+    except (ValueError, KeyError) as error:
+        flash('Niepoprawny wyciąg: {}'.format(error), 'error')
+        return redirect(url_for('pages_admin.admin_stats'))
+    flash('Zaksięgowano {inserted} wpłat (powtórzone: {duplicates}), uzgodniono {matched}, '
+          'bez dopasowania: {unmatched}'.format(**result), 'succes')
+    return redirect(url_for('pages_admin.admin_stats'))
+
+
+@pages_admin.route('/admin/zones', methods=['GET', 'POST'])
+@pages_admin.route('/admin/zones/<int:zone_id>', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_zones(zone_id=None):
+    """Strefy cenowe bieżącego cmentarza - lista, dodawanie i edycja strefy."""
+    cemetery_id = current_cemetery_id()
+    zone = PricingZone.query.filter_by(id=zone_id, cemetery_id=cemetery_id).first_or_404() \
+        if zone_id is not None else None
+    form_zone = ZoneForm(request.form, obj=zone)
+    if request.method == 'POST':
+        if form_zone.validate():
+            zone = zone or PricingZone(cemetery_id=cemetery_id)
+            form_zone.populate_obj(zone)
+            zone.priority = zone.priority or 0
+            # zapis, przeliczenie mapy cen i unieważnienie map pozostałych workerów
+            save_zone(zone)
+            audit('edit' if zone_id is not None else 'create', 'zone', zone.id)
+            flash('Strefę zapisano pomyślnie!', 'succes')
+            return redirect(url_for('pages_admin.admin_zones'))
+        flash('Nieprawidłowe dane!', 'error')
+    zones = PricingZone.query.filter_by(cemetery_id=cemetery_id)\
+        .order_by(PricingZone.priority.desc(), PricingZone.id).all()
+    return render_template('admin_zones.html', zones=zones, zone=zone, form_zone=form_zone)
+
+
+@pages_admin.route('/admin/zones/<int:zone_id>/delete', methods=['POST'])
+@login_required
+@admin_required
+def admin_zone_delete(zone_id):
+    """Usunięcie strefy cenowej - parcele z jej obszaru wracają do wcześniejszych cen."""
+    zone = PricingZone.query.filter_by(id=zone_id,
+                                       cemetery_id=current_cemetery_id()).first_or_404()
+    delete_zone(zone)
+    audit('delete', 'zone', zone_id)
+    flash('Strefa została usunięta pomyślnie!', 'succes')
+    return redirect(url_for('pages_admin.admin_zones'))
+
+
+@pages_admin.route('/admin/profiles')
+@login_required
+@admin_required
+def admin_profiles():
+    """Lista ostatnich profili żądań oraz token do uruchomienia profilowania."""
+    return render_template('admin_profiles.html', profiles=recent_profiles(),
+                           token=profile_token(current_user.id))
+
+
+@pages_admin.route('/admin/profiles/<name>.collapsed')
+@login_required
+@admin_required
+def admin_profile_stacks(name):
+    """Pobranie pliku collapsed-stack (flamegraph.pl, speedscope)."""
+    return send_from_directory(os.path.join(current_app.root_path, PROFILER.PATH),
+                               name + '.collapsed', mimetype='text/plain', as_attachment=True)
+
+
 @pages_admin.route('/message/<message_id>/edit', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -86,6 +185,7 @@ def message_edit(message_id):
             message.title = post_title
             message.content = post_content
             db.session.commit()
+            audit('edit', 'message', message_id)
             flash('Wiadomość zmodyfikowano pomyślnie!', 'succes')
         else:
             flash('Nieprawidłowe dane', 'error')
@@ -102,6 +202,7 @@ def message_delete(message_id):
     if request.method == 'POST':
         db.session.delete(message)
         db.session.commit()
+        audit('delete', 'message', message_id)
         flash('Wiadomość została usunięta pomyślnie!', 'succes')
         return redirect(url_for('pages.index'))
     return render_template('message_delete.html', message=message)
@@ -132,6 +233,7 @@ def obituary_edit(obituary_id):
             obituary.funeral_date = convert_date(funeral_date, funeral_time)
             obituary.gender = form_obituary.gender.data
             db.session.commit()
+            audit('edit', 'obituary', obituary_id)
             flash('Wiadomość zmodyfikowano pomyślnie!', 'succes')
         else:
             flash('Nieprawidłowe dane!', 'error')
@@ -151,6 +253,7 @@ def obituary_delete(obituary_id):
     if request.method == 'POST':
         db.session.delete(obituary)
         db.session.commit()
+        audit('delete', 'obituary', obituary_id)
         flash('Nekrolog został usunięty pomyślnie!', 'succes')
         return redirect(url_for('pages.index'))
     return render_template('obituary_delete.html', obituary=obituary)
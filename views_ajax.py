@@ -2,10 +2,12 @@
 # -*- coding: utf-8 -*-
 """Plik zawierający funkcje stron do kontaktu z ajaxem."""
 # importy modułów py
-from flask import request, Blueprint
+from flask import request, Blueprint, jsonify
 
 # importy nasze
+from cemeteries import current_cemetery_id
 from db_models import User
+from name_index import names, FIELDS
 
 pages_ajax = Blueprint('pages_ajax', __name__)
 
@@ -18,3 +20,13 @@ def ajax_email():
     if email_in_db:
         return 'reserved'
     return 'none'
+
+
+@pages_ajax.route('/ajax/autocomplete', methods=['GET'])
+def ajax_autocomplete():
+    """Podpowiedzi imion (field=name) lub nazwisk (field=last_name) z indeksu w pamięci."""
+    field = request.args.get('field', 'last_name')
+    if field not in FIELDS:
+        return jsonify([])
+    matches = names.lookup(current_cemetery_id(), field, request.args.get('q', ''))
+    return jsonify([{'value': value, 'count': count} for value, count in matches])
@@ -4,6 +4,7 @@
 
 # importy modułów py
 import bcrypt
+import datetime
 from flask import render_template, request, redirect, url_for, flash, Blueprint
 from flask_login import LoginManager, login_user, logout_user, current_user, login_required
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
@@ -133,6 +134,8 @@ def register():
             # zmiana danych użytkownika
             change_user_pw(user, form_pw)
             change_user_data(user, form_data)
+            # nowy link aktywacyjny - konto nie może zostać usunięte przed jego wygaśnięciem
+            user.created_at = datetime.datetime.now()
             db.session.commit()
         else:
             flash('Podany adres e-mail jest w użyciu!', 'error')
@@ -158,8 +161,12 @@ def confirm_email(register_token):
     zmieniony z domyślnego False na True co umożliwia zalogowanie.
     """
     try:
-        email = temp_serializer.loads(register_token, salt='confirm-email', max_age=3600)
+        email = temp_serializer.loads(register_token, salt='confirm-email',
+                                       max_age=APP.CONFIRM_MAX_AGE)
         user = User.query.filter_by(email=email).first()
+        if user is None:
+            # niepotwierdzone konto usunięte po wygaśnięciu linku (data_cleanup)
+            raise SignatureExpired('konto usunięte')
         if user.active_user:
             flash('Konto już jest aktywne!', 'error')
             return redirect(url_for('pages.index'))
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Plik zawierający funkcje stron z mapą cmentarza renderowaną po stronie serwera.
+
+Mapa rysowana jest z tablic numpy współdzielonej mapy zajętości (data_occupancy) do PNG lub SVG.
+Gotowe obrazy trzymane są w cache procesu pod kluczem (cmentarz, generacja zajętości, wariant),
+więc są generowane ponownie dopiero po dodaniu lub usunięciu grobu. Cache ograniczony jest
+łącznym rozmiarem obrazów (MAP.CACHE_BYTES). Numer generacji służy też jako ETag - przeglądarka
+dostaje 304, dopóki mapa się nie zmieni.
+Strona użytkownika składa mapę z kafelków MAP.TILE_SIZE x MAP.TILE_SIZE parceli - pełny PNG
+dużego cmentarza byłby zbyt duży, by go renderować i trzymać w pamięci.
+Wybór parceli: <img ismap> wewnątrz linku do /map/<id>/tile/<x>/<y>/pick - przeglądarka dopisuje
+do adresu współrzędne kliknięcia w kafelku ("?x,y"), które zamieniamy na numer parceli.
+"""
+# importy modułów py
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+import numpy as np
+from flask import Blueprint, request, redirect, url_for, abort, Response
+from flask_login import login_required
+
+# importy nasze
+from config import MAP
+from data_occupancy import occupancy_for
+
+pages_map = Blueprint('pages_map', __name__)
+
+# kolory RGB: [wolna brzegowa, wolna wewnętrzna, zajęta], siatka
+PALETTE = np.array([[168, 214, 150], [112, 178, 96], [120, 120, 120]], dtype=np.uint8)
+GRID_COLOR = np.array([60, 60, 60], dtype=np.uint8)
+SVG_COLORS = ['#a8d696', '#70b260', '#787878']
+
+
+
+class ImageCache:
+    """Cache LRU gotowych obrazów ograniczony łącznym rozmiarem w bajtach.
+
+    Dostęp chroniony blokadą - z cache korzystają wątki workerów gthread. Obraz renderowany
+    jest poza blokadą, więc renderowanie jednej mapy nie wstrzymuje odczytu pozostałych.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, render):
+        with self.lock:
+            if key in self.images:
+                self.images.move_to_end(key)
+                return self.images[key]
+        image = render()
+        if len(image) > self.max_bytes:
+            return image
+        with self.lock:
+            if key not in self.images:
+                self.images[key] = image
+                self.size += len(image)
+            while self.size > self.max_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.size -= len(evicted)
+        return image
+
+
+_images = ImageCache(MAP.CACHE_BYTES)
+
+
+def parcel_colors(occupancy):
+    """Siatka max_p x max_p z indeksem koloru każdej parceli (wiersz = x, kolumna = y)."""
+    taken, types, xs, ys = occupancy.snapshot()
+    max_p = occupancy.max_p()
+    grid = np.zeros((max_p, max_p), dtype=np.uint8)
+    exists = xs > 0
+    grid[xs[exists] - 1, ys[exists] - 1] = np.where(taken[exists], 2, (types[exists] != 1) * 1)
+    return grid
+
+
+def png_bytes(pixels):
+    """Kodowanie tablicy (wysokość, szerokość, 3) uint8 do PNG - bez zewnętrznych bibliotek."""
+    height, width, _ = pixels.shape
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = pixels.reshape(height, width * 3)
+
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data +
+                struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) +
+            chunk(b'IEND', b''))
+
+
+def render_png(grid):
+    """Rasteryzacja siatki kolorów - każda parcela to kwadrat MAP.CELL_SIZE px z obramowaniem."""
+    cell = MAP.CELL_SIZE
+    pixels = PALETTE[np.repeat(np.repeat(grid, cell, axis=0), cell, axis=1)]
+    pixels[::cell, :] = GRID_COLOR
+    pixels[:, ::cell] = GRID_COLOR
+    return png_bytes(pixels)
+
+
+def render_svg(grid, occupancy):
+    """Mapa w SVG - każda parcela jest linkiem do rezerwacji."""
+    cell = MAP.CELL_SIZE
+    size = grid.shape[0] * cell
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+             'width="{0}" height="{0}" viewBox="0 0 {0} {0}">'.format(size)]
+    for parcel in occupancy.parcels():
+        parts.append('<a xlink:href="{}"><rect x="{}" y="{}" width="{}" height="{}" fill="{}" '
+                     'stroke="#3c3c3c"><title>{}</title></rect></a>'.format(
+                         url_for('pages_user.add_grave', p_id=parcel.id),
+                         (parcel.position_y - 1) * cell, (parcel.position_x - 1) * cell, cell, cell,
+                         SVG_COLORS[grid[parcel.position_x - 1, parcel.position_y - 1]], parcel.id))
+    parts.append('</svg>')
+    return ''.join(parts).encode('UTF_8')
+
+
+def image_response(cemetery_id, variant, mimetype, render):
+    """Odpowiedź z obrazem z cache, z ETag opartym o generację zajętości."""
+    occupancy = occupancy_for(cemetery_id)
+    try:
+        generation = occupancy.generation()
+    except (RuntimeError, OSError):
+        return abort(404)
+    etag = '{}-{}-{}'.format(cemetery_id, generation, variant)
+    if etag in request.if_none_match:
+        return Response(status=304, headers={'ETag': '"{}"'.format(etag)})
+    image = _images.get((cemetery_id, generation, variant), lambda: render(occupancy))
+    response = Response(image, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@pages_map.route('/map/<int:cemetery_id>.png')
+@login_required
+def map_png(cemetery_id):
+    """Cała mapa cmentarza jako PNG."""
+    return image_response(cemetery_id, 'png', 'image/png',
+                          lambda occupancy: render_png(parcel_colors(occupancy)))
+
+
+@pages_map.route('/map/<int:cemetery_id>.svg')
+@login_required
+def map_svg(cemetery_id):
+    """Cała mapa cmentarza jako SVG z klikalnymi parcelami."""
+    return image_response(cemetery_id, 'svg', 'image/svg+xml',
+                          lambda occupancy: render_svg(parcel_colors(occupancy), occupancy))
+
+
+@pages_map.route('/map/<int:cemetery_id>/tile/<int:tile_x>/<int:tile_y>.png')
+@login_required
+def map_tile(cemetery_id, tile_x, tile_y):
+    """Kafelek mapy - MAP.TILE_SIZE x MAP.TILE_SIZE parceli, dla bardzo dużych cmentarzy."""
+    tile = MAP.TILE_SIZE
+
+    def render(occupancy):
+        grid = parcel_colors(occupancy)[tile_x * tile:(tile_x + 1) * tile,
+                                        tile_y * tile:(tile_y + 1) * tile]
+        if not grid.size:
+            return abort(404)
+        return render_png(grid)
+
+    return image_response(cemetery_id, 'tile-{}-{}'.format(tile_x, tile_y), 'image/png', render)
+
+
+def tile_count(max_p):
+    """Liczba kafelków w wierszu (i kolumnie) mapy."""
+    return -(-max_p // MAP.TILE_SIZE)
+
+
+@pages_map.route('/map/<int:cemetery_id>/pick', defaults={'tile_x': 0, 'tile_y': 0})
+@pages_map.route('/map/<int:cemetery_id>/tile/<int:tile_x>/<int:tile_y>/pick')
+@login_required
+def map_pick(cemetery_id, tile_x, tile_y):
+    """Zamiana współrzędnych kliknięcia na mapie lub kafelku (ismap: "?x,y") na rezerwację."""
+    try:
+        pixel_x, pixel_y = [int(value) for value in request.query_string.decode().split(',')]
+    except ValueError:
+        return redirect(url_for('pages_user.user_page'))
+    occupancy = occupancy_for(cemetery_id)
+    position_x = tile_x * MAP.TILE_SIZE + pixel_y // MAP.CELL_SIZE + 1
+    position_y = tile_y * MAP.TILE_SIZE + pixel_x // MAP.CELL_SIZE + 1
+    _, _, xs, ys = occupancy.snapshot()
+    found = np.flatnonzero((xs == position_x) & (ys == position_y))
+    if not len(found):
+        return redirect(url_for('pages_user.user_page'))
+    return redirect(url_for('pages_user.add_grave', p_id=int(found[0]) + occupancy.base))
@@ -8,13 +8,21 @@ import numpy as np
 import datetime
 from flask import render_template, request, redirect, url_for, flash, Blueprint
 from flask_login import current_user, login_required, login_user
-from sqlalchemy import func, and_, or_
+from sqlalchemy.exc import IntegrityError
 
 # importy nasze
 
+from audit_log import audit
 from data_validate import DataForm, PwForm, OldPwForm, NewGraveForm, owner_required
-from db_models import db, User, Grave, Parcel, ParcelType, Family
+from db_models import db, User, Grave, Parcel, ParcelType, BookedPaymentError
 from data_db_manage import change_user_data, change_user_pw
+from data_pricing import parcel_price
+from cemeteries import current_cemetery_id
+from data_occupancy import occupancy_for
+from data_read_models import all_graves
+from search_cache import bump_search_generation
+from user_summary import user_summary
+from views_map import tile_count
 
 pages_user = Blueprint('pages_user', __name__)
 
@@ -23,18 +31,12 @@ pages_user = Blueprint('pages_user', __name__)
 @login_required
 def user_page():
     """Ogólny panel ustawień użytkownika."""
-    graves = Grave.query.filter_by(user_id=current_user.id)
-    parcels = Parcel.query.all()
-    taken_parcels = []
-    for p, g in db.session.query(Parcel, Grave).filter(Parcel.id == Grave.parcel_id):
-        taken_parcels.append(p.id)
-    max_p = db.session.query(func.max(Parcel.position_x)).scalar()
-
-    favourite_graves_list = db.session.query(Grave.id, Grave.name, Grave.last_name, Grave.day_of_birth,
-                                             Grave.day_of_death, Grave.parcel_id)\
-        .join(Family)\
-        .filter(and_((Grave.id == Family.grave_id),(Family.user_id == current_user.id))).all()
-
+    # własne i obserwowane groby - jedno zapytanie, wynik w cache do zmiany grobów lub Family
+    summary = user_summary(current_user.id)
+    # mapa wybranego cmentarza ze współdzielonej pamięci - bez zapytań do bazy
+    occupancy = occupancy_for(current_cemetery_id())
+    taken_parcels = occupancy.taken_parcels()
+    max_p = occupancy.max_p()
 
     zombie_mode = False
 
@@ -44,24 +46,24 @@ def user_page():
     if 'follow_zombie' in request.form:
         zombie_mode = True
         x_moved = []
+        # numery parceli cmentarza zaczynają się od occupancy.base
+        first_p, last_p = occupancy.base, occupancy.base + max_p * max_p - 1
         for x in taken_parcels:
             moves = np.arange(-10, 10)
             x += random.choice(moves)
-            if x < max_p * max_p and x != 0:
-                x_moved.append(abs(x))
-            elif x == 0:
-                x_moved.append(1)
-            else:
-                x_moved.append(max_p * max_p)
+            x_moved.append(min(max(x, first_p), last_p))
         taken_parcels = [x for x in x_moved]
 
     elif 'end' in request.form:
         zombie_mode = False
-        taken_parcels = [x.parcel_id for x in Grave.query.all()]
+        taken_parcels = occupancy.taken_parcels()
 
-    return render_template('user_page.html', graves=graves, parcels=parcels, max_p=max_p,
-                           favourite_graves_list=favourite_graves_list, taken_parcels=taken_parcels,
-                           zombie_mode=zombie_mode)
+    # poza trybem zombie mapa jest obrazem z pages_map - lista parceli potrzebna tylko do tabeli
+    parcels = occupancy.parcels() if zombie_mode else []
+    return render_template('user_page.html', graves=summary.graves, parcels=parcels, max_p=max_p,
+                           favourite_graves_list=summary.favourites, taken_parcels=taken_parcels,
+                           zombie_mode=zombie_mode, cemetery_id=occupancy.cemetery_id,
+                           map_tiles=tile_count(max_p))
 
 
 @pages_user.route('/user/password', methods=['POST', 'GET'])
@@ -117,19 +119,31 @@ def user_set_data():
 def add_grave(p_id):
     parcel = Parcel.query.get(p_id)
     parcel_type = ParcelType.query.get(parcel.parcel_type_id)
-    if Grave.query.filter_by(parcel_id=parcel.id).first() is None:
+    occupancy = occupancy_for(parcel.cemetery_id)
+    if not occupancy.is_taken(parcel.id):
         form = NewGraveForm(request.form)
         if request.method == 'POST' and form.validate():
-            new_grave = Grave(user_id=current_user.id,
+            new_grave = Grave(cemetery_id=parcel.cemetery_id,
+                              user_id=current_user.id,
                               parcel_id=parcel.id,
                               name=form.name.data,
                               last_name=form.surname.data,
                               day_of_birth=form.birth_date.data,
                               day_of_death=form.death_date.data)
             db.session.add(new_grave)
-            db.session.commit()
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # parcela zajęta w międzyczasie przez inny proces
+                db.session.rollback()
+                flash('Ta parcela jest już zajęta', 'error')
+                return redirect(url_for('pages_user.user_page'))
+            occupancy.mark(parcel.id, True)
+            bump_search_generation()
+            audit('create', 'grave', new_grave.id)
             return redirect(url_for('pages_user.user_page'))
-        return render_template('add_grave.html', form=form, parcel_type=parcel_type, parcel=parcel)
+        return render_template('add_grave.html', form=form, parcel_type=parcel_type, parcel=parcel,
+                               price=parcel_price(parcel.id))
     flash('Ta parcela jest już zajęta', 'error')
     return redirect(url_for('pages_user.user_page'))
 
@@ -152,8 +166,11 @@ def grave(grave_id):
         grave.day_of_birth = form.birth_date.data
         grave.day_of_death = form.death_date.data
         db.session.commit()
+        bump_search_generation()
+        audit('edit', 'grave', grave.id)
         return redirect(url_for('pages_user.grave', grave_id=grave.id))
-    return render_template('grave_page.html', grave=grave, parcel_type=parcel_type, form=form)
+    return render_template('grave_page.html', grave=grave, parcel_type=parcel_type, form=form,
+                           price=parcel_price(parcel_grave.id))
 
 
 @pages_user.route('/delete/<grave_id>', methods=['POST'])
@@ -161,18 +178,26 @@ def grave(grave_id):
 @owner_required(Grave, 'grave_id')
 def delete_grave(grave_id):
     grave = Grave.query.filter_by(id=grave_id).first()
+    parcel_id, cemetery_id = grave.parcel_id, grave.cemetery_id
     db.session.delete(grave)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except BookedPaymentError:
+        db.session.rollback()
+        flash('Nie można usunąć grobu z zaksięgowanymi wpłatami', 'error')
+        return redirect(url_for('pages_user.grave', grave_id=grave_id))
+    occupancy_for(cemetery_id).mark(parcel_id, False)
+    bump_search_generation()
+    audit('delete', 'grave', grave_id)
     return redirect(url_for('pages_user.user_page'))
 
 
 @pages_user.route('/zombie_deathday', methods=['POST', 'GET'])
 @login_required
 def zombie_deathday():
-    graves = Grave.query.all()
-    deathday_boys = []
-    for grave in graves:
-        if grave.day_of_death.strftime('%m-%d') == datetime.datetime.today().strftime('%m-%d'):
-            deathday_boys.append(grave)
+    graves = all_graves(current_cemetery_id())
+    today = datetime.datetime.today().strftime('%m-%d')
+    deathday_boys = [grave for grave in graves
+                     if grave.day_of_death and grave.day_of_death.strftime('%m-%d') == today]
 
     return render_template('zombie_deathday.html', deathday_boys=deathday_boys, graves=graves)
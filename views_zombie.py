@@ -1,18 +1,119 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""Plik zawierający funkcje renderowanych stron dostępnych dla użytkownika."""
+"""Plik zawierający strumień Server-Sent Events ze śledzeniem zombie.
+
+Zamiast przeładowywać całą stronę użytkownika po każdym kliknięciu "Śledź zombie", przeglądarka
+otwiera EventSource i co ZOMBIE.TICK sekund dostaje tylko zmiany pozycji (parcele, które zombie
+opuściły i na które weszły). Krok symulacji liczony jest raz na tick dla danego cmentarza
+i współdzielony przez wszystkich subskrybentów tego cmentarza w procesie.
+Stan jest funkcją numeru ticku: co ZOMBIE.WALK_TICKS ticków zombie wychodzą z zajętych grobów,
+a każdy krok losowany jest z ziarna (cmentarz, tick) - każdy worker liczy więc te same pozycje
+(o ile zajętość cmentarza nie zmieniła się w trakcie przejścia).
+Połączenie zajmuje worker, dlatego liczba jednoczesnych strumieni ograniczona jest wspólnym
+limitem pages_zombie w ADMISSION.LIMITS (admission).
+"""
 # importy modułów py
-import bcrypt
-from flask import render_template, request, redirect, url_for, flash, Blueprint
-from flask_login import current_user, login_required, login_user
-from sqlalchemy import func, and_, or_
+import json
+import threading
+import time
+import numpy as np
+from flask import Blueprint, Response, stream_with_context
+from flask_login import login_required
 
 # importy nasze
+from config import ZOMBIE
+from data_occupancy import occupancy_for
+
+pages_zombie = Blueprint('pages_zombie', __name__)
+
+
+class ZombieHorde:
+    """Stan symulacji zombie jednego cmentarza."""
+
+    def __init__(self, cemetery_id):
+        self.cemetery_id = cemetery_id
+        self.lock = threading.Lock()
+        self.tick = -1
+        self.positions = None
+        self.entered = self.left = ()
+
+    def step(self, positions, tick):
+        """Krok symulacji - przesunięcia losowane z ziarna (cmentarz, tick)."""
+        occupancy = occupancy_for(self.cemetery_id)
+        first_p = occupancy.base
+        last_p = first_p + occupancy.max_p() ** 2 - 1
+        random = np.random.RandomState((self.cemetery_id * 1000003 + tick) % 2 ** 32)
+        return np.clip(positions + random.randint(-10, 10, len(positions)), first_p, last_p)
+
+    def positions_at(self, tick):
+        """Pozycje w danym ticku liczone od początku przejścia - zombie wychodzą z grobów."""
+        start = tick - tick % ZOMBIE.WALK_TICKS
+        positions = np.array(occupancy_for(self.cemetery_id).taken_parcels(), dtype=np.int64)
+        for walk_tick in range(start + 1, tick + 1):
+            positions = self.step(positions, walk_tick)
+        return positions
+
+    def advance(self, tick):
+        """Obliczenie kroku dla danego numeru ticku - tylko raz, niezależnie od liczby klientów."""
+        with self.lock:
+            if tick <= self.tick:
+                return
+            if self.positions is not None and tick == self.tick + 1 and tick % ZOMBIE.WALK_TICKS:
+                previous = self.positions
+                moved = self.step(previous, tick)
+            else:
+                # start, przerwa bez subskrybentów albo nowe przejście - liczone od początku
+                previous = self.positions if self.positions is not None else np.zeros(0)
+                moved = self.positions_at(tick)
+            old, new = set(previous.tolist()), set(moved.tolist())
+            self.entered, self.left = sorted(new - old), sorted(old - new)
+            self.positions = moved
+            self.tick = tick
+
+    def event(self, tick, full):
+        """Treść zdarzenia SSE - pełny stan albo różnica względem poprzedniego ticku."""
+        with self.lock:
+            if full:
+                data = {'tick': tick, 'positions': sorted(set(self.positions.tolist()))}
+                return 'event: snapshot\ndata: {}\n\n'.format(json.dumps(data))
+            data = {'tick': tick, 'entered': self.entered, 'left': self.left}
+            return 'data: {}\n\n'.format(json.dumps(data))
+
+
+_hordes = {}
+_hordes_lock = threading.Lock()
+
+
+def horde_for(cemetery_id):
+    """Wspólna symulacja dla cmentarza."""
+    with _hordes_lock:
+        if cemetery_id not in _hordes:
+            _hordes[cemetery_id] = ZombieHorde(cemetery_id)
+        return _hordes[cemetery_id]
+
 
-from data_validate import DataForm, PwForm, OldPwForm, NewGraveForm, owner_required
-from db_models import db, User, Grave, Parcel, ParcelType, Family
-from data_db_manage import change_user_data, change_user_pw
+@pages_zombie.route('/zombie/stream/<int:cemetery_id>')
+@login_required
+def zombie_stream(cemetery_id):
+    """Strumień zmian pozycji zombie (text/event-stream).
 
-pages_user = Blueprint('pages_user', __name__)
+    Połączenie zamykane jest po ZOMBIE.STREAM_SECONDS - EventSource sam nawiązuje je ponownie
+    po ZOMBIE.RETRY_SECONDS, dzięki czemu worker nie jest zajęty przez jednego klienta
+    w nieskończoność. Nieistniejący cmentarz - 404 przed rozpoczęciem strumienia.
+    """
+    occupancy_for(cemetery_id)
+    horde = horde_for(cemetery_id)
 
+    def generate():
+        last_sent = None
+        end = time.time() + ZOMBIE.STREAM_SECONDS
+        yield 'retry: {}\n\n'.format(int(ZOMBIE.RETRY_SECONDS * 1000))
+        while time.time() < end:
+            tick = int(time.time() // ZOMBIE.TICK)
+            horde.advance(tick)
+            yield horde.event(tick, full=last_sent is None or tick != last_sent + 1)
+            last_sent = tick
+            time.sleep(max(0, (tick + 1) * ZOMBIE.TICK - time.time()))
 
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})